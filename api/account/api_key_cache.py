@@ -0,0 +1,153 @@
+"""
+Cache of authenticated API keys, so that the (deliberately slow) key hash verification and the
+lookups of the key and its account only run once per key per API_KEY_CACHE_TTL
+"""
+
+import hashlib
+from typing import Iterable, Optional, Tuple
+
+import api_logging as logging
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.utils import timezone
+
+log = logging.getLogger(__name__)
+
+# The fields that are cached for an authenticated key, as plain values, so that entries do not
+# depend on the pickled model instances (and never contain the hashed key)
+API_KEY_FIELDS = (
+    "id",
+    "prefix",
+    "name",
+    "account_id",
+    "rate_limit",
+    "submit_passports",
+    "read_scores",
+    "create_scorers",
+    "expiry_date",
+    "revoked",
+)
+ACCOUNT_FIELDS = ("id", "address", "user_id")
+USER_FIELDS = ("id", "username", "is_active", "is_staff", "is_superuser")
+
+
+def get_api_key_cache_key(key: str) -> str:
+    digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+    return f"api_key_auth:{digest}"
+
+
+def get_api_key_id_cache_key(api_key_id) -> str:
+    # Maps the id of the API key to the cache key of its authentication, for invalidation
+    return f"api_key_auth_id:{api_key_id}"
+
+
+def get_api_key_cache_ttl(api_key) -> int:
+    """
+    Returns for how many seconds the authenticated key may be cached: API_KEY_CACHE_TTL,
+    but never beyond the expiry date of the key
+    """
+    ttl = settings.API_KEY_CACHE_TTL
+    if api_key.expiry_date:
+        ttl = min(ttl, (api_key.expiry_date - timezone.now()).total_seconds())
+    return int(max(0, ttl))
+
+
+def _build_cache_entries(
+    key: str, api_key, account, user
+) -> Tuple[Optional[dict], int]:
+    ttl = get_api_key_cache_ttl(api_key)
+    if ttl <= 0:
+        return None, ttl
+
+    cache_key = get_api_key_cache_key(key)
+    return {
+        cache_key: {
+            "api_key": {field: getattr(api_key, field) for field in API_KEY_FIELDS},
+            "account": {field: getattr(account, field) for field in ACCOUNT_FIELDS},
+            "user": {field: getattr(user, field) for field in USER_FIELDS},
+        },
+        get_api_key_id_cache_key(api_key.id): cache_key,
+    }, ttl
+
+
+def _from_cached_fields(model, fields: dict):
+    # Like an instance loaded with `.only(...)`: any other field is deferred, and `save()`
+    # only writes the cached fields
+    return model.from_db(None, list(fields.keys()), list(fields.values()))
+
+
+def build_cached_api_key(cached: dict) -> Tuple:
+    """
+    Returns the `api_key`, `account` and `user` instances for a cached authentication, without
+    any query. Only the cached fields are loaded.
+    """
+    return (
+        _from_cached_fields(
+            apps.get_model("account", "AccountAPIKey"), cached["api_key"]
+        ),
+        _from_cached_fields(apps.get_model("account", "Account"), cached["account"]),
+        _from_cached_fields(get_user_model(), cached["user"]),
+    )
+
+
+def get_cached_api_key(key: str) -> Optional[dict]:
+    """
+    Returns the cached authentication for the full `key` as a dict with the `api_key`,
+    `account` and `user` fields (see `build_cached_api_key`), or None
+    """
+    try:
+        return cache.get(get_api_key_cache_key(key))
+    except Exception:
+        log.warning("Failed to read API key cache", exc_info=True)
+        return None
+
+
+async def aget_cached_api_key(key: str) -> Optional[dict]:
+    try:
+        return await cache.aget(get_api_key_cache_key(key))
+    except Exception:
+        log.warning("Failed to read API key cache", exc_info=True)
+        return None
+
+
+def set_cached_api_key(key: str, api_key, account, user) -> None:
+    """
+    Cache the authentication of the full `key`, after it has been verified
+    """
+    entries, ttl = _build_cache_entries(key, api_key, account, user)
+    if entries:
+        try:
+            cache.set_many(entries, ttl)
+        except Exception:
+            log.warning("Failed to write API key cache", exc_info=True)
+
+
+async def aset_cached_api_key(key: str, api_key, account, user) -> None:
+    entries, ttl = _build_cache_entries(key, api_key, account, user)
+    if entries:
+        try:
+            await cache.aset_many(entries, ttl)
+        except Exception:
+            log.warning("Failed to write API key cache", exc_info=True)
+
+
+def invalidate_cached_api_keys(api_key_ids: Iterable) -> None:
+    """
+    Remove the cached authentication of the API keys, this must be called whenever keys
+    are changed (for example revoked) or deleted
+    """
+    id_cache_keys = [get_api_key_id_cache_key(api_key_id) for api_key_id in api_key_ids]
+    if not id_cache_keys:
+        return
+
+    try:
+        cache_keys = cache.get_many(id_cache_keys).values()
+        cache.delete_many(id_cache_keys + list(cache_keys))
+    except Exception:
+        log.warning("Failed to invalidate API key cache", exc_info=True)
+
+
+def invalidate_cached_api_key(api_key_id) -> None:
+    invalidate_cached_api_keys([api_key_id])
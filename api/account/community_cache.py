@@ -0,0 +1,62 @@
+"""
+Cache of the communities that an account may read scores from, keyed by the account and the
+scorer id as requested (internal or external), so that the GET score endpoints do not look up
+the community for every request.
+
+Entries are only added after the ownership check succeeds, and are removed whenever the
+community is saved or deleted (see `invalidate_cached_community`).
+"""
+
+from typing import Iterable, Optional
+
+import api_logging as logging
+from django.conf import settings
+from django.core.cache import cache
+
+log = logging.getLogger(__name__)
+
+
+def get_community_id_cache_key(account_id: int, scorer_id: int | str) -> str:
+    return f"community_id:{account_id}:{scorer_id}"
+
+
+def get_cached_community_id(account_id: int, scorer_id: int | str) -> Optional[int]:
+    try:
+        return cache.get(get_community_id_cache_key(account_id, scorer_id))
+    except Exception:
+        log.warning("Failed to read community cache", exc_info=True)
+        return None
+
+
+def set_cached_community_id(account_id: int, scorer_id: int | str, community_id: int):
+    try:
+        cache.set(
+            get_community_id_cache_key(account_id, scorer_id),
+            community_id,
+            settings.COMMUNITY_ID_CACHE_TTL,
+        )
+    except Exception:
+        log.warning("Failed to write community cache", exc_info=True)
+
+
+def invalidate_cached_community(
+    community_id: int, account_ids: Iterable[int], external_scorer_ids: Iterable[str]
+):
+    """
+    Remove the cached ownership of the community for each of the accounts, for both its id
+    and its external scorer ids
+    """
+    scorer_ids = [community_id] + [
+        scorer_id for scorer_id in external_scorer_ids if scorer_id
+    ]
+    keys = {
+        get_community_id_cache_key(account_id, scorer_id)
+        for account_id in account_ids
+        if account_id is not None
+        for scorer_id in scorer_ids
+    }
+    if keys:
+        try:
+            cache.delete_many(list(keys))
+        except Exception:
+            log.warning("Failed to invalidate community cache", exc_info=True)
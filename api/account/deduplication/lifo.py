@@ -1,12 +1,12 @@
-import copy
-from typing import Tuple
+from datetime import datetime
+from typing import Dict, Tuple
 
 import api_logging as logging
 from account.models import Community
 from django.conf import settings
 from django.db import IntegrityError
 from registry.models import Event, HashScorerLink, Stamp
-from registry.utils import get_utc_time
+from registry.utils import get_stamp_expiration_date, get_utc_time
 
 log = logging.getLogger(__name__)
 
@@ -34,78 +34,102 @@ async def alifo(
                 raise
 
 
+def resolve_lifo_hash_links(
+    community: Community,
+    stamps: list,
+    hash_links_by_hash: Dict[str, HashScorerLink],
+    address: str,
+    now: datetime,
+) -> Tuple[list, list[HashScorerLink], list[HashScorerLink], list]:
+    """
+    Resolve the stamps against the existing hash links (indexed by hash) in one pass.
+
+    Returns the tuple (deduped_stamps, hash_links_to_create, hash_links_to_update, clashing_stamps)
+    """
+    deduped_stamps = []
+    hash_links_to_create = []
+    hash_links_to_update = []
+    clashing_stamps = []
+
+    for stamp in stamps:
+        hash = stamp["credential"]["credentialSubject"]["hash"]
+        expires_at = get_stamp_expiration_date(stamp)
+        hash_link = hash_links_by_hash.get(hash)
+
+        if hash_link is None:
+            deduped_stamps.append(stamp)
+            hash_links_to_create.append(
+                HashScorerLink(
+                    hash=hash,
+                    address=address,
+                    community=community,
+                    expires_at=expires_at,
+                )
+            )
+        elif hash_link.address == address:
+            # Already claimed by this user,
+            deduped_stamps.append(stamp)
+            if hash_link.expires_at != expires_at:
+                hash_link.expires_at = expires_at
+                hash_links_to_update.append(hash_link)
+        elif hash_link.expires_at > now:
+            # Already claimed by another user,
+            clashing_stamps.append(stamp)
+        else:
+            # Already claimed by another user, but
+            # it's expired so we'll give it to this user
+            deduped_stamps.append(stamp)
+            hash_link.address = address
+            hash_link.expires_at = expires_at
+            hash_links_to_update.append(hash_link)
+
+    return deduped_stamps, hash_links_to_create, hash_links_to_update, clashing_stamps
+
+
+def get_lifo_deduplication_event(
+    community: Community, address: str, stamp: dict
+) -> Event:
+    return Event(
+        action=Event.Action.LIFO_DEDUPLICATION,
+        address=address,
+        data={
+            "hash": stamp["credential"]["credentialSubject"]["hash"],
+            "provider": stamp["credential"]["credentialSubject"]["provider"],
+            "community_id": community.pk,
+        },
+        community=community,
+    )
+
+
+def get_stamp_hashes(stamps: list) -> list[str]:
+    return [stamp["credential"]["credentialSubject"]["hash"] for stamp in stamps]
+
+
 async def arun_lifo_dedup(
     community: Community, lifo_passport: dict, address: str
 ) -> Tuple[dict, list | None]:
-    deduped_passport = copy.deepcopy(lifo_passport)
-    deduped_passport["stamps"] = []
+    # The stamps are not copied, the deduped passport references the stamps of `lifo_passport`
+    deduped_passport = {**lifo_passport, "stamps": []}
 
     now = get_utc_time()
     if "stamps" in lifo_passport:
-        stamp_hashes = [
-            stamp["credential"]["credentialSubject"]["hash"]
-            for stamp in lifo_passport["stamps"]
-        ]
+        hash_links_by_hash = {
+            hash_link.hash: hash_link
+            async for hash_link in HashScorerLink.objects.filter(
+                hash__in=get_stamp_hashes(lifo_passport["stamps"]),
+                community=community,
+            )
+        }
 
-        existing_hash_links = HashScorerLink.objects.filter(
-            hash__in=stamp_hashes, community=community
+        (
+            deduped_passport["stamps"],
+            hash_links_to_create,
+            hash_links_to_update,
+            clashing_stamps,
+        ) = resolve_lifo_hash_links(
+            community, lifo_passport["stamps"], hash_links_by_hash, address, now
         )
 
-        this_users_hash_links, clashing_hashes, forfeited_hash_links = [], [], []
-        async for hash_link in existing_hash_links:
-            if hash_link.address == address:
-                # Already claimed by this user,
-                this_users_hash_links.append(hash_link)
-            elif hash_link.expires_at > now:
-                # Already claimed by another user,
-                clashing_hashes.append(hash_link.hash)
-            else:
-                # Already claimed by another user, but
-                # it's expired so we'll give it to this user
-                forfeited_hash_links.append(hash_link)
-
-        hash_links_to_create = []
-        hash_links_to_update = []
-        clashing_stamps = []
-
-        for stamp in lifo_passport["stamps"]:
-            hash = stamp["credential"]["credentialSubject"]["hash"]
-            expires_at = stamp["credential"]["expirationDate"]
-
-            if hash not in clashing_hashes:
-                deduped_passport["stamps"].append(copy.deepcopy(stamp))
-
-                done = False
-
-                for hash_link in this_users_hash_links:
-                    if hash_link.hash == hash:
-                        done = True
-                        if hash_link.expires_at != expires_at:
-                            hash_link.expires_at = expires_at
-                            hash_links_to_update.append(hash_link)
-                        break
-
-                if not done:
-                    for hash_link in forfeited_hash_links:
-                        if hash_link.hash == hash:
-                            done = True
-                            hash_link.address = address
-                            hash_link.expires_at = expires_at
-                            hash_links_to_update.append(hash_link)
-                            break
-
-                if not done:
-                    hash_links_to_create.append(
-                        HashScorerLink(
-                            hash=hash,
-                            address=address,
-                            community=community,
-                            expires_at=stamp["credential"]["expirationDate"],
-                        )
-                    )
-            else:
-                clashing_stamps.append(stamp)
-
         await save_hash_links(
             hash_links_to_create, hash_links_to_update, address, community
         )
@@ -113,18 +137,7 @@ async def arun_lifo_dedup(
         if clashing_stamps:
             await Event.objects.abulk_create(
                 [
-                    Event(
-                        action=Event.Action.LIFO_DEDUPLICATION,
-                        address=address,
-                        data={
-                            "hash": stamp["credential"]["credentialSubject"]["hash"],
-                            "provider": stamp["credential"]["credentialSubject"][
-                                "provider"
-                            ],
-                            "community_id": community.pk,
-                        },
-                        community=community,
-                    )
+                    get_lifo_deduplication_event(community, address, stamp)
                     for stamp in clashing_stamps
                 ]
             )
@@ -132,6 +145,108 @@ async def arun_lifo_dedup(
     return (deduped_passport, None)
 
 
+async def alifo_batch(
+    community: Community, lifo_passports: Dict[str, dict]
+) -> Dict[str, dict]:
+    """
+    Run the LIFO deduplication for many addresses of one community at once, for example
+    for bulk imports and rescoring.
+
+    `lifo_passports` maps each address to its passport. The addresses are processed in the
+    order of the dict (submission order): when two addresses in the batch hold the same stamp,
+    the first address keeps it. The hash links for all addresses are loaded with one query,
+    and the new and updated hash links and the deduplication events are written in bulk.
+    Hashes that were claimed by a concurrent request while the batch was processed are
+    reported as clashes instead of retrying.
+
+    Returns the deduped passports, by address, in the same order as `lifo_passports`.
+    """
+    now = get_utc_time()
+    all_hashes = {
+        hash
+        for lifo_passport in lifo_passports.values()
+        for hash in get_stamp_hashes(lifo_passport.get("stamps", []))
+    }
+    hash_links_by_hash = {
+        hash_link.hash: hash_link
+        async for hash_link in HashScorerLink.objects.filter(
+            hash__in=all_hashes, community=community
+        )
+    }
+
+    deduped_passports = {}
+    clashing_stamps_by_address = {}
+    hash_links_to_create = []
+    hash_links_to_update = {}
+    for address, lifo_passport in lifo_passports.items():
+        (
+            deduped_stamps,
+            address_hash_links_to_create,
+            address_hash_links_to_update,
+            clashing_stamps,
+        ) = resolve_lifo_hash_links(
+            community,
+            lifo_passport.get("stamps", []),
+            hash_links_by_hash,
+            address,
+            now,
+        )
+        deduped_passports[address] = {**lifo_passport, "stamps": deduped_stamps}
+        clashing_stamps_by_address[address] = clashing_stamps
+
+        # Register the new claims, so that later addresses in the batch will clash with them
+        for hash_link in address_hash_links_to_create:
+            if hash_link.hash not in hash_links_by_hash:
+                hash_links_by_hash[hash_link.hash] = hash_link
+                hash_links_to_create.append(hash_link)
+        for hash_link in address_hash_links_to_update:
+            hash_links_to_update[hash_link.pk] = hash_link
+
+    if hash_links_to_create:
+        await HashScorerLink.objects.abulk_create(
+            hash_links_to_create, ignore_conflicts=True
+        )
+    if hash_links_to_update:
+        await HashScorerLink.objects.abulk_update(
+            hash_links_to_update.values(), fields=["expires_at", "address"]
+        )
+
+    # Check that no concurrent request has claimed any of the hashes in the meantime,
+    # the stamps for hashes lost this way are deduplicated
+    claimed_hashes = {
+        hash_link.hash: hash_link.address
+        for hash_link in hash_links_to_create + list(hash_links_to_update.values())
+    }
+    if claimed_hashes:
+        async for hash, owner in HashScorerLink.objects.filter(
+            hash__in=claimed_hashes.keys(), community=community
+        ).values_list("hash", "address"):
+            address = claimed_hashes[hash]
+            if owner != address:
+                deduped_passport = deduped_passports[address]
+                lost_stamps = [
+                    stamp
+                    for stamp in deduped_passport["stamps"]
+                    if stamp["credential"]["credentialSubject"]["hash"] == hash
+                ]
+                deduped_passport["stamps"] = [
+                    stamp
+                    for stamp in deduped_passport["stamps"]
+                    if stamp["credential"]["credentialSubject"]["hash"] != hash
+                ]
+                clashing_stamps_by_address[address].extend(lost_stamps)
+
+    events = [
+        get_lifo_deduplication_event(community, address, stamp)
+        for address, clashing_stamps in clashing_stamps_by_address.items()
+        for stamp in clashing_stamps
+    ]
+    if events:
+        await Event.objects.abulk_create(events)
+
+    return deduped_passports
+
+
 async def save_hash_links(
     hash_links_to_create: list[HashScorerLink],
     hash_links_to_update: list[HashScorerLink],
@@ -11,9 +11,18 @@ import api_logging as logging
 from django.conf import settings
 from django.core.validators import RegexValidator
 from django.db import models
-from rest_framework_api_key.models import AbstractAPIKey
-from scorer_weighted.models import BinaryWeightedScorer, Scorer, WeightedScorer
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework_api_key.models import AbstractAPIKey, APIKeyManager
+from scorer_weighted.models import Scorer, WeightedScorer, aget_cached_scorer
 from django.core.exceptions import ValidationError
+from .api_key_cache import (
+    ACCOUNT_FIELDS,
+    USER_FIELDS,
+    invalidate_cached_api_key,
+    invalidate_cached_api_keys,
+)
+from .community_cache import invalidate_cached_community
 from .deduplication import Rules
 
 log = logging.getLogger(__name__)
@@ -231,7 +240,18 @@ class Account(models.Model):
         return f"Account #{self.id} - {self.address} - {self.user_id}"
 
 
+class AccountAPIKeyQuerySet(models.QuerySet):
+    def update(self, **kwargs):
+        # Queryset updates (for example revoking keys in bulk) do not send `post_save`
+        api_key_ids = list(self.values_list("pk", flat=True))
+        ret = super().update(**kwargs)
+        invalidate_cached_api_keys(api_key_ids)
+        return ret
+
+
 class AccountAPIKey(AbstractAPIKey):
+    objects = APIKeyManager.from_queryset(AccountAPIKeyQuerySet)()
+
     account = models.ForeignKey(
         Account, on_delete=models.CASCADE, related_name="api_keys", default=None
     )
@@ -254,6 +274,42 @@ class AccountAPIKey(AbstractAPIKey):
         return str(RateLimits(self.rate_limit))
 
 
+@receiver(post_save, sender=AccountAPIKey)
+@receiver(post_delete, sender=AccountAPIKey)
+def api_key_changed(sender, instance, **kwargs):
+    # Also sent for queryset deletes, like the bulk delete in the admin
+    invalidate_cached_api_key(instance.pk)
+
+
+def invalidate_cached_account_api_keys(account_ids) -> None:
+    invalidate_cached_api_keys(
+        AccountAPIKey.objects.filter(account_id__in=account_ids).values_list(
+            "pk", flat=True
+        )
+    )
+
+
+def _updates_cached_fields(update_fields, cached_fields) -> bool:
+    return update_fields is None or bool(set(update_fields) & set(cached_fields))
+
+
+@receiver(post_save, sender=Account)
+def account_changed(sender, instance, update_fields=None, **kwargs):
+    # The account is cached with the authentication of its API keys
+    if _updates_cached_fields(update_fields, ACCOUNT_FIELDS):
+        invalidate_cached_account_api_keys([instance.pk])
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def api_key_user_changed(sender, instance, update_fields=None, **kwargs):
+    # The user (for example `is_active`) is cached with the authentication of the API keys
+    # of its account. Saves of other fields, like `last_login` on login, are ignored
+    if _updates_cached_fields(update_fields, USER_FIELDS):
+        invalidate_cached_account_api_keys(
+            Account.objects.filter(user_id=instance.pk).values_list("pk", flat=True)
+        )
+
+
 class AccountAPIKeyAnalytics(models.Model):
     api_key = models.ForeignKey(
         AccountAPIKey, on_delete=models.CASCADE, related_name="analytics"
@@ -359,6 +415,17 @@ class Community(models.Model):
         max_length=42, unique=True, null=True, blank=True
     )
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remembered to invalidate the cached ownership when the community is moved to another
+        # account or gets another external scorer id
+        instance._loaded_owner = (
+            instance.__dict__.get("account_id"),
+            instance.__dict__.get("external_scorer_id"),
+        )
+        return instance
+
     def __repr__(self):
         return f"<Community {self.name}>"
 
@@ -372,11 +439,24 @@ class Community(models.Model):
             return self.scorer.binaryweightedscorer
 
     async def aget_scorer(self) -> Scorer:
-        scorer = await Scorer.objects.aget(pk=self.scorer_id)
-        if scorer.type == Scorer.Type.WEIGHTED:
-            return await WeightedScorer.objects.aget(scorer_ptr_id=scorer.id)
-        elif scorer.type == Scorer.Type.WEIGHTED_BINARY:
-            return await BinaryWeightedScorer.objects.aget(scorer_ptr_id=scorer.id)
+        """
+        Returns the concrete scorer from the process-local scorer cache. The returned instance
+        is shared and must not be modified.
+        """
+        return await aget_cached_scorer(self.scorer_id)
+
+
+@receiver(post_save, sender=Community)
+@receiver(post_delete, sender=Community)
+def community_changed(sender, instance, **kwargs):
+    loaded_account_id, loaded_external_scorer_id = getattr(
+        instance, "_loaded_owner", (None, None)
+    )
+    invalidate_cached_community(
+        instance.pk,
+        [instance.account_id, loaded_account_id],
+        [instance.external_scorer_id, loaded_external_scorer_id],
+    )
 
 
 class Customization(models.Model):
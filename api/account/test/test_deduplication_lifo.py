@@ -1,14 +1,22 @@
+from datetime import timedelta
 from unittest import mock
 
 from account.deduplication import Rules
-from account.deduplication.lifo import HashScorerLinkIntegrityError, alifo
+from account.deduplication.lifo import (
+    HashScorerLinkIntegrityError,
+    alifo,
+    alifo_batch,
+    get_stamp_hashes,
+    resolve_lifo_hash_links,
+)
 from account.models import Account, Community
 from asgiref.sync import async_to_sync
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.test import TransactionTestCase
 from ninja_jwt.schema import RefreshToken
-from registry.models import HashScorerLink, Passport, Stamp
+from registry.models import Event, HashScorerLink, Passport, Stamp
+from registry.utils import get_utc_time
 from scorer_weighted.models import Scorer, WeightedScorer
 
 User = get_user_model()
@@ -165,6 +173,90 @@ class LifoDeduplicationTestCase(TransactionTestCase):
         # no stamps
         self.assertEqual(len(deduped_passport["stamps"]), 0)
 
+    @async_to_sync
+    async def test_lifo_batch(self):
+        """
+        Test that the batch deduplication resolves the clashes in submission order, and
+        takes over expired hash links from other users
+        """
+        now = get_utc_time()
+
+        def get_stamp(hash):
+            return {
+                "provider": "test_provider",
+                "credential": {
+                    "credentialSubject": {"hash": hash, "provider": "test_provider"},
+                    "expirationDate": "2099-02-21T15:30:51.720Z",
+                },
+            }
+
+        await HashScorerLink.objects.acreate(
+            hash="claimed_hash",
+            address="0xother",
+            community=self.community1,
+            expires_at=now + timedelta(days=1),
+        )
+        await HashScorerLink.objects.acreate(
+            hash="expired_hash",
+            address="0xother",
+            community=self.community1,
+            expires_at=now - timedelta(days=1),
+        )
+
+        deduped_passports = await alifo_batch(
+            self.community1,
+            {
+                "0xaddress_1": {
+                    "stamps": [get_stamp("shared_hash"), get_stamp("expired_hash")]
+                },
+                "0xaddress_2": {
+                    "stamps": [get_stamp("shared_hash"), get_stamp("claimed_hash")]
+                },
+                "0xaddress_3": {"stamps": [get_stamp("own_hash")]},
+            },
+        )
+
+        self.assertEqual(
+            list(deduped_passports.keys()),
+            ["0xaddress_1", "0xaddress_2", "0xaddress_3"],
+        )
+        self.assertEqual(
+            get_stamp_hashes(deduped_passports["0xaddress_1"]["stamps"]),
+            ["shared_hash", "expired_hash"],
+        )
+        self.assertEqual(deduped_passports["0xaddress_2"]["stamps"], [])
+        self.assertEqual(
+            get_stamp_hashes(deduped_passports["0xaddress_3"]["stamps"]),
+            ["own_hash"],
+        )
+
+        hash_links = {
+            hash_link.hash: hash_link.address
+            async for hash_link in HashScorerLink.objects.filter(
+                community=self.community1
+            )
+        }
+        self.assertEqual(
+            hash_links,
+            {
+                "claimed_hash": "0xother",
+                "expired_hash": "0xaddress_1",
+                "shared_hash": "0xaddress_1",
+                "own_hash": "0xaddress_3",
+            },
+        )
+
+        events = [
+            (event.address, event.data["hash"])
+            async for event in Event.objects.filter(
+                action=Event.Action.LIFO_DEDUPLICATION
+            ).order_by("id")
+        ]
+        self.assertEqual(
+            events,
+            [("0xaddress_2", "shared_hash"), ("0xaddress_2", "claimed_hash")],
+        )
+
     def test_retry_on_clash(self):
         """
         This tests functionality that causes the deduplication method to retry
@@ -196,3 +288,95 @@ class LifoDeduplicationTestCase(TransactionTestCase):
                     passport.address,
                 )
         self.assertEqual(call_count, 5)
+
+    @async_to_sync
+    async def test_lifo_does_not_copy_stamps(self):
+        """
+        The deduped passport shall reference the stamps of the submitted passport
+        instead of deep copies of the (large) credentials
+        """
+        lifo_passport = {"stamps": [credential]}
+        deduped_passport, _ = await alifo(self.community1, lifo_passport, "0xaddress_1")
+
+        self.assertIsNot(deduped_passport, lifo_passport)
+        self.assertIs(deduped_passport["stamps"][0], credential)
+
+
+class CountingDict(dict):
+    """
+    Dict that counts the lookups by key, and the scans over its contents
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.num_lookups = 0
+        self.num_scans = 0
+
+    def get(self, *args, **kwargs):
+        self.num_lookups += 1
+        return super().get(*args, **kwargs)
+
+    def __getitem__(self, key):
+        self.num_lookups += 1
+        return super().__getitem__(key)
+
+    def __iter__(self):
+        self.num_scans += 1
+        return super().__iter__()
+
+    def keys(self):
+        self.num_scans += 1
+        return super().keys()
+
+    def values(self):
+        self.num_scans += 1
+        return super().values()
+
+    def items(self):
+        self.num_scans += 1
+        return super().items()
+
+
+def test_resolve_lifo_hash_links_looks_up_hash_links_by_hash():
+    """
+    The hash links are looked up by hash, once per stamp, and never scanned, so that the
+    time spent per stamp does not grow with the number of stamps in the passport
+    """
+    now = get_utc_time()
+    num_stamps = 300
+    # All stamps have an existing hash link, so no new hash link (for a community) is created
+    community = None
+
+    stamps = [
+        {
+            "credential": {
+                "credentialSubject": {"hash": f"hash_{i}", "provider": "p"},
+                "expirationDate": "2099-02-21T15:30:51.720Z",
+            }
+        }
+        for i in range(num_stamps)
+    ]
+    # A third of the hashes is owned by this user, a third is owned by another user and
+    # a third is owned by another user but expired
+    hash_links = CountingDict(
+        {
+            f"hash_{i}": HashScorerLink(
+                hash=f"hash_{i}",
+                address="0xaddress_1" if i % 3 == 0 else "0xaddress_2",
+                community_id=1,
+                expires_at=now - timedelta(days=1 if i % 3 == 2 else -1),
+            )
+            for i in range(num_stamps)
+        }
+    )
+
+    deduped_stamps, hash_links_to_create, _, clashing_stamps = resolve_lifo_hash_links(
+        community, stamps, hash_links, "0xaddress_1", now
+    )
+
+    assert hash_links.num_lookups == num_stamps
+    assert hash_links.num_scans == 0
+
+    assert len(deduped_stamps) == 2 * num_stamps / 3
+    assert clashing_stamps == stamps[1::3]
+    assert hash_links_to_create == []
@@ -13,6 +13,8 @@ from botocore.exceptions import ClientError
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "scorer.settings")
 os.environ.setdefault("CERAMIC_CACHE_SCORER_ID", "1")
+# A lambda is frozen between invocations, the analytics are flushed at the end of each invocation instead
+os.environ.setdefault("API_ANALYTICS_BACKGROUND_FLUSH", "False")
 
 ###########################################################
 # Loading secrets from secrets manager
@@ -70,6 +72,7 @@ from django.http import HttpRequest  # noqa: E402
 from django_ratelimit.exceptions import Ratelimited  # noqa: E402
 from ninja_jwt.exceptions import InvalidToken  # noqa: E402
 from registry.api.utils import ApiKey, check_rate_limit, save_api_key_analytics  # noqa: E402
+from registry.api_analytics import api_analytics_queue  # noqa: E402
 from registry.exceptions import (  # noqa: E402
     InvalidAddressException,
     NotFoundApiException,
@@ -251,6 +254,8 @@ def with_api_request_exception_handling(func):
                 )
         except Exception as e:
             logger.exception(f"Failed to store analytics: {e}")
+        finally:
+            api_analytics_queue.flush()
 
         return response
 
@@ -1,7 +1,7 @@
 """Ceramic Cache API"""
 
 from datetime import datetime, timedelta
-from typing import Any, Dict, List, Type, Optional
+from typing import Any, Dict, Iterable, List, Type, Optional
 
 import api_logging as logging
 import tos.api
@@ -22,6 +22,10 @@ from ninja_jwt.authentication import InvalidToken
 # from ninja_jwt.schema import RefreshToken
 from ninja_jwt.settings import api_settings
 from ninja_jwt.tokens import RefreshToken, Token, TokenError
+from reader.passport_reader import (
+    get_passport_data_from_cached_stamps,
+    invalidate_passport_snapshot,
+)
 from registry.api.v1 import (
     DetailedScoreResponse,
     ErrorMessageResponse,
@@ -30,6 +34,7 @@ from registry.api.v1 import (
     handle_get_score,
 )
 from registry.models import Score
+from registry.score_cache import get_cached_score
 from stake.api import handle_get_gtc_stake
 from stake.schema import StakeSchema, GetSchemaResponse
 
@@ -39,6 +44,7 @@ from ..exceptions import (
     TooManyStampsException,
 )
 from ..models import CeramicCache
+from ..tasks import schedule_rescore
 from ..utils import validate_dag_jws_payload, verify_jws
 from .schema import (
     AccessTokenResponse,
@@ -119,6 +125,70 @@ class JWTDidAuth(JWTDidAuthentication, HttpBearer):
         return self.jwt_authenticate(request, token)
 
 
+def get_current_stamps(address: str) -> List[CeramicCache]:
+    return list(CeramicCache.objects.filter(address=address, deleted_at__isnull=True))
+
+
+def soft_delete_stamps(
+    address: str,
+    providers: Iterable[str],
+    now: datetime,
+    stamp_type: Optional[int] = None,
+) -> None:
+    """
+    Soft delete the current stamps of the providers. This filters the rows in the update itself
+    (and not by the ids of rows read earlier), so that it also covers rows inserted concurrently.
+    """
+    stamps = CeramicCache.objects.filter(
+        address=address, provider__in=providers, deleted_at__isnull=True
+    )
+    if stamp_type is not None:
+        stamps = stamps.filter(type=stamp_type)
+    stamps.update(updated_at=now, deleted_at=now)
+
+
+def get_updated_passport_state(
+    current_stamps: List[CeramicCache],
+    deleted_stamps: List[CeramicCache],
+    new_stamps: List[CeramicCache],
+) -> List[CeramicCache]:
+    """
+    Returns the stamps of the address after an update: the current stamps that have not been
+    deleted, followed by the new stamps
+    """
+    deleted_ids = {stamp.pk for stamp in deleted_stamps}
+    return [
+        stamp for stamp in current_stamps if stamp.pk not in deleted_ids
+    ] + new_stamps
+
+
+def get_stamps_with_score_response(
+    address: str,
+    passport_state: List[CeramicCache],
+    stamp_type: Optional[int] = None,
+) -> GetStampsWithScoreResponse:
+    """
+    Build the response of a stamp update. The passport is scored from the same stamps
+    (of all types), without reading them again
+    """
+    return GetStampsWithScoreResponse(
+        success=True,
+        stamps=[
+            CachedStampResponse(
+                address=stamp.address,
+                provider=stamp.provider,
+                stamp=stamp.stamp,
+                id=stamp.pk,
+            )
+            for stamp in passport_state
+            if stamp_type is None or stamp.type == stamp_type
+        ],
+        score=get_score_response_after_stamp_update(
+            address, get_passport_data_from_cached_stamps(passport_state)
+        ),
+    )
+
+
 @router.post(
     "stamps/bulk", response={201: GetStampsWithScoreResponse}, auth=JWTDidAuth()
 )
@@ -140,14 +210,16 @@ def handle_add_stamps(
 
     now = get_utc_time()
 
-    existing_stamps = CeramicCache.objects.filter(
-        address=address,
-        provider__in=[p.provider for p in payload],
-        type=CeramicCache.StampType.V1,
-        deleted_at__isnull=True,
-    )
+    # The stamps of the address are read once, for the response and for scoring
+    current_stamps = get_current_stamps(address)
+    providers = {p.provider for p in payload}
+    existing_stamps = [
+        stamp
+        for stamp in current_stamps
+        if stamp.provider in providers and stamp.type == CeramicCache.StampType.V1
+    ]
 
-    existing_stamps.update(updated_at=now, deleted_at=now)
+    soft_delete_stamps(address, providers, now, stamp_type=CeramicCache.StampType.V1)
 
     new_stamp_objects = [
         CeramicCache(
@@ -161,24 +233,14 @@ def handle_add_stamps(
         for p in payload
     ]
 
+    # The ids of the new stamps are returned by the insert
     CeramicCache.objects.bulk_create(new_stamp_objects)
+    invalidate_passport_snapshot(address)
 
-    updated_passport_state = CeramicCache.objects.filter(
-        address=address, type=CeramicCache.StampType.V1, deleted_at__isnull=True
-    )
-
-    return GetStampsWithScoreResponse(
-        success=True,
-        stamps=[
-            CachedStampResponse(
-                address=stamp.address,
-                provider=stamp.provider,
-                stamp=stamp.stamp,
-                id=stamp.pk,
-            )
-            for stamp in updated_passport_state
-        ],
-        score=get_detailed_score_response_for_address(address),
+    return get_stamps_with_score_response(
+        address,
+        get_updated_passport_state(current_stamps, existing_stamps, new_stamp_objects),
+        stamp_type=CeramicCache.StampType.V1,
     )
 
 
@@ -207,16 +269,15 @@ def handle_patch_stamps(
 
     now = get_utc_time()
 
-    # Soft delete all, the ones with a stamp defined will be re-created
-    providers_to_delete = [p.provider for p in payload]
+    # The stamps of the address are read once, for the response and for scoring
+    current_stamps = get_current_stamps(address)
 
-    if providers_to_delete:
-        stamps = CeramicCache.objects.filter(
-            address=address,
-            provider__in=providers_to_delete,
-            deleted_at__isnull=True,
-        )
-        stamps.update(updated_at=now, deleted_at=now)
+    # Soft delete all, the ones with a stamp defined will be re-created
+    providers_to_delete = {p.provider for p in payload}
+    stamps = [
+        stamp for stamp in current_stamps if stamp.provider in providers_to_delete
+    ]
+    soft_delete_stamps(address, providers_to_delete, now)
 
     new_stamp_objects = [
         CeramicCache(
@@ -233,23 +294,12 @@ def handle_patch_stamps(
 
     if new_stamp_objects:
         CeramicCache.objects.bulk_create(new_stamp_objects)
+    invalidate_passport_snapshot(address)
 
-    updated_passport_state = CeramicCache.objects.filter(
-        address=address, type=CeramicCache.StampType.V1, deleted_at__isnull=True
-    )
-
-    return GetStampsWithScoreResponse(
-        success=True,
-        stamps=[
-            CachedStampResponse(
-                address=stamp.address,
-                provider=stamp.provider,
-                stamp=stamp.stamp,
-                id=stamp.pk,
-            )
-            for stamp in updated_passport_state
-        ],
-        score=get_detailed_score_response_for_address(address),
+    return get_stamps_with_score_response(
+        address,
+        get_updated_passport_state(current_stamps, stamps, new_stamp_objects),
+        stamp_type=CeramicCache.StampType.V1,
     )
 
 
@@ -305,6 +355,8 @@ def handle_update_compose_db_status(
             "compose_db_stream_id",
         ],
     )
+    # `updated_at` decides which stamp of a provider is the latest
+    invalidate_passport_snapshot(address)
 
     return {
         "updated": [stamp_object.pk for stamp_object in stamp_objects],
@@ -326,34 +378,20 @@ def handle_delete_stamps(
     if len(payload) > settings.MAX_BULK_CACHE_SIZE:
         raise TooManyStampsException()
 
-    stamps = CeramicCache.objects.filter(
-        # We do not filter by type. The thinking is: if a user wants to delete a V2 stamp, then he wants to delete both the V1 and V2 stamps ...
-        address=address,
-        provider__in=[p.provider for p in payload],
-        deleted_at__isnull=True,
-    )
+    # The stamps of the address are read once, for the response and for scoring
+    current_stamps = get_current_stamps(address)
+    providers = {p.provider for p in payload}
+    # We do not filter by type. The thinking is: if a user wants to delete a V2 stamp, then he wants to delete both the V1 and V2 stamps ...
+    stamps = [stamp for stamp in current_stamps if stamp.provider in providers]
     if not stamps:
         raise InvalidDeleteCacheRequestException()
 
     now = get_utc_time()
-    stamps.update(deleted_at=now, updated_at=now)
+    soft_delete_stamps(address, providers, now)
+    invalidate_passport_snapshot(address)
 
-    updated_passport_state = CeramicCache.objects.filter(
-        address=address, deleted_at__isnull=True
-    )
-
-    return GetStampsWithScoreResponse(
-        success=True,
-        stamps=[
-            CachedStampResponse(
-                address=stamp.address,
-                provider=stamp.provider,
-                stamp=stamp.stamp,
-                id=stamp.pk,
-            )
-            for stamp in updated_passport_state
-        ],
-        score=get_detailed_score_response_for_address(address),
+    return get_stamps_with_score_response(
+        address, get_updated_passport_state(current_stamps, stamps, [])
     )
 
 
@@ -506,7 +544,9 @@ def handle_authenticate(payload: CacaoVerifySubmit) -> AccessTokenResponse:
 
 
 def get_detailed_score_response_for_address(
-    address: str, alternate_scorer_id: Optional[int] = None
+    address: str,
+    alternate_scorer_id: Optional[int] = None,
+    passport_data: Optional[dict] = None,
 ) -> DetailedScoreResponse:
     scorer_id = alternate_scorer_id or settings.CERAMIC_CACHE_SCORER_ID
     if not scorer_id:
@@ -519,11 +559,61 @@ def get_detailed_score_response_for_address(
         scorer_id=scorer_id,
     )
 
-    score = async_to_sync(ahandle_submit_passport)(submit_passport_payload, account)
+    score = async_to_sync(ahandle_submit_passport)(
+        submit_passport_payload, account, passport_data
+    )
 
     return score
 
 
+def get_score_response_after_stamp_update(
+    address: str, passport_data: Optional[dict] = None
+) -> DetailedScoreResponse:
+    """
+    Returns the score of the address after its stamps have been changed. With
+    CERAMIC_CACHE_DEBOUNCE_RESCORE the passport is not rescored right away: the last known
+    score is returned, and a rescore is scheduled (see `schedule_rescore`)
+    """
+    if not settings.CERAMIC_CACHE_DEBOUNCE_RESCORE:
+        return get_detailed_score_response_for_address(
+            address, passport_data=passport_data
+        )
+
+    scorer_id = settings.CERAMIC_CACHE_SCORER_ID
+    if not scorer_id:
+        raise InternalServerException("Scorer ID not set")
+
+    schedule_rescore(address, scorer_id)
+    return get_last_score_response_for_address(address, scorer_id)
+
+
+def get_last_score_response_for_address(
+    address: str, scorer_id: int
+) -> DetailedScoreResponse:
+    cached_score = get_cached_score(scorer_id, address)
+    if isinstance(cached_score, dict):
+        return DetailedScoreResponse(**cached_score)
+
+    score = (
+        Score.objects.select_related("passport")
+        .filter(passport__address=address.lower(), passport__community_id=scorer_id)
+        .first()
+    )
+    if score:
+        return DetailedScoreResponse.from_orm(score)
+
+    # Not scored yet, the scheduled rescore will create the score
+    return DetailedScoreResponse(
+        address=address.lower(),
+        score=None,
+        status=Score.Status.PROCESSING,
+        last_score_timestamp=None,
+        evidence=None,
+        error=None,
+        stamp_scores={},
+    )
+
+
 @router.get(
     "/stake/gtc",
     response={
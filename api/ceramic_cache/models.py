@@ -5,6 +5,8 @@ from enum import IntEnum
 from account.models import EthAddressField
 from django.db import models
 from django.db.models import Q, UniqueConstraint
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 
 
 class CeramicCache(models.Model):
@@ -69,6 +71,15 @@ class CeramicCache(models.Model):
     class Meta:
         unique_together = ["type", "address", "provider", "deleted_at"]
 
+        indexes = [
+            # For loading the latest stamp of each provider of an address (see `aget_passport`)
+            models.Index(
+                fields=["address", "provider", "-updated_at"],
+                name="latest_stamps_by_address",
+                condition=Q(deleted_at__isnull=True),
+            ),
+        ]
+
         constraints = [
             # UniqueConstraint for non-deleted records
             UniqueConstraint(
@@ -85,6 +96,17 @@ class CeramicCache(models.Model):
         ]
 
 
+@receiver(post_save, sender=CeramicCache)
+@receiver(post_delete, sender=CeramicCache)
+def ceramic_cache_changed(sender, instance, **kwargs):
+    # Also sent for the changes made in the admin. Bulk inserts and updates do not send it,
+    # they must invalidate the passport themselves
+    # Imported here, the reader imports this module
+    from reader.passport_reader import invalidate_passport_snapshot
+
+    invalidate_passport_snapshot(instance.address)
+
+
 class StampExports(models.Model):
     last_export_ts = models.DateTimeField(auto_now_add=True)
     stamp_total = models.IntegerField(default=0)
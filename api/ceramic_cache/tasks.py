@@ -0,0 +1,57 @@
+"""
+Debounced rescoring of the passports whose stamps are changed through the ceramic cache API
+"""
+
+import api_logging as logging
+from account.models import Account
+from asgiref.sync import async_to_sync
+from celery import shared_task
+from django.conf import settings
+from django.core.cache import cache
+from registry.api.schema import SubmitPassportPayload
+from registry.api.v1 import ahandle_submit_passport
+
+log = logging.getLogger(__name__)
+
+# Seconds, on top of the debounce window, after which a rescore that has not started (for example because
+# no worker picked it up) no longer prevents scheduling a new one
+RESCORE_SCHEDULE_TIMEOUT = 60
+
+
+def get_rescore_schedule_key(address: str, scorer_id: int) -> str:
+    return f"ceramic_cache_rescore:{scorer_id}:{address.lower()}"
+
+
+def schedule_rescore(address: str, scorer_id: int) -> None:
+    """
+    Schedule a rescore of the address, to run after CERAMIC_CACHE_RESCORE_DEBOUNCE_MS milliseconds.
+    If a rescore is already scheduled and has not started yet, nothing is scheduled: the scheduled
+    rescore will see all the stamp changes made until it starts.
+    """
+    countdown = settings.CERAMIC_CACHE_RESCORE_DEBOUNCE_MS / 1000
+    try:
+        is_first = cache.add(
+            get_rescore_schedule_key(address, scorer_id),
+            True,
+            countdown + RESCORE_SCHEDULE_TIMEOUT,
+        )
+    except Exception:
+        log.warning("Failed to read rescore schedule", exc_info=True)
+        is_first = True
+
+    if is_first:
+        rescore_passport.apply_async((address, scorer_id), countdown=countdown)
+
+
+@shared_task
+def rescore_passport(address: str, scorer_id: int):
+    # Stamp changes from now on need a new rescore
+    try:
+        cache.delete(get_rescore_schedule_key(address, scorer_id))
+    except Exception:
+        log.warning("Failed to clear rescore schedule", exc_info=True)
+
+    account = Account.objects.get(community__id=scorer_id)
+    async_to_sync(ahandle_submit_passport)(
+        SubmitPassportPayload(address=address, scorer_id=scorer_id), account
+    )
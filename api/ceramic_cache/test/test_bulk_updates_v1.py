@@ -1,10 +1,17 @@
 import json
 from datetime import datetime
 
+import ceramic_cache.api.v1
 import pytest
 from ceramic_cache.api.v1 import get_address_from_did
 from ceramic_cache.models import CeramicCache
+from ceramic_cache.tasks import rescore_passport, schedule_rescore
+from django.core.cache import cache
+from django.db import connection
 from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from reader.passport_reader import get_passport
+from registry.models import Passport, Score
 
 pytestmark = pytest.mark.django_db
 
@@ -295,6 +302,150 @@ class TestBulkStampUpdates:
             "detail": "Unable to find stamp to delete."
         }
 
+    def test_stamps_are_read_once_for_response_and_scoring(
+        self,
+        mocker,
+        sample_providers,
+        sample_address,
+        sample_stamps,
+        sample_token,
+        ui_scorer,
+    ):
+        CeramicCache.objects.create(
+            type=self.stamp_version,
+            address=sample_address,
+            provider=sample_providers[0],
+            stamp=sample_stamps[0],
+        )
+        ascore_passport = mocker.patch("registry.api.v1.ascore_passport")
+
+        with CaptureQueriesContext(connection) as queries:
+            response = client.patch(
+                f"{self.base_url}/stamps/bulk",
+                json.dumps(
+                    [
+                        {"provider": sample_providers[0]},
+                        {"provider": sample_providers[1], "stamp": sample_stamps[1]},
+                    ]
+                ),
+                content_type="application/json",
+                **{"HTTP_AUTHORIZATION": f"Bearer {sample_token}"},
+            )
+
+        assert response.status_code == 200
+        assert [stamp["provider"] for stamp in response.json()["stamps"]] == [
+            sample_providers[1]
+        ]
+        assert response.json()["stamps"][0]["id"] is not None
+
+        stamp_reads = [
+            query
+            for query in queries.captured_queries
+            if query["sql"].startswith("SELECT")
+            and CeramicCache._meta.db_table in query["sql"]
+        ]
+        assert len(stamp_reads) == 1
+
+        # The passport is scored from the stamps that have been read
+        passport_data = ascore_passport.call_args.args[4]
+        assert passport_data == {
+            "stamps": [
+                {"provider": sample_providers[1], "credential": sample_stamps[1]}
+            ]
+        }
+
+    def test_stamps_inserted_after_the_read_are_soft_deleted(
+        self,
+        mocker,
+        sample_providers,
+        sample_address,
+        sample_stamps,
+        sample_token,
+        ui_scorer,
+    ):
+        mocker.patch("registry.api.v1.ascore_passport")
+        get_current_stamps = ceramic_cache.api.v1.get_current_stamps
+
+        def get_current_stamps_then_insert(address):
+            current_stamps = get_current_stamps(address)
+            # A concurrent request adds the stamp after the stamps have been read
+            CeramicCache.objects.create(
+                type=self.stamp_version,
+                address=address,
+                provider=sample_providers[0],
+                stamp=sample_stamps[0],
+            )
+            return current_stamps
+
+        mocker.patch(
+            "ceramic_cache.api.v1.get_current_stamps",
+            side_effect=get_current_stamps_then_insert,
+        )
+
+        response = client.post(
+            f"{self.base_url}/stamps/bulk",
+            json.dumps([{"provider": sample_providers[0], "stamp": sample_stamps[1]}]),
+            content_type="application/json",
+            **{"HTTP_AUTHORIZATION": f"Bearer {sample_token}"},
+        )
+
+        assert response.status_code == 201
+        current_stamps = CeramicCache.objects.filter(
+            address=sample_address, deleted_at__isnull=True
+        )
+        assert [stamp.stamp for stamp in current_stamps] == [sample_stamps[1]]
+        assert CeramicCache.objects.filter(address=sample_address).count() == 2
+
+    def test_stamp_updates_invalidate_the_cached_passport(
+        self,
+        mocker,
+        settings,
+        sample_providers,
+        sample_address,
+        sample_stamps,
+        sample_token,
+        ui_scorer,
+    ):
+        settings.CACHES = {
+            "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+        }
+        cache.clear()
+        mocker.patch("registry.api.v1.ascore_passport")
+
+        def get_providers():
+            return sorted(s["provider"] for s in get_passport(sample_address)["stamps"])
+
+        assert get_providers() == []
+
+        response = client.post(
+            f"{self.base_url}/stamps/bulk",
+            json.dumps([{"provider": sample_providers[0], "stamp": sample_stamps[0]}]),
+            content_type="application/json",
+            **{"HTTP_AUTHORIZATION": f"Bearer {sample_token}"},
+        )
+        assert response.status_code == 201
+        assert get_providers() == [sample_providers[0]]
+
+        response = client.patch(
+            f"{self.base_url}/stamps/bulk",
+            json.dumps([{"provider": sample_providers[1], "stamp": sample_stamps[1]}]),
+            content_type="application/json",
+            **{"HTTP_AUTHORIZATION": f"Bearer {sample_token}"},
+        )
+        assert response.status_code == 200
+        assert get_providers() == sorted(sample_providers[:2])
+
+        response = client.delete(
+            f"{self.base_url}/stamps/bulk",
+            json.dumps([{"provider": sample_providers[0]}]),
+            content_type="application/json",
+            **{"HTTP_AUTHORIZATION": f"Bearer {sample_token}"},
+        )
+        assert response.status_code == 200
+        assert get_providers() == [sample_providers[1]]
+
+        cache.clear()
+
     def test_get_address_from_did(self, sample_address):
         did = f"did:pkh:eip155:1:{sample_address}"
         address = get_address_from_did(did)
@@ -386,3 +537,103 @@ class TestComposeDBBulkStampUpdates:
         assert (
             CeramicCache.objects.filter(compose_db_stream_id="stream-id-1").count() == 1
         )
+
+
+@pytest.fixture
+def debounced_rescore(settings):
+    settings.CERAMIC_CACHE_DEBOUNCE_RESCORE = True
+    settings.CERAMIC_CACHE_RESCORE_DEBOUNCE_MS = 2000
+    settings.CACHES = {
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+    }
+    cache.clear()
+    yield
+    cache.clear()
+
+
+class TestDebouncedRescore:
+    base_url = "/ceramic-cache"
+
+    def test_bursts_of_stamp_updates_schedule_one_rescore(
+        self,
+        mocker,
+        sample_providers,
+        sample_stamps,
+        sample_token,
+        ui_scorer,
+        debounced_rescore,
+    ):
+        apply_async = mocker.patch("ceramic_cache.tasks.rescore_passport.apply_async")
+        submit_passport = mocker.patch("ceramic_cache.api.v1.ahandle_submit_passport")
+
+        for method in [client.post, client.patch, client.patch]:
+            response = method(
+                f"{self.base_url}/stamps/bulk",
+                json.dumps(
+                    [
+                        {"provider": provider, "stamp": stamp}
+                        for provider, stamp in zip(sample_providers, sample_stamps)
+                    ]
+                ),
+                content_type="application/json",
+                **{"HTTP_AUTHORIZATION": f"Bearer {sample_token}"},
+            )
+            assert response.status_code in (200, 201)
+            assert len(response.json()["stamps"]) == len(sample_providers)
+            assert response.json()["score"]["status"] == Score.Status.PROCESSING
+            assert response.json()["score"]["score"] is None
+
+        submit_passport.assert_not_called()
+        apply_async.assert_called_once()
+        assert apply_async.call_args.kwargs["countdown"] == 2
+
+    def test_stamp_update_returns_last_known_score(
+        self,
+        mocker,
+        sample_address,
+        sample_providers,
+        sample_stamps,
+        sample_token,
+        scorer_community_with_binary_scorer,
+        ui_scorer,
+        debounced_rescore,
+    ):
+        mocker.patch("ceramic_cache.tasks.rescore_passport.apply_async")
+        passport = Passport.objects.create(
+            address=sample_address.lower(),
+            community=scorer_community_with_binary_scorer,
+        )
+        Score.objects.create(passport=passport, score="1", status=Score.Status.DONE)
+
+        response = client.post(
+            f"{self.base_url}/stamps/bulk",
+            json.dumps([{"provider": sample_providers[0], "stamp": sample_stamps[0]}]),
+            content_type="application/json",
+            **{"HTTP_AUTHORIZATION": f"Bearer {sample_token}"},
+        )
+
+        assert response.status_code == 201
+        assert response.json()["score"]["status"] == Score.Status.DONE
+        assert response.json()["score"]["score"] == "1.000000000"
+
+    def test_rescore_allows_scheduling_the_next_rescore(
+        self,
+        mocker,
+        sample_address,
+        scorer_community_with_binary_scorer,
+        debounced_rescore,
+    ):
+        apply_async = mocker.patch("ceramic_cache.tasks.rescore_passport.apply_async")
+        submit_passport = mocker.patch("ceramic_cache.tasks.ahandle_submit_passport")
+        scorer_id = scorer_community_with_binary_scorer.id
+
+        schedule_rescore(sample_address, scorer_id)
+        schedule_rescore(sample_address, scorer_id)
+        assert apply_async.call_count == 1
+
+        rescore_passport(sample_address, scorer_id)
+        submit_passport.assert_called_once()
+        assert submit_passport.call_args.args[0].address == sample_address
+
+        schedule_rescore(sample_address, scorer_id)
+        assert apply_async.call_count == 2
@@ -0,0 +1,47 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def clear_scorer_cache():
+    # The scorer cache is process-local and would otherwise leak scorers between tests
+    from scorer_weighted.models import invalidate_cached_scorer
+
+    invalidate_cached_scorer()
+    yield
+    invalidate_cached_scorer()
+
+
+def _clear_cache():
+    from django.core.cache import cache
+
+    try:
+        cache.clear()
+    except Exception:
+        # Nothing can be cached if the cache is not reachable, see registry.score_cache
+        pass
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    # The scores and community ids are cached by community id, and the ids are reused between tests
+    _clear_cache()
+    yield
+    _clear_cache()
+
+
+@pytest.fixture(autouse=True)
+def write_api_analytics_inline(settings):
+    # Write each API analytics record immediately, so that it can be checked after the request
+    settings.API_ANALYTICS_BACKGROUND_FLUSH = False
+    settings.API_ANALYTICS_FLUSH_SIZE = 1
+
+
+@pytest.fixture(autouse=True)
+def fake_ratelimit_redis(monkeypatch):
+    # Count the rate limited requests in memory, with fresh local buckets for each test
+    from registry.ratelimit import RateLimiter
+    from registry.test.fake_redis import FakeRedis
+
+    fake_redis = FakeRedis()
+    monkeypatch.setattr("registry.ratelimit.rate_limiter", RateLimiter(fake_redis))
+    return fake_redis
@@ -1,9 +1,13 @@
 # libs for processing the deterministic stream location
-from typing import Dict, List
+import time
+from typing import Dict, Iterable, List
 
 import api_logging as logging
 from asgiref.sync import async_to_sync
 from ceramic_cache.models import CeramicCache
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
 
 log = logging.getLogger(__name__)
 
@@ -19,34 +23,112 @@ def get_did(address, network="1"):
     return (f"did:pkh:eip155:{network}:{address}").lower()
 
 
+def get_passport_snapshot_version_key(address: str) -> str:
+    return f"passport_snapshot_version:{address.lower()}"
+
+
+def get_passport_snapshot_key(address: str, version: int) -> str:
+    return f"passport_snapshot:{address.lower()}:{version}"
+
+
+def get_passport_snapshot_version_ttl() -> int:
+    # The version outlives the snapshots that use it. Once it expires, a new version is started
+    # from the current time, so it cannot match a snapshot of an older version either
+    return 2 * settings.PASSPORT_SNAPSHOT_CACHE_TTL
+
+
+def invalidate_passport_snapshot(address: str) -> None:
+    """
+    Invalidate the cached passport of the address, this must be called whenever the
+    ceramic cache records of the address are changed
+    """
+    key = get_passport_snapshot_version_key(address)
+    try:
+        try:
+            cache.incr(key)
+        except ValueError:
+            # No version yet (or it has been evicted), start from a version that cannot
+            # match an older snapshot
+            cache.add(key, time.time_ns(), get_passport_snapshot_version_ttl())
+    except Exception:
+        log.warning("Failed to invalidate passport snapshot", exc_info=True)
+
+
 async def aget_passport(address: str = "") -> Dict:
-    db_stamp_list = CeramicCache.objects.filter(
-        address=address, deleted_at__isnull=True
+    """
+    Returns the passport of the address: the latest ceramic cache stamp of each provider.
+
+    The passport is cached per address. The cache key contains a version of the passport of the
+    address, which is incremented by `invalidate_passport_snapshot`, so that a passport loaded
+    before an update can never be returned after the update.
+    """
+    version_key = get_passport_snapshot_version_key(address)
+    snapshot_key = None
+    try:
+        version = await cache.aget(version_key)
+        if version is None:
+            version = time.time_ns()
+            if not await cache.aadd(
+                version_key, version, get_passport_snapshot_version_ttl()
+            ):
+                version = await cache.aget(version_key)
+
+        if version is not None:
+            snapshot_key = get_passport_snapshot_key(address, version)
+            passport = await cache.aget(snapshot_key)
+            if passport is not None:
+                return passport
+    except Exception:
+        log.warning("Failed to read passport snapshot", exc_info=True)
+
+    passport = get_passport_data_from_cached_stamps(
+        await aload_latest_cached_stamps(address)
     )
 
-    stamps_by_provider = dict()
+    if snapshot_key:
+        try:
+            await cache.aset(
+                snapshot_key, passport, settings.PASSPORT_SNAPSHOT_CACHE_TTL
+            )
+        except Exception:
+            log.warning("Failed to write passport snapshot", exc_info=True)
+
+    return passport
+
+
+async def aload_latest_cached_stamps(address: str) -> List[CeramicCache]:
+    """
+    Load the latest (not deleted) ceramic cache record of each provider for the address.
+    Where supported (PostgreSQL) only the latest records are selected, with DISTINCT ON
+    """
+    db_stamp_list = CeramicCache.objects.filter(
+        address=address, deleted_at__isnull=True
+    ).only("provider", "stamp", "updated_at")
 
-    async for stamp in db_stamp_list:
-        if stamp.provider not in stamps_by_provider:
-            stamps_by_provider[stamp.provider] = []
+    if connection.features.can_distinct_on_fields:
+        db_stamp_list = db_stamp_list.order_by("provider", "-updated_at").distinct(
+            "provider"
+        )
 
-        stamps_by_provider[stamp.provider].append(stamp)
+    return [stamp async for stamp in db_stamp_list]
 
-    latest_stamps = []
 
-    for provider in stamps_by_provider:
-        latest_date = None
-        latest_stamp = None
-        for stamp in stamps_by_provider[provider]:
-            if latest_date is None or stamp.updated_at > latest_date:
-                latest_date = stamp.updated_at
-                latest_stamp = stamp
+def get_passport_data_from_cached_stamps(cached_stamps: Iterable[CeramicCache]) -> Dict:
+    """
+    Build the passport data from the (not deleted) ceramic cache records of an address,
+    keeping the latest stamp of each provider
+    """
+    latest_stamps_by_provider = dict()
 
-        latest_stamps.append(latest_stamp)
+    for stamp in cached_stamps:
+        latest_stamp = latest_stamps_by_provider.get(stamp.provider)
+        if latest_stamp is None or stamp.updated_at > latest_stamp.updated_at:
+            latest_stamps_by_provider[stamp.provider] = stamp
 
     return {
         "stamps": [
-            {"provider": s.provider, "credential": s.stamp} for s in latest_stamps
+            {"provider": s.provider, "credential": s.stamp}
+            for s in latest_stamps_by_provider.values()
         ]
     }
 
@@ -1,9 +1,17 @@
+import time
+from datetime import timedelta
 from unittest.mock import patch
 
 import pytest
 from ceramic_cache.models import CeramicCache
+from django.core.cache import cache
+from registry.utils import get_utc_time
 
-from .passport_reader import get_passport
+from .passport_reader import (
+    get_passport,
+    get_passport_snapshot_version_key,
+    invalidate_passport_snapshot,
+)
 
 sample_stamps = [
     {
@@ -157,3 +165,150 @@ class TestGetStamps:
             )
             == 0
         )
+
+
+@pytest.fixture
+def local_memory_cache(settings):
+    settings.CACHES = {
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+    }
+    cache.clear()
+    yield
+    cache.clear()
+
+
+class TestGetPassportSnapshot:
+    @pytest.mark.django_db
+    def test_latest_stamp_of_each_provider(self):
+        """Make sure only the latest (not deleted) stamp of each provider is returned"""
+
+        address = "0x123test"
+        now = get_utc_time()
+
+        for hours, (stamp, stamp_type) in enumerate(
+            zip(sample_stamps, CeramicCache.StampType)
+        ):
+            cached_stamp = CeramicCache.objects.create(
+                type=stamp_type,
+                address=address,
+                provider="Github",
+                stamp=stamp,
+            )
+            # `updated_at` is set on save (auto_now)
+            CeramicCache.objects.filter(pk=cached_stamp.pk).update(
+                updated_at=now - timedelta(hours=hours)
+            )
+
+        cached_stamp = CeramicCache.objects.create(
+            address=address,
+            provider="Github",
+            stamp=deleted_stamp,
+            deleted_at=now,
+        )
+        CeramicCache.objects.filter(pk=cached_stamp.pk).update(
+            updated_at=now + timedelta(hours=1)
+        )
+
+        passport = get_passport(address)
+
+        assert passport["stamps"] == [
+            {"provider": "Github", "credential": sample_stamps[0]}
+        ]
+
+    @pytest.mark.django_db
+    def test_passport_is_cached_until_invalidated(self, local_memory_cache):
+        address = "0x123test"
+
+        CeramicCache.objects.create(
+            address=address,
+            provider="Github",
+            stamp=sample_stamps[0],
+        )
+
+        assert len(get_passport(address)["stamps"]) == 1
+
+        # Like the updates of the API, a bulk insert does not invalidate the passport by itself
+        CeramicCache.objects.bulk_create(
+            [CeramicCache(address=address, provider="Ens", stamp=deleted_stamp)]
+        )
+
+        # Served from the cache
+        assert len(get_passport(address)["stamps"]) == 1
+
+        invalidate_passport_snapshot(address)
+
+        assert len(get_passport(address)["stamps"]) == 2
+
+    @pytest.mark.django_db
+    def test_passport_is_invalidated_when_a_stamp_is_saved_or_deleted(
+        self, local_memory_cache
+    ):
+        address = "0x123test"
+
+        CeramicCache.objects.create(
+            address=address,
+            provider="Github",
+            stamp=sample_stamps[0],
+        )
+        assert len(get_passport(address)["stamps"]) == 1
+
+        # Like the changes made in the admin
+        stamp = CeramicCache.objects.create(
+            address=address,
+            provider="Ens",
+            stamp=deleted_stamp,
+        )
+        assert len(get_passport(address)["stamps"]) == 2
+
+        stamp.delete()
+        assert len(get_passport(address)["stamps"]) == 1
+
+    @pytest.mark.django_db
+    def test_snapshot_version_expires(self, local_memory_cache, settings):
+        settings.PASSPORT_SNAPSHOT_CACHE_TTL = 600
+        invalidate_passport_snapshot("0x123test")
+        get_passport("0x456test")
+        version_keys = [
+            get_passport_snapshot_version_key(address)
+            for address in ["0x123test", "0x456test"]
+        ]
+        now = time.time()
+
+        with patch(
+            "django.core.cache.backends.locmem.time.time", return_value=now + 601
+        ):
+            assert all(cache.get(key) is not None for key in version_keys)
+
+        with patch(
+            "django.core.cache.backends.locmem.time.time", return_value=now + 1201
+        ):
+            assert all(cache.get(key) is None for key in version_keys)
+
+    @pytest.mark.django_db
+    def test_invalidate_before_first_read(self, local_memory_cache):
+        address = "0x123test"
+
+        invalidate_passport_snapshot(address)
+
+        CeramicCache.objects.create(
+            address=address,
+            provider="Github",
+            stamp=sample_stamps[0],
+        )
+
+        assert len(get_passport(address)["stamps"]) == 1
+
+    @pytest.mark.django_db
+    def test_passport_is_loaded_if_cache_is_not_available(self):
+        address = "0x123test"
+
+        CeramicCache.objects.create(
+            address=address,
+            provider="Github",
+            stamp=sample_stamps[0],
+        )
+
+        with patch(
+            "reader.passport_reader.cache.aget", side_effect=Exception("unavailable")
+        ):
+            assert len(get_passport(address)["stamps"]) == 1
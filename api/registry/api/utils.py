@@ -1,12 +1,17 @@
 import functools
 
 import api_logging as logging
+from account.api_key_cache import (
+    aget_cached_api_key,
+    aset_cached_api_key,
+    build_cached_api_key,
+    get_cached_api_key,
+    set_cached_api_key,
+)
 from account.models import Account, AccountAPIKey
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.utils.module_loading import import_string
-from django_ratelimit.core import is_ratelimited
-from django_ratelimit.decorators import ALL
 from django_ratelimit.exceptions import Ratelimited
 from eth_utils.address import (
     is_checksum_address,
@@ -19,6 +24,7 @@ from ninja.security.base import SecuritySchema
 from registry.api.schema import SubmitPassportPayload
 from registry.atasks import asave_api_key_analytics
 from registry.exceptions import InvalidScorerIdException, Unauthorized
+from registry.ratelimit import is_ratelimited
 from registry.tasks import save_api_key_analytics
 
 log = logging.getLogger(__name__)
@@ -132,6 +138,10 @@ class ApiKey(APIKeyHeader):
             except:
                 raise Unauthorized()
 
+        cached = get_cached_api_key(key)
+        if cached:
+            return authenticate_cached_api_key(request, cached)
+
         try:
             api_key = AccountAPIKey.objects.get_from_key(key)
             request.api_key = api_key
@@ -139,11 +149,20 @@ class ApiKey(APIKeyHeader):
 
             if user_account:
                 request.user = user_account.user
+                set_cached_api_key(key, api_key, user_account, request.user)
                 return user_account
         except AccountAPIKey.DoesNotExist:
             raise Unauthorized()
 
 
+def authenticate_cached_api_key(request, cached: dict) -> Account:
+    """
+    Set the API key and user from the API key cache on the request, without any query
+    """
+    request.api_key, account, request.user = build_cached_api_key(cached)
+    return account
+
+
 async def aapi_key(request):
     """
     The content of this function was copied form AccountAPIKey.objects.get_from_key and
@@ -167,6 +186,10 @@ async def aapi_key(request):
     if not key:
         raise Unauthorized()
 
+    cached = await aget_cached_api_key(key)
+    if cached:
+        return authenticate_cached_api_key(request, cached)
+
     prefix, _, _ = key.partition(".")
     queryset = AccountAPIKey.objects.get_usable_keys()
 
@@ -182,6 +205,7 @@ async def aapi_key(request):
     user_account = await Account.objects.aget(pk=api_key.account_id)
     if user_account:
         request.user = await get_user_model().objects.aget(pk=user_account.user_id)
+        await aset_cached_api_key(key, api_key, user_account, request.user)
         return user_account
 
     raise Unauthorized()
@@ -198,7 +222,8 @@ aapi_key.openapi_security_schema: SecuritySchema = SecuritySchema(
 def check_rate_limit(request):
     """
     Check the rate limit for the API.
-    This is based on the original ratelimit decorator from django_ratelimit
+    This is based on the original ratelimit decorator from django_ratelimit,
+    the requests are counted by `registry.ratelimit`
     """
     old_limited = getattr(request, "limited", False)
     rate = request.api_key.rate_limit
@@ -207,15 +232,7 @@ def check_rate_limit(request):
     if rate == "":
         return
 
-    ratelimited = is_ratelimited(
-        request=request,
-        group="registry",
-        fn=None,
-        key=lambda _request, _group: request.api_key.prefix,
-        rate=rate,
-        method=ALL,
-        increment=True,
-    )
+    ratelimited = is_ratelimited(key=f"registry:{request.api_key.prefix}", rate=rate)
     request.limited = ratelimited or old_limited
     if ratelimited:
         cls = getattr(settings, "RATELIMIT_EXCEPTION_CLASS", Ratelimited)
@@ -1,3 +1,5 @@
+import hashlib
+import json
 from typing import List, Optional
 from urllib.parse import urljoin
 
@@ -5,6 +7,7 @@ import api_logging as logging
 import django_filters
 import requests
 from account.api import UnauthorizedException, create_community_for_account
+from account.community_cache import get_cached_community_id, set_cached_community_id
 
 # --- Deduplication Modules
 from account.models import Account, Community, Nonce, Rules
@@ -55,7 +58,24 @@ from registry.exceptions import (
     api_get_object_or_404,
 )
 from registry.filters import GTCStakeEventsFilter
-from registry.models import Event, GTCStakeEvent, Passport, Score, Stamp
+from registry.models import (
+    Event,
+    GTCStakeEvent,
+    Passport,
+    Score,
+    Stamp,
+    arecord_score_event,
+)
+from registry.score_cache import (
+    SCORE_NOT_FOUND,
+    add_cached_score,
+    add_cached_score_not_found,
+    ainvalidate_cached_scores,
+    aset_cached_score,
+    get_cached_score,
+    invalidate_cached_scores,
+)
+from registry.single_flight import SingleFlight
 from registry.tasks import score_passport_passport, score_registry_passport
 from registry.utils import (
     decode_cursor,
@@ -66,6 +86,23 @@ from registry.utils import (
     reverse_lazy_with_query,
 )
 
+submit_passport_flights = SingleFlight("submit_passport")
+
+
+def get_passport_data_digest(passport_data: dict) -> str:
+    """
+    Returns a digest of the stamps of the passport, that does not depend on their order,
+    so that submissions with the same stamps can share one scoring
+    """
+    credential_digests = sorted(
+        hashlib.sha256(
+            json.dumps(stamp.get("credential"), sort_keys=True).encode("utf-8")
+        ).hexdigest()
+        for stamp in passport_data.get("stamps", [])
+    )
+    return hashlib.sha256("".join(credential_digests).encode("utf-8")).hexdigest()
+
+
 SCORE_TIMESTAMP_FIELD_DESCRIPTION = """
 The optional `timestamp` query parameter can be used to retrieve
 the latest score for an address as of that timestamp.
@@ -175,8 +212,14 @@ async def a_submit_passport(
 
 
 async def ahandle_submit_passport(
-    payload: SubmitPassportPayload, account: Account
+    payload: SubmitPassportPayload,
+    account: Account,
+    passport_data: Optional[dict] = None,
 ) -> DetailedScoreResponse:
+    """
+    Score the passport of the address. If the caller has already loaded the `passport_data`
+    (the stamps from the ceramic cache), the passport is scored from it.
+    """
     address_lower = payload.address.lower()
     if not is_valid_address(address_lower):
         raise InvalidAddressException()
@@ -199,10 +242,34 @@ async def ahandle_submit_passport(
             log.error("Invalid nonce %s for address %s", payload.nonce, payload.address)
             raise InvalidNonceException()
 
+    if passport_data is not None:
+        # Scored from the stamps of this caller, so only the concurrent submissions
+        # with the same stamps (for example from the ceramic cache endpoints) are coalesced
+        return await submit_passport_flights.do(
+            (
+                user_community.pk,
+                address_lower,
+                get_passport_data_digest(passport_data),
+            ),
+            lambda: ascore_submitted_passport(
+                user_community, payload.address, passport_data
+            ),
+        )
+
+    # Concurrent submissions for the same address and community share one scoring
+    return await submit_passport_flights.do(
+        (user_community.pk, address_lower),
+        lambda: ascore_submitted_passport(user_community, payload.address),
+    )
+
+
+async def ascore_submitted_passport(
+    user_community: Community, address: str, passport_data: Optional[dict] = None
+) -> DetailedScoreResponse:
     # Create an empty passport instance, only needed to be able to create a pending Score
     # The passport will be updated by the score_passport task
     db_passport, _ = await Passport.objects.aupdate_or_create(
-        address=payload.address.lower(),
+        address=address.lower(),
         community=user_community,
     )
 
@@ -217,10 +284,16 @@ async def ahandle_submit_passport(
         defaults=dict(score=None, status=Score.Status.PROCESSING),
     )
 
-    await ascore_passport(user_community, db_passport, payload.address, score)
+    # The previous score must not be served while the new one is processing
+    await ainvalidate_cached_scores(user_community.pk, [db_passport.address])
+
+    await ascore_passport(user_community, db_passport, address, score, passport_data)
     await score.asave()
+    await arecord_score_event(score, db_passport.address, user_community.pk)
 
-    return DetailedScoreResponse.from_orm(score)
+    response = DetailedScoreResponse.from_orm(score)
+    await aset_cached_score(user_community.pk, db_passport.address, response)
+    return response
 
 
 def handle_submit_passport(
@@ -262,6 +335,9 @@ def handle_submit_passport(
         defaults=dict(score=None, status=Score.Status.PROCESSING),
     )
 
+    # The previous score must not be served while the new one is processing
+    invalidate_cached_scores(user_community.pk, [db_passport.address])
+
     if use_passport_task:
         score_passport_passport.delay(user_community.pk, payload.address)
     else:
@@ -365,8 +441,11 @@ def get_score(request, address: str, scorer_id: int | str) -> DetailedScoreRespo
 def handle_get_score(
     address: str, scorer_id: int, account: Account
 ) -> DetailedScoreResponse:
-    # Get community object
-    user_community = get_scorer_by_id(scorer_id, account)
+    # Get community id
+    community_id = get_cached_community_id(account.pk, scorer_id)
+    if community_id is None:
+        community_id = get_scorer_by_id(scorer_id, account).pk
+        set_cached_community_id(account.pk, scorer_id, community_id)
 
     try:
         lower_address = address.lower()
@@ -374,10 +453,23 @@ def handle_get_score(
         if not is_valid_address(lower_address):
             raise InvalidAddressException()
 
-        score = Score.objects.get(
-            passport__address=lower_address, passport__community=user_community
-        )
-        return DetailedScoreResponse.from_orm(score)
+        cached_score = get_cached_score(community_id, lower_address)
+        if cached_score == SCORE_NOT_FOUND:
+            raise Score.DoesNotExist()
+        if cached_score is not None:
+            return DetailedScoreResponse(**cached_score)
+
+        try:
+            score = Score.objects.select_related("passport").get(
+                passport__address=lower_address, passport__community_id=community_id
+            )
+        except Score.DoesNotExist:
+            add_cached_score_not_found(community_id, lower_address)
+            raise
+
+        response = DetailedScoreResponse.from_orm(score)
+        add_cached_score(community_id, lower_address, response)
+        return response
 
     except NotFoundApiException as e:
         raise e
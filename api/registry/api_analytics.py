@@ -0,0 +1,204 @@
+"""
+In-memory queue for the API key analytics records, written to the DB in batches
+"""
+
+import atexit
+import threading
+from collections import deque
+from typing import Optional
+
+import api_logging as logging
+from account.models import AccountAPIKeyAnalytics
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+log = logging.getLogger(__name__)
+
+
+sensitive_headers_data = {
+    "X-Api-Key",
+    "Cookie",
+    "Authorization",
+    "x-api-key",
+    "cookie",
+    "authorization",
+}
+
+
+def build_api_key_analytics(
+    api_key_id,
+    path,
+    path_segments,
+    query_params,
+    headers,
+    payload,
+    response,
+    response_skipped,
+    error,
+) -> AccountAPIKeyAnalytics:
+    """
+    Build the (unsaved) analytics record, with the sensitive headers masked.
+    `payload` and `response` must already be serialized.
+    """
+    cleaned_headers = dict(headers)
+    for sensitive_field in sensitive_headers_data:
+        if sensitive_field in cleaned_headers:
+            cleaned_headers[sensitive_field] = "***"
+
+    return AccountAPIKeyAnalytics(
+        api_key_id=api_key_id,
+        path=path,
+        path_segments=path_segments,
+        query_params=query_params,
+        payload=payload,
+        headers=cleaned_headers,
+        response=response,
+        response_skipped=response_skipped,
+        error=error,
+    )
+
+
+class ApiAnalyticsQueue:
+    """
+    Bounded, thread-safe queue of analytics records.
+
+    With API_ANALYTICS_BACKGROUND_FLUSH a background writer thread (started on the first record)
+    writes the records with `bulk_create` every API_ANALYTICS_FLUSH_SIZE records or
+    API_ANALYTICS_FLUSH_INTERVAL_MS milliseconds. Otherwise the records are written inline once
+    API_ANALYTICS_FLUSH_SIZE records are queued, and the owner of the process (for example a lambda
+    handler) must `flush` at the end of its work.
+
+    When the queue holds API_ANALYTICS_QUEUE_SIZE records, new records are dropped and counted
+    instead of slowing down the requests.
+    """
+
+    def __init__(self):
+        self._records = deque()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._writer: Optional[threading.Thread] = None
+        self._flush_at_exit = False
+
+        self.num_written = 0
+        self.num_dropped = 0
+        self.num_failed = 0
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def stats(self) -> dict:
+        return {
+            "queued": len(self._records),
+            "written": self.num_written,
+            "dropped": self.num_dropped,
+            "failed": self.num_failed,
+        }
+
+    def _put(self, record: AccountAPIKeyAnalytics) -> bool:
+        """
+        Add the record to the queue. Returns True if the caller shall flush the queue inline.
+        """
+        with self._lock:
+            if len(self._records) >= settings.API_ANALYTICS_QUEUE_SIZE:
+                self.num_dropped += 1
+                if self.num_dropped % 1000 == 1:
+                    log.warning(
+                        "API analytics queue is full, %s records dropped so far",
+                        self.num_dropped,
+                    )
+                return False
+
+            self._records.append(record)
+            flush_due = len(self._records) >= settings.API_ANALYTICS_FLUSH_SIZE
+
+        if settings.API_ANALYTICS_BACKGROUND_FLUSH:
+            self._start_writer()
+            if flush_due:
+                self._wakeup.set()
+            return False
+
+        return flush_due
+
+    def enqueue(self, record: AccountAPIKeyAnalytics) -> None:
+        if self._put(record):
+            self.flush()
+
+    async def aenqueue(self, record: AccountAPIKeyAnalytics) -> None:
+        if self._put(record):
+            await self.aflush()
+
+    def flush(self) -> int:
+        """
+        Write all queued records to the DB. Returns the number of records taken from the queue.
+        """
+        with self._flush_lock:
+            with self._lock:
+                records = list(self._records)
+                self._records.clear()
+
+            if not records:
+                return 0
+
+            try:
+                with transaction.atomic():
+                    AccountAPIKeyAnalytics.objects.bulk_create(
+                        records, batch_size=settings.API_ANALYTICS_FLUSH_SIZE
+                    )
+                self.num_written += len(records)
+            except Exception as e:
+                log.warning(
+                    "Failed to save %s analytics records in bulk, saving them one by one. Error: '%s'",
+                    len(records),
+                    e,
+                )
+                self._write_one_by_one(records)
+
+            return len(records)
+
+    def _write_one_by_one(self, records):
+        """
+        Write the records one by one, so that only the records that cannot be written are lost
+        """
+        for record in records:
+            # The ids of the rolled back bulk insert may have been set
+            record.pk = None
+            try:
+                with transaction.atomic():
+                    AccountAPIKeyAnalytics.objects.bulk_create([record])
+                self.num_written += 1
+            except Exception as e:
+                self.num_failed += 1
+                log.error(
+                    "Failed to save analytics record. Error: '%s'", e, exc_info=True
+                )
+
+    async def aflush(self) -> int:
+        return await sync_to_async(self.flush)()
+
+    def _start_writer(self):
+        if self._writer is not None and self._writer.is_alive():
+            return
+
+        with self._lock:
+            if self._writer is None or not self._writer.is_alive():
+                self._writer = threading.Thread(
+                    target=self._run_writer, name="api-analytics-writer", daemon=True
+                )
+                self._writer.start()
+                if not self._flush_at_exit:
+                    atexit.register(self.flush)
+                    self._flush_at_exit = True
+
+    def _run_writer(self):
+        while True:
+            self._wakeup.wait(settings.API_ANALYTICS_FLUSH_INTERVAL_MS / 1000)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            finally:
+                close_old_connections()
+
+
+api_analytics_queue = ApiAnalyticsQueue()
@@ -1,34 +1,31 @@
-import copy
-from datetime import datetime
-from typing import Dict, List
+import asyncio
+from typing import Dict, List, Optional, Tuple
 
 import api_logging as logging
 from account.deduplication.lifo import alifo
 
 # --- Deduplication Modules
-from account.models import AccountAPIKeyAnalytics, Community, Rules
+from account.models import Community, Rules
+from asgiref.sync import sync_to_async
 from django.conf import settings
+from django.db import transaction
 from ninja_extra.exceptions import APIException
 from reader.passport_reader import aget_passport, get_did
+from registry.api_analytics import api_analytics_queue, build_api_key_analytics
 from registry.exceptions import NoPassportException
 from registry.models import Passport, Score, Stamp
-from registry.utils import get_utc_time, validate_credential, verify_issuer
+from registry.utils import (
+    get_utc_time,
+    parse_expiration_date,
+    validate_credential,
+    verify_issuer,
+)
 
 log = logging.getLogger(__name__)
 
 Hash = str
 
 
-sensitive_headers_data = {
-    "X-Api-Key",
-    "Cookie",
-    "Authorization",
-    "x-api-key",
-    "cookie",
-    "authorization",
-}
-
-
 async def asave_api_key_analytics(
     api_key_id,
     path,
@@ -40,39 +37,29 @@ async def asave_api_key_analytics(
     response_skipped,
     error,
 ):
+    """
+    Queue the analytics record, it is written to the DB in batches (see `ApiAnalyticsQueue`)
+    """
     try:
         if settings.FF_API_ANALYTICS == "on":
-            cleaned_headers = dict(headers)
-            for sensitive_field in sensitive_headers_data:
-                if sensitive_field in cleaned_headers:
-                    cleaned_headers[sensitive_field] = "***"
-
-            await AccountAPIKeyAnalytics.objects.acreate(
-                api_key_id=api_key_id,
-                path=path,
-                path_segments=path_segments,
-                query_params=query_params,
-                payload=payload,
-                headers=cleaned_headers,
-                response=response,
-                response_skipped=response_skipped,
-                error=error,
+            await api_analytics_queue.aenqueue(
+                build_api_key_analytics(
+                    api_key_id=api_key_id,
+                    path=path,
+                    path_segments=path_segments,
+                    query_params=query_params,
+                    headers=headers,
+                    payload=payload,
+                    response=response,
+                    response_skipped=response_skipped,
+                    error=error,
+                )
             )
 
     except Exception as e:
         log.error("Failed to save analytics. Error: '%s'", e, exc_info=True)
 
 
-async def aremove_stale_stamps_from_db(passport: Passport, passport_data: dict):
-    current_hashes = [
-        stamp["credential"]["credentialSubject"]["hash"]
-        for stamp in passport_data["stamps"]
-    ]
-    await Stamp.objects.filter(passport=passport).exclude(
-        hash__in=current_hashes
-    ).adelete()
-
-
 async def aload_passport_data(address: str) -> Dict:
     # Get the passport data from the blockchain or ceramic cache
     passport_data = await aget_passport(address)
@@ -82,12 +69,43 @@ async def aload_passport_data(address: str) -> Dict:
     return passport_data
 
 
-async def acalculate_score(passport: Passport, community_id: int, score: Score):
-    log.debug("Scoring")
-    user_community = await Community.objects.aget(pk=community_id)
+def get_stamp_providers(passport_data: dict) -> List[str]:
+    """
+    Return the providers of the stamps in `passport_data`, counting each stamp hash once,
+    the same way the stamps are stored in the DB
+    """
+    providers_by_hash = {
+        stamp["credential"]["credentialSubject"]["hash"]: stamp["provider"]
+        for stamp in passport_data["stamps"]
+    }
+    return list(providers_by_hash.values())
 
-    scorer = await user_community.aget_scorer()
-    scores = await scorer.acompute_score([passport.id])
+
+async def acalculate_score(
+    passport: Passport,
+    community_id: int,
+    score: Score,
+    passport_data: Optional[dict] = None,
+    community: Optional[Community] = None,
+):
+    """
+    Calculate the score for the passport.
+    If `passport_data` is provided, the score is computed from the stamps in it (these
+    are expected to be the stamps just saved for the passport) instead of reading the
+    stamps back from the DB.
+    If the caller already has the `community` it is not loaded again.
+    """
+    log.debug("Scoring")
+    if community is None:
+        community = await Community.objects.aget(pk=community_id)
+
+    scorer = await community.aget_scorer()
+    providers_by_passport = (
+        {passport.id: get_stamp_providers(passport_data)}
+        if passport_data is not None
+        else None
+    )
+    scores = await scorer.acompute_score([passport.id], providers_by_passport)
 
     log.info("Scores for address '%s': %s", passport.address, scores)
     scoreData = scores[0]
@@ -151,44 +169,60 @@ async def aprocess_deduplication(passport, community, passport_data, score: Scor
 async def avalidate_credentials(passport: Passport, passport_data) -> dict:
     log.debug("validating credentials")
 
-    validated_passport = copy.deepcopy(passport_data)
-    validated_passport["stamps"] = []
+    # The credentials are not copied, the validated passport references the credentials of `passport_data`
+    validated_passport = {**passport_data, "stamps": []}
 
     did = get_did(passport.address)
+    now = get_utc_time()
+
+    # The expiration date is parsed once here, and is carried along with the stamp through
+    # the deduplication and saving of hash links
+    stamps = [
+        {
+            **stamp,
+            "expiration_date": parse_expiration_date(
+                stamp["credential"]["expirationDate"]
+            ),
+        }
+        for stamp in passport_data["stamps"]
+    ]
 
-    for stamp in passport_data["stamps"]:
+    # The didkit verification is done in native code, and we run up to
+    # CREDENTIAL_VERIFICATION_CONCURRENCY verifications concurrently
+    semaphore = asyncio.Semaphore(settings.CREDENTIAL_VERIFICATION_CONCURRENCY)
+
+    async def averify_stamp(stamp) -> Tuple[List[str], bool, bool]:
         log.debug(
             "validating credential did='%s' credential='%s'", did, stamp["credential"]
         )
-        try:
-            # TODO: use some library or https://docs.python.org/3/library/datetime.html#datetime.datetime.fromisoformat to
-            # parse iso timestamps
-            stamp_expiration_date = datetime.strptime(
-                stamp["credential"]["expirationDate"], "%Y-%m-%dT%H:%M:%S.%fZ"
-            )
-        except ValueError:
-            stamp_expiration_date = datetime.strptime(
-                stamp["credential"]["expirationDate"], "%Y-%m-%dT%H:%M:%SZ"
-            )
-
         is_issuer_verified = verify_issuer(stamp)
         # check that expiration date is not in the past
-        stamp_is_expired = stamp_expiration_date < datetime.now()
-        stamp_return_errors = []
-        valid = False
+        stamp_is_expired = stamp["expiration_date"] < now
+        stamp_return_errors = None
         if not stamp_is_expired and is_issuer_verified:
             # do expensive operation last
-            stamp_return_errors = await validate_credential(did, stamp["credential"])
-            if len(stamp_return_errors) == 0:
-                valid = True
+            async with semaphore:
+                stamp_return_errors = await validate_credential(
+                    did, stamp["credential"]
+                )
+
+        return stamp_return_errors, stamp_is_expired, is_issuer_verified
+
+    # The results are returned in the same order as the stamps
+    results = await asyncio.gather(*[averify_stamp(stamp) for stamp in stamps])
+
+    for stamp, (stamp_return_errors, stamp_is_expired, is_issuer_verified) in zip(
+        stamps, results
+    ):
+        valid = stamp_return_errors is not None and len(stamp_return_errors) == 0
 
         if valid:
-            validated_passport["stamps"].append(copy.deepcopy(stamp))
+            validated_passport["stamps"].append(stamp)
         else:
             log.info(
                 "Stamp not created. Stamp=%s\nReason: errors=%s stamp_is_expired=%s is_issuer_verified=%s",
                 stamp,
-                stamp_return_errors,
+                stamp_return_errors or [],
                 stamp_is_expired,
                 is_issuer_verified,
             )
@@ -196,25 +230,58 @@ async def avalidate_credentials(passport: Passport, passport_data) -> dict:
     return validated_passport
 
 
+def save_stamps(passport: Passport, deduped_passport_data) -> None:
+    """
+    Replace the stamps of the passport with the stamps in `deduped_passport_data`.
+    In a single transaction, this:
+    - deletes the stale stamps (the ones not present in `deduped_passport_data`)
+    - upserts the current stamps with one `INSERT ... ON CONFLICT (hash, passport) DO UPDATE`
+    """
+    # Only one row per hash can be upserted in a statement, the last stamp wins
+    stamps = {
+        stamp["credential"]["credentialSubject"]["hash"]: Stamp(
+            hash=stamp["credential"]["credentialSubject"]["hash"],
+            passport=passport,
+            provider=stamp["provider"],
+            credential=stamp["credential"],
+        )
+        for stamp in deduped_passport_data["stamps"]
+    }
+
+    with transaction.atomic():
+        Stamp.objects.filter(passport=passport).exclude(
+            hash__in=list(stamps.keys())
+        ).delete()
+
+        if stamps:
+            Stamp.objects.bulk_create(
+                stamps.values(),
+                update_conflicts=True,
+                unique_fields=["hash", "passport"],
+                update_fields=["provider", "credential"],
+            )
+
+
 async def asave_stamps(passport: Passport, deduped_passport_data) -> None:
     log.debug(
         "saving stamps deduped_passport_data: %s", deduped_passport_data["stamps"]
     )
 
-    for stamp in deduped_passport_data["stamps"]:
-        await Stamp.objects.aupdate_or_create(
-            hash=stamp["credential"]["credentialSubject"]["hash"],
-            passport=passport,
-            defaults={
-                "provider": stamp["provider"],
-                "credential": stamp["credential"],
-            },
-        )
+    await sync_to_async(save_stamps)(passport, deduped_passport_data)
 
 
 async def ascore_passport(
-    community: Community, passport: Passport, address: str, score: Score
+    community: Community,
+    passport: Passport,
+    address: str,
+    score: Score,
+    passport_data: Optional[dict] = None,
 ):
+    """
+    Load, validate, deduplicate and save the stamps of the passport, and calculate its score.
+    If the caller has already loaded the `passport_data` (the stamps from the ceramic cache),
+    it is not loaded again.
+    """
     log.info(
         "score_passport request for community_id=%s, address='%s'",
         community.pk,
@@ -222,14 +289,20 @@ async def ascore_passport(
     )
 
     try:
-        passport_data = await aload_passport_data(address)
+        if passport_data is None:
+            passport_data = await aload_passport_data(address)
         validated_passport_data = await avalidate_credentials(passport, passport_data)
         deduped_passport_data = await aprocess_deduplication(
             passport, community, validated_passport_data, score
         )
         await asave_stamps(passport, deduped_passport_data)
-        await aremove_stale_stamps_from_db(passport, deduped_passport_data)
-        await acalculate_score(passport, community.pk, score)
+        await acalculate_score(
+            passport,
+            community.pk,
+            score,
+            passport_data=deduped_passport_data,
+            community=community,
+        )
 
     except APIException as e:
         log.error(
@@ -3,6 +3,7 @@ from datetime import datetime, timezone
 
 from django.core.management.base import BaseCommand
 from registry.models import Stamp, HashScorerLink
+from registry.utils import parse_expiration_date
 
 
 class Command(BaseCommand):
@@ -55,7 +56,9 @@ class Command(BaseCommand):
                                 hash=stamp.hash,
                                 address=stamp.passport.address,
                                 community=stamp.passport.community,
-                                expires_at=stamp.credential["expirationDate"],
+                                expires_at=parse_expiration_date(
+                                    stamp.credential["expirationDate"]
+                                ),
                             )
                             for stamp in objects
                         ]
@@ -0,0 +1,141 @@
+import copy
+import time
+import tracemalloc
+from unittest.mock import patch
+
+from account.deduplication.lifo import arun_lifo_dedup
+from account.models import Community
+from asgiref.sync import async_to_sync
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from registry.atasks import avalidate_credentials
+from registry.models import Passport
+
+BENCHMARK_ADDRESS = "0xbe0c4a1f0000000000000000000000000000beef"
+
+
+def get_synthetic_passport(num_stamps: int, credential_size: int) -> dict:
+    return {
+        "stamps": [
+            {
+                "provider": f"BenchmarkProvider#{i}",
+                "credential": {
+                    "type": ["VerifiableCredential"],
+                    "issuer": "did:key:benchmark",
+                    "expirationDate": "2099-01-01T00:00:00.000Z",
+                    "credentialSubject": {
+                        "id": f"did:pkh:eip155:1:{BENCHMARK_ADDRESS}",
+                        "hash": f"v0.0.0:benchmark-{i}",
+                        "provider": f"BenchmarkProvider#{i}",
+                    },
+                    "proof": {"jws": "x" * credential_size},
+                },
+            }
+            for i in range(num_stamps)
+        ]
+    }
+
+
+async def avalidate_and_dedup(community, passport, passport_data):
+    validated_passport = await avalidate_credentials(passport, passport_data)
+    return await arun_lifo_dedup(community, validated_passport, passport.address)
+
+
+async def avalidate_and_dedup_with_copies(community, passport, passport_data):
+    """
+    The previous implementation: the validation and the deduplication deep-copied the
+    passport, and then every stamp that was kept
+    """
+    validated_passport = await avalidate_credentials(
+        passport, copy.deepcopy(passport_data)
+    )
+    validated_passport["stamps"] = copy.deepcopy(validated_passport["stamps"])
+    deduped_passport, affected_passports = await arun_lifo_dedup(
+        community, copy.deepcopy(validated_passport), passport.address
+    )
+    deduped_passport["stamps"] = copy.deepcopy(deduped_passport["stamps"])
+    return deduped_passport, affected_passports
+
+
+async def always_valid(did, credential):
+    return []
+
+
+class Command(BaseCommand):
+    help = "Compare time and memory of validating and deduplicating a passport, with and without deep copies"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--community-id",
+            type=int,
+            required=True,
+            help="""Community used for the deduplication (nothing is written, the transaction is rolled back)""",
+        )
+        parser.add_argument(
+            "--num-stamps",
+            type=int,
+            default=50,
+            help="""Number of stamps of the synthetic passport""",
+        )
+        parser.add_argument(
+            "--credential-size",
+            type=int,
+            default=2500,
+            help="""Approximate size of each credential in bytes""",
+        )
+        parser.add_argument(
+            "--runs",
+            type=int,
+            default=20,
+            help="""Number of submissions to average over""",
+        )
+
+    def handle(self, *args, **kwargs):
+        try:
+            community = Community.objects.get(pk=kwargs["community_id"])
+        except Community.DoesNotExist:
+            raise CommandError(f"Community {kwargs['community_id']} does not exist")
+
+        passport = Passport(address=BENCHMARK_ADDRESS, community=community)
+        passport_data = get_synthetic_passport(
+            kwargs["num_stamps"], kwargs["credential_size"]
+        )
+        runs = kwargs["runs"]
+
+        self.stdout.write(
+            f"Validating and deduplicating {kwargs['num_stamps']} stamps, {runs} runs (verification is stubbed)"
+        )
+        # The signature verification is stubbed, only the handling of the passport is measured
+        with patch("registry.atasks.validate_credential", always_valid), patch(
+            "registry.atasks.verify_issuer", return_value=True
+        ):
+            for name, validate_and_dedup in [
+                ("deep copies", avalidate_and_dedup_with_copies),
+                ("no copies", avalidate_and_dedup),
+            ]:
+                elapsed, peak_memory = self.measure(
+                    validate_and_dedup, community, passport, passport_data, runs
+                )
+                self.stdout.write(
+                    f"""
+{name}:
+Elapsed: {elapsed * 1000 / runs:.1f} ms per submission
+Peak memory: {peak_memory / 1024:.0f} KiB
+"""
+                )
+
+    def measure(self, validate_and_dedup, community, passport, passport_data, runs):
+        elapsed = 0.0
+        peak_memory = 0
+        for _ in range(runs):
+            # Every run starts without hash links, like the first submission of the passport
+            with transaction.atomic():
+                tracemalloc.start()
+                start = time.perf_counter()
+                async_to_sync(validate_and_dedup)(community, passport, passport_data)
+                elapsed += time.perf_counter() - start
+                peak_memory = max(peak_memory, tracemalloc.get_traced_memory()[1])
+                tracemalloc.stop()
+                transaction.set_rollback(True)
+
+        return elapsed, peak_memory
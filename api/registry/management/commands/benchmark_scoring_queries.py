@@ -0,0 +1,93 @@
+import time
+import tracemalloc
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from registry.models import Passport, Stamp
+from scorer_weighted.computation import load_providers_by_passport
+
+
+def load_providers_from_stamp_objects(passport_ids):
+    """
+    The previous scoring read path: full `Stamp` objects are loaded (including the `credential` JSON),
+    only to read `passport_id` and `provider`
+    """
+    providers_by_passport = defaultdict(list)
+    for stamp in Stamp.objects.filter(passport_id__in=passport_ids):
+        providers_by_passport[stamp.passport_id].append(stamp.provider)
+    return providers_by_passport
+
+
+class Command(BaseCommand):
+    help = "Compare time and memory of the scoring stamp queries: full Stamp objects vs. only the needed columns"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--community-id",
+            type=int,
+            default=None,
+            help="""Only use the passports of this community""",
+        )
+        parser.add_argument(
+            "--num-passports",
+            type=int,
+            default=100000,
+            help="""Number of passports to load the stamps for""",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="""Number of passports per query, like in recalculate_scores""",
+        )
+
+    def handle(self, *args, **kwargs):
+        passports = Passport.objects.order_by("id")
+        if kwargs["community_id"]:
+            passports = passports.filter(community_id=kwargs["community_id"])
+        passport_ids = list(
+            passports.values_list("id", flat=True)[: kwargs["num_passports"]]
+        )
+
+        if not passport_ids:
+            self.stdout.write("No passports found")
+            return
+
+        batch_size = kwargs["batch_size"]
+        batches = [
+            passport_ids[i : i + batch_size]
+            for i in range(0, len(passport_ids), batch_size)
+        ]
+
+        self.stdout.write(
+            f"Loading the stamps of {len(passport_ids)} passports in {len(batches)} batches"
+        )
+        for name, load_providers in [
+            ("full stamp objects", load_providers_from_stamp_objects),
+            ("pruned columns", load_providers_by_passport),
+        ]:
+            elapsed, peak_memory, num_stamps = self.measure(load_providers, batches)
+            scale = 100000 / len(passport_ids)
+            self.stdout.write(
+                f"""
+{name}:
+Stamps: {num_stamps}
+Elapsed: {elapsed:.3f}s ({elapsed * scale:.3f}s per 100k passports)
+Peak memory per batch: {peak_memory / 1024 / 1024:.2f} MiB
+"""
+            )
+
+    def measure(self, load_providers, batches):
+        elapsed = 0.0
+        peak_memory = 0
+        num_stamps = 0
+        for batch in batches:
+            tracemalloc.start()
+            start = time.perf_counter()
+            providers_by_passport = load_providers(batch)
+            elapsed += time.perf_counter() - start
+            peak_memory = max(peak_memory, tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+            num_stamps += sum(len(p) for p in providers_by_passport.values())
+
+        return elapsed, peak_memory, num_stamps
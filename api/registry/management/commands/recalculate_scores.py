@@ -1,13 +1,27 @@
 import json
+import multiprocessing
 from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from typing import Dict, List, Optional, Set
 
+from account.deduplication import Rules
+from account.deduplication.lifo import alifo_batch
 from account.models import Community
+from asgiref.sync import async_to_sync
 from django.conf import settings
-from django.core.management.base import BaseCommand
-from django.db.models import Q, QuerySet
-from registry.models import Passport, Score, Stamp
-from registry.utils import get_utc_time
-from scorer_weighted.models import BinaryWeightedScorer, RescoreRequest, WeightedScorer
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.db.models import F, QuerySet
+from registry.models import Passport, Score, ScoreEventBuffer, Stamp
+from registry.score_cache import invalidate_cached_scores
+from registry.utils import get_utc_time, parse_expiration_date
+from scorer_weighted.computation import load_providers_by_passport
+from scorer_weighted.models import (
+    BinaryWeightedScorer,
+    RescoreRequest,
+    WeightedScorer,
+    invalidate_cached_scorer,
+)
 
 
 class Command(BaseCommand):
@@ -40,6 +54,51 @@ class Command(BaseCommand):
             choices=[True, False],
             help="""Only update weights, don't recalculate scores""",
         )
+        parser.add_argument(
+            "--only-changed-providers",
+            type=bool,
+            default=False,
+            choices=[True, False],
+            help="""Only rescore the passports holding stamps from providers whose weight has changed: the new weights are diffed against --previous-weights and against the current weights of each scorer. Requires --previous-weights""",
+        )
+        parser.add_argument(
+            "--previous-weights",
+            type=str,
+            default=None,
+            help="""The weights being replaced, as JSON formatted dict, for --only-changed-providers. Pass the same value to every shard and to reruns: once the weights are updated the current weights of the scorers no longer show what has changed""",
+        )
+        parser.add_argument(
+            "--previous-threshold",
+            type=str,
+            default=None,
+            help="""The threshold being replaced, for --only-changed-providers. If it differs from the new threshold, all passports of binary scorers are rescored""",
+        )
+        parser.add_argument(
+            "--from-stamp-scores",
+            type=bool,
+            default=False,
+            choices=[True, False],
+            help="""Fast path for weight changes: rescore from the providers in the stored `stamp_scores` instead of loading the stamps. Passports without a calculated score or `stamp_scores` fall back to a full recompute""",
+        )
+        parser.add_argument(
+            "--deduplicate",
+            type=bool,
+            default=False,
+            choices=[True, False],
+            help="""Run the LIFO deduplication again for the stored stamps of the rescored passports of LIFO communities, and delete the stamps that are claimed by another address. The passports of a batch are deduplicated together, in the order of their ids. Can't be combined with --from-stamp-scores""",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="""Number of worker processes used for rescoring, each with its own DB connection""",
+        )
+        parser.add_argument(
+            "--shard",
+            type=str,
+            default="0/1",
+            help="""Only rescore one shard of the passports, as 'index/count', for example '0/4' for the first of 4 shards. A passport belongs to the shard `passport id % count`. This allows splitting the rescoring between several instances, each instance reports its progress in its own RescoreRequest""",
+        )
 
     def handle(self, *args, **kwargs):
         self.stdout.write("Running ...")
@@ -57,16 +116,36 @@ class Command(BaseCommand):
         )
 
         batch_size = kwargs["batch_size"]
+        workers = kwargs["workers"]
+        shard, num_shards = parse_shard(kwargs["shard"])
 
         communities = (
             Community.objects.filter(**filter)
             .exclude(**exclude)
             .exclude(scorer__weightedscorer__exclude_from_weight_updates=True)
             .exclude(scorer__binaryweightedscorer__exclude_from_weight_updates=True)
+            .order_by("id")
         )
 
         self.stdout.write(f"Updating communities: {list(communities)}")
 
+        changed_providers_by_community = None
+        if kwargs["only_changed_providers"]:
+            if kwargs["previous_weights"] is None:
+                raise CommandError(
+                    "--only-changed-providers requires --previous-weights"
+                )
+            changed_providers_by_community = get_changed_providers_by_community(
+                communities,
+                previous_weights=json.loads(kwargs["previous_weights"]),
+                previous_threshold=kwargs["previous_threshold"],
+            )
+
+        if kwargs["deduplicate"] and kwargs["from_stamp_scores"]:
+            raise CommandError(
+                "--deduplicate can't be combined with --from-stamp-scores"
+            )
+
         # Update Score weights
         self.update_scorers(communities)
 
@@ -75,7 +154,17 @@ class Command(BaseCommand):
 
         self.stdout.write(f"Recalculating scores")
 
-        return recalculate_scores(communities, batch_size, self.stdout)
+        return recalculate_scores(
+            communities,
+            batch_size,
+            self.stdout,
+            workers=workers,
+            shard=shard,
+            num_shards=num_shards,
+            changed_providers_by_community=changed_providers_by_community,
+            from_stamp_scores=kwargs["from_stamp_scores"],
+            deduplicate=kwargs["deduplicate"],
+        )
 
     def update_scorers(self, communities: QuerySet[Community]):
         weights = settings.GITCOIN_PASSPORT_WEIGHTS
@@ -88,6 +177,7 @@ class Command(BaseCommand):
 
         weighted_scorers.update(weights=weights)
         binary_weighted_scorers.update(weights=weights, threshold=threshold)
+        invalidate_cached_scorer()
 
         print(
             "Updated scorers:",
@@ -95,7 +185,386 @@ class Command(BaseCommand):
         )
 
 
-def recalculate_scores(communities, batch_size, outstream):
+def parse_shard(value: str) -> tuple:
+    """
+    Parse a shard specification like '1/4' into the tuple (shard index, number of shards)
+    """
+    try:
+        shard, num_shards = (int(v) for v in value.split("/"))
+    except ValueError:
+        raise CommandError(f"Invalid shard '{value}', expected 'index/count'")
+
+    if num_shards < 1 or not 0 <= shard < num_shards:
+        raise CommandError(f"Invalid shard '{value}', expected 0 <= index < count")
+
+    return shard, num_shards
+
+
+def get_changed_providers(old_weights: dict, new_weights: dict) -> Set[str]:
+    """
+    Returns the providers whose weight differs between `old_weights` and `new_weights`,
+    including the providers that were added or removed
+    """
+    old_weights = old_weights or {}
+    new_weights = new_weights or {}
+    return {
+        provider
+        for provider in old_weights.keys() | new_weights.keys()
+        if Decimal(str(old_weights.get(provider, 0)))
+        != Decimal(str(new_weights.get(provider, 0)))
+    }
+
+
+def get_changed_providers_by_community(
+    communities,
+    previous_weights: Optional[dict] = None,
+    previous_threshold: Optional[str] = None,
+) -> Dict[int, Optional[Set[str]]]:
+    """
+    Diff the weights from the settings, which `update_scorers` applies, against `previous_weights`
+    and against the current weights of the scorer of each community.
+
+    The current weights of the scorers only show the changes until `update_scorers` has run, so
+    other shards and reruns rely on `previous_weights` (and `previous_threshold`).
+
+    Returns the changed providers by community id, or None for a community when all its passports
+    need to be rescored (the threshold of its binary scorer changes)
+    """
+    new_weights = settings.GITCOIN_PASSPORT_WEIGHTS
+    new_threshold = Decimal(str(settings.GITCOIN_PASSPORT_THRESHOLD))
+    changed_providers = (
+        get_changed_providers(previous_weights, new_weights)
+        if previous_weights is not None
+        else set()
+    )
+    threshold_changed = (
+        previous_threshold is not None
+        and Decimal(str(previous_threshold)) != new_threshold
+    )
+
+    # The scorers are read directly, in order not to cache the old weights on the community instances
+    filter = {"scorer_ptr__community__in": communities}
+    changed_providers_by_community = {}
+    for community_id, weights in WeightedScorer.objects.filter(**filter).values_list(
+        "scorer_ptr__community", "weights"
+    ):
+        changed_providers_by_community[community_id] = (
+            changed_providers | get_changed_providers(weights, new_weights)
+        )
+
+    for community_id, weights, threshold in BinaryWeightedScorer.objects.filter(
+        **filter
+    ).values_list("scorer_ptr__community", "weights", "threshold"):
+        changed_providers_by_community[community_id] = (
+            changed_providers | get_changed_providers(weights, new_weights)
+            if Decimal(threshold) == new_threshold and not threshold_changed
+            else None
+        )
+
+    return changed_providers_by_community
+
+
+def get_passports_to_rescore(
+    community: Community,
+    providers: Optional[Set[str]] = None,
+    shard: int = 0,
+    num_shards: int = 1,
+) -> QuerySet[Passport]:
+    """
+    Returns the passports of the community. If `providers` is set, only the passports holding
+    stamps from these providers are returned (using the index on `Stamp.provider`).
+    With `num_shards` > 1 only the passports with `id % num_shards == shard` are returned.
+    """
+    passports = Passport.objects.filter(community=community)
+    if num_shards > 1:
+        passports = passports.alias(shard=F("id") % num_shards).filter(shard=shard)
+    if providers is not None:
+        passports = passports.filter(
+            id__in=Stamp.objects.filter(
+                provider__in=providers, passport__community=community
+            ).values("passport_id")
+        )
+    return passports
+
+
+def get_passport_id_ranges(
+    community: Community,
+    batch_size: int,
+    providers: Optional[Set[str]] = None,
+    shard: int = 0,
+    num_shards: int = 1,
+) -> List[tuple]:
+    """
+    Split the passport id space of the community into consecutive (first_id, last_id) ranges
+    of up to `batch_size` passports each. Only the ids are read, using the index.
+    If `providers` is set, only the passports holding stamps from these providers are considered.
+    With `num_shards` > 1 only the passports of the shard are considered (see `get_passports_to_rescore`).
+    """
+    ranges = []
+    first_id = None
+    last_id = None
+    for idx, passport_id in enumerate(
+        get_passports_to_rescore(community, providers, shard, num_shards)
+        .order_by("id")
+        .values_list("id", flat=True)
+        .iterator(chunk_size=10 * batch_size)
+    ):
+        if idx % batch_size == 0:
+            if first_id is not None:
+                ranges.append((first_id, last_id))
+            first_id = passport_id
+        last_id = passport_id
+
+    if first_id is not None:
+        ranges.append((first_id, last_id))
+
+    return ranges
+
+
+def _normalize_json_values(value):
+    """
+    Normalize the values of a JSON dict for comparison: numeric values (stored
+    either as strings or as floats) are compared as Decimals
+    """
+    if not isinstance(value, dict):
+        return value
+
+    ret = {}
+    for k, v in value.items():
+        try:
+            ret[k] = Decimal(str(v))
+        except InvalidOperation:
+            ret[k] = v
+    return ret
+
+
+def is_score_unchanged(score: Score, score_data, evidence: Optional[dict]) -> bool:
+    """
+    Check if the stored `score` already holds the result `score_data` of a rescore
+    """
+    return (
+        score.status == Score.Status.DONE
+        and score.error is None
+        and score.score is not None
+        and Decimal(score.score) == Decimal(score_data.score)
+        and _normalize_json_values(score.evidence) == _normalize_json_values(evidence)
+        and _normalize_json_values(score.stamp_scores)
+        == _normalize_json_values(score_data.stamp_scores)
+    )
+
+
+def get_providers_by_passport(passports: List[Passport], from_stamp_scores: bool):
+    """
+    Returns the stamp providers of each passport.
+
+    With `from_stamp_scores` the providers are taken from the `stamp_scores` of the current
+    score, without loading any stamp. Only for passports without a calculated score or
+    without `stamp_scores` are the providers loaded from the stamps.
+    """
+    providers_by_passport = {}
+    passport_ids_to_load = []
+    for p in passports:
+        passport_scores = list(p.score.all())
+        score = passport_scores[0] if passport_scores else None
+        if (
+            from_stamp_scores
+            and score
+            and score.status == Score.Status.DONE
+            and score.stamp_scores is not None
+        ):
+            providers_by_passport[p.id] = list(score.stamp_scores.keys())
+        else:
+            passport_ids_to_load.append(p.id)
+
+    if passport_ids_to_load:
+        providers_by_passport.update(load_providers_by_passport(passport_ids_to_load))
+
+    return providers_by_passport
+
+
+def deduplicate_passports(community: Community, passports: List[Passport]) -> int:
+    """
+    Run the LIFO deduplication for the stored stamps of the `passports` with one `alifo_batch`,
+    in the order of the passports, and delete the stamps that are claimed by another address.
+    Only the hash, provider and expiration date of the stamps are loaded.
+
+    Returns the number of stamps deleted
+    """
+    stamps_by_address = {p.address: [] for p in passports}
+    address_by_passport_id = {p.id: p.address for p in passports}
+    for stamp_id, passport_id, hash, provider, expiration_date in (
+        Stamp.objects.filter(passport_id__in=address_by_passport_id.keys())
+        .order_by("id")
+        .values_list(
+            "id", "passport_id", "hash", "provider", "credential__expirationDate"
+        )
+    ):
+        stamps_by_address[address_by_passport_id[passport_id]].append(
+            {
+                "id": stamp_id,
+                "provider": provider,
+                "credential": {
+                    "credentialSubject": {"hash": hash, "provider": provider}
+                },
+                "expiration_date": parse_expiration_date(expiration_date),
+            }
+        )
+
+    deduped_passports = async_to_sync(alifo_batch)(
+        community,
+        {address: {"stamps": stamps} for address, stamps in stamps_by_address.items()},
+    )
+
+    kept_stamp_ids = {
+        stamp["id"]
+        for deduped_passport in deduped_passports.values()
+        for stamp in deduped_passport["stamps"]
+    }
+    deduped_stamp_ids = [
+        stamp["id"]
+        for stamps in stamps_by_address.values()
+        for stamp in stamps
+        if stamp["id"] not in kept_stamp_ids
+    ]
+    if deduped_stamp_ids:
+        Stamp.objects.filter(id__in=deduped_stamp_ids).delete()
+    return len(deduped_stamp_ids)
+
+
+def rescore_passport_range(
+    community: Community,
+    scorer,
+    first_id: int,
+    last_id: int,
+    providers: Optional[Set[str]] = None,
+    from_stamp_scores: bool = False,
+    shard: int = 0,
+    num_shards: int = 1,
+    deduplicate: bool = False,
+):
+    """
+    Recalculate and save the scores of the passports of the community with ids in [first_id, last_id].
+    If `providers` is set, only the passports holding stamps from these providers are rescored.
+    With `num_shards` > 1 only the passports of the shard are rescored.
+    With `from_stamp_scores` the scores are recalculated from the providers in the stored
+    `stamp_scores` (see `get_providers_by_passport`).
+    With `deduplicate` the stamps of LIFO communities are deduplicated first
+    (see `deduplicate_passports`).
+    Only the scores that have changed are written.
+
+    Returns a tuple (community_id, number of passports rescored, number of scores changed)
+    """
+    passports = list(
+        get_passports_to_rescore(community, providers, shard, num_shards)
+        .filter(id__gte=first_id, id__lte=last_id)
+        .order_by("id")
+        .only("id", "address")
+        .prefetch_related("score")
+    )
+    passport_ids = [p.id for p in passports]
+    if not passport_ids:
+        return community.pk, 0, 0
+
+    if deduplicate and community.rule == Rules.LIFO.value:
+        deduplicate_passports(community, passports)
+
+    calculated_scores = scorer.compute_score(
+        passport_ids, get_providers_by_passport(passports, from_stamp_scores)
+    )
+    scores_to_update = []
+    scores_to_create = []
+    score_events = ScoreEventBuffer()
+    rescored_addresses = []
+
+    for p, scoreData in zip(passports, calculated_scores):
+        evidence = scoreData.evidence[0].as_dict() if scoreData.evidence else None
+        passport_scores = list(p.score.all())
+        if passport_scores:
+            score = passport_scores[0]
+            if is_score_unchanged(score, scoreData, evidence):
+                continue
+            scores_to_update.append(score)
+        else:
+            score = Score(
+                passport=p,
+            )
+            scores_to_create.append(score)
+
+        score.score = scoreData.score
+        score.status = Score.Status.DONE
+        score.last_score_timestamp = get_utc_time()
+        score.evidence = evidence
+        score.error = None
+        score.stamp_scores = scoreData.stamp_scores
+        score_events.add(score, p.address, community.pk)
+        rescored_addresses.append(p.address)
+
+    # The score history is written with the scores, after them
+    with transaction.atomic():
+        if scores_to_create:
+            Score.objects.bulk_create(scores_to_create)
+
+        if scores_to_update:
+            Score.objects.bulk_update(
+                scores_to_update,
+                [
+                    "score",
+                    "status",
+                    "last_score_timestamp",
+                    "evidence",
+                    "error",
+                    "stamp_scores",
+                ],
+            )
+
+        score_events.flush()
+    invalidate_cached_scores(community.pk, rescored_addresses)
+
+    return (
+        community.pk,
+        len(passports),
+        len(scores_to_create) + len(scores_to_update),
+    )
+
+
+def _rescore_passport_range_task(task):
+    return rescore_passport_range(*task)
+
+
+def _init_rescore_worker():
+    # The connections inherited from the parent process must not be shared,
+    # each worker opens its own DB connection
+    connections.close_all()
+
+
+def recalculate_scores(
+    communities,
+    batch_size,
+    outstream,
+    workers=1,
+    shard=0,
+    num_shards=1,
+    changed_providers_by_community=None,
+    from_stamp_scores=False,
+    deduplicate=False,
+):
+    """
+    Recalculate the scores of all passports in the communities.
+
+    The passport id space of each community is split into ranges of `batch_size` passports.
+    With `num_shards` > 1 only the passports with `id % num_shards == shard` are processed, so that
+    several instances can split the work: the shard of a passport depends only on its id, not on the
+    order of the communities or on the passports created while the instances start.
+    With `workers` > 1 the ranges are processed on a pool of processes.
+    If `changed_providers_by_community` is set, only the passports holding stamps from the changed
+    providers of their community are rescored (see `get_changed_providers_by_community`).
+    With `from_stamp_scores` the scores are recalculated from the stored `stamp_scores`,
+    which is enough for a pure weight change.
+    With `deduplicate` the stored stamps are deduplicated again before rescoring, one batch of
+    passports at a time (see `deduplicate_passports`).
+    The progress is reported in a `RescoreRequest`. With `num_shards` > 1 each instance creates its
+    own `RescoreRequest`, which only reports the progress of its shard.
+    """
     count = 0
     start = datetime.now()
 
@@ -105,78 +574,73 @@ def recalculate_scores(communities, batch_size, outstream):
     rescore_request.save()
 
     try:
-        for idx, community in enumerate(communities):
-            # Reset has_more and last_id for each community
-            has_more = True
-            last_id = 0
+        tasks = []
+        pending_ranges_by_community = {}
+        changed_by_community = {}
+        unchanged_by_community = {}
+        for community in communities:
             scorer = community.get_scorer()
             outstream.write(
                 f"""
 Community:{community}
 scorer type: {scorer.type}, {type(scorer)}"""
             )
+            pending_ranges_by_community[community.pk] = 0
+            changed_by_community[community.pk] = 0
+            unchanged_by_community[community.pk] = 0
 
-            while has_more:
+            providers = None
+            if changed_providers_by_community is not None:
+                providers = changed_providers_by_community.get(community.pk)
                 outstream.write(
-                    f"has more: {has_more} / last id: {last_id} / count: {count}"
+                    f"Changed providers: {sorted(providers) if providers is not None else 'all'}"
+                )
+                if providers is not None and not providers:
+                    continue
+
+            for first_id, last_id in get_passport_id_ranges(
+                community, batch_size, providers, shard, num_shards
+            ):
+                tasks.append(
+                    (
+                        community,
+                        scorer,
+                        first_id,
+                        last_id,
+                        providers,
+                        from_stamp_scores,
+                        shard,
+                        num_shards,
+                        deduplicate,
+                    )
                 )
-                passport_query = Passport.objects.order_by("id").select_related("score")
-                if last_id:
-                    passport_query = passport_query.filter(id__gt=last_id)
-                passport_query = passport_query.filter(community=community)
-                passports = list(passport_query[:batch_size].iterator())
-                passport_ids = [p.id for p in passports]
-                count += len(passports)
-                has_more = len(passports) > 0
-                if len(passports) > 0:
-                    last_id = passport_ids[-1]
-                    stamp_query = Stamp.objects.filter(passport_id__in=passport_ids)
-                    stamps = {}
-                    for s in stamp_query:
-                        if s.passport_id not in stamps:
-                            stamps[s.passport_id] = []
-                        stamps[s.passport_id].append(s)
-                    calculated_scores = scorer.recompute_score(passport_ids, stamps)
-                    scores_to_update = []
-                    scores_to_create = []
-
-                    for p, scoreData in zip(passports, calculated_scores):
-                        passport_scores = list(p.score.all())
-                        if passport_scores:
-                            score = passport_scores[0]
-                            scores_to_update.append(score)
-                        else:
-                            score = Score(
-                                passport=p,
-                            )
-                            scores_to_create.append(score)
-
-                        score.score = scoreData.score
-                        score.status = Score.Status.DONE
-                        score.last_score_timestamp = get_utc_time()
-                        score.evidence = (
-                            scoreData.evidence[0].as_dict()
-                            if scoreData.evidence
-                            else None
-                        )
-                        score.error = None
-                        score.stamp_scores = scoreData.stamp_scores
-
-                    if scores_to_create:
-                        Score.objects.bulk_create(scores_to_create)
-
-                    if scores_to_update:
-                        Score.objects.bulk_update(
-                            scores_to_update,
-                            [
-                                "score",
-                                "status",
-                                "last_score_timestamp",
-                                "evidence",
-                                "error",
-                                "stamp_scores",
-                            ],
-                        )
+                pending_ranges_by_community[community.pk] += 1
+
+        # Communities without any passport ranges in this shard are already done
+        num_communities_processed = sum(
+            1 for pending in pending_ranges_by_community.values() if pending == 0
+        )
+        outstream.write(
+            f"Rescoring {len(tasks)} passport ranges (shard {shard}/{num_shards}, workers: {workers})"
+        )
+
+        if workers > 1:
+            # Don't let the forked workers inherit the open connections
+            connections.close_all()
+            pool = multiprocessing.Pool(workers, initializer=_init_rescore_worker)
+            results = pool.imap_unordered(_rescore_passport_range_task, tasks)
+        else:
+            pool = None
+            results = map(_rescore_passport_range_task, tasks)
+
+        try:
+            for community_id, num_rescored, num_changed in results:
+                count += num_rescored
+                changed_by_community[community_id] += num_changed
+                unchanged_by_community[community_id] += num_rescored - num_changed
+                pending_ranges_by_community[community_id] -= 1
+                if pending_ranges_by_community[community_id] == 0:
+                    num_communities_processed += 1
 
                 elapsed = datetime.now() - start
                 rate = "-"
@@ -185,14 +649,27 @@ scorer type: {scorer.type}, {type(scorer)}"""
 
                 outstream.write(
                     f"""
-Community id: {community}
+Community id: {community_id}
 Elapsed: {elapsed}
 Count: {count}
 Rate: {rate}
+Changed: {changed_by_community[community_id]}
+Unchanged: {unchanged_by_community[community_id]}
 """
                 )
-            rescore_request.num_communities_processed = idx + 1
-            rescore_request.save()
+                rescore_request.num_communities_processed = num_communities_processed
+                rescore_request.num_passports_processed = count
+                rescore_request.save()
+        except BaseException:
+            # Stop the remaining shards instead of waiting for them to finish
+            if pool:
+                pool.terminate()
+                pool.join()
+            raise
+
+        if pool:
+            pool.close()
+            pool.join()
 
     except Exception as e:
         rescore_request.status = RescoreRequest.Status.FAILED
@@ -200,5 +677,7 @@ Rate: {rate}
 
         raise e
 
+    rescore_request.num_communities_processed = num_communities_processed
+    rescore_request.num_passports_processed = count
     rescore_request.status = RescoreRequest.Status.SUCCESS
     rescore_request.save()
@@ -1,7 +1,9 @@
 from account.models import Community
 from ceramic_cache.models import CeramicCache
 from django.core.management.base import BaseCommand
+from reader.passport_reader import invalidate_passport_snapshot
 from registry.models import Passport, Score, Stamp
+from registry.score_cache import invalidate_cached_scores
 from registry.utils import get_utc_time
 
 
@@ -52,6 +54,8 @@ class Command(BaseCommand):
                 address__in=addresses, deleted_at__isnull=True
             )
             ceramic_cache_entries.update(deleted_at=now, updated_at=now)
+            for address in addresses:
+                invalidate_passport_snapshot(address)
 
             passports = Passport.objects.filter(address__in=addresses).order_by(
                 "community"
@@ -136,3 +140,5 @@ class Command(BaseCommand):
                     "stamp_scores",
                 ],
             )
+
+        invalidate_cached_scores(community.pk, [p.address for p in passports])
@@ -1,9 +1,8 @@
 import json
+from typing import List, Optional
 
 from account.models import Community, EthAddressField
 from django.db import models
-from django.db.models.signals import pre_save
-from django.dispatch import receiver
 
 
 class Passport(models.Model):
@@ -79,24 +78,6 @@ class Score(models.Model):
         return f"Score #{self.id}, score={self.score}, last_score_timestamp={self.last_score_timestamp}, status={self.status}, error={self.error}, evidence={self.evidence}, passport_id={self.passport_id}"
 
 
-@receiver(pre_save, sender=Score)
-def score_updated(sender, instance, **kwargs):
-    if instance.status != Score.Status.DONE:
-        return instance
-
-    Event.objects.create(
-        action=Event.Action.SCORE_UPDATE,
-        address=instance.passport.address,
-        community=instance.passport.community,
-        data={
-            "score": float(instance.score) if instance.score != None else 0,
-            "evidence": instance.evidence,
-        },
-    )
-
-    return instance
-
-
 class Event(models.Model):
     # Example usage:
     #   obj.action = Event.Action.FIFO_DEDUPLICATION
@@ -154,6 +135,69 @@ The reason to have this field (and not use the `data` JSON field) is to be able
         ]
 
 
+def build_score_event(score: Score, address: str, community_id: int) -> Optional[Event]:
+    """
+    Returns the SCORE_UPDATE event (the score history) for the score, or None if the score
+    is not DONE. The address and community are passed in, so that nothing is loaded here.
+    """
+    if score.status != Score.Status.DONE:
+        return None
+
+    return Event(
+        action=Event.Action.SCORE_UPDATE,
+        address=address,
+        community_id=community_id,
+        data={
+            "score": float(score.score) if score.score is not None else 0,
+            "evidence": score.evidence,
+        },
+    )
+
+
+def record_score_event(score: Score, address: str, community_id: int) -> None:
+    """
+    Write the SCORE_UPDATE event for a single score. Saving a score does not record its
+    history, this must be called once the score has been saved.
+    """
+    event = build_score_event(score, address, community_id)
+    if event:
+        event.save()
+
+
+async def arecord_score_event(score: Score, address: str, community_id: int) -> None:
+    event = build_score_event(score, address, community_id)
+    if event:
+        await event.asave()
+
+
+class ScoreEventBuffer:
+    """
+    Buffers the SCORE_UPDATE events (the score history) for scores that are written in bulk,
+    and writes them with a single `bulk_create` on flush. Flush only after the scores have
+    been written. Create one buffer per batch of scores.
+    """
+
+    def __init__(self):
+        self.events: List[Event] = []
+
+    def add(self, score: Score, address: str, community_id: int) -> None:
+        event = build_score_event(score, address, community_id)
+        if event:
+            self.events.append(event)
+
+    def flush(self) -> List[Event]:
+        events, self.events = self.events, []
+        if events:
+            Event.objects.bulk_create(events)
+        return events
+
+    async def aflush(self) -> List[Event]:
+        events, self.events = self.events, []
+        if events:
+            await Event.objects.abulk_create(events)
+        return events
+
+
 class HashScorerLink(models.Model):
     hash = models.CharField(null=False, blank=False, max_length=100, db_index=True)
     community = models.ForeignKey(
@@ -0,0 +1,201 @@
+"""
+Rate limiting of the API keys.
+
+Each process keeps a local bucket per API key and rate, and only syncs its request count to Redis in
+batches: every RATELIMIT_SYNC_EVERY requests, every RATELIMIT_SYNC_INTERVAL_MS milliseconds, or on every
+request once the key gets close to its limit. A sync is a single atomic Lua script call, which adds the
+pending requests to the counter of the current window and returns it, together with the counter of the
+previous window. The limit is checked against a sliding window estimate:
+
+    previous window count * (remaining fraction of the previous window) + current window count
+
+The requests that are still pending when a window ends are synced to that window before the next
+one starts. Because the processes sync in batches, the limit can be exceeded by up to RATELIMIT_SYNC_EVERY requests
+per process when many processes serve the same key at the same time.
+
+If Redis is not available, the limit is only enforced on the local counts of each process, unless
+RATELIMIT_FAIL_OPEN is False, in which case all requests are limited.
+"""
+
+import re
+import threading
+import time
+from typing import Optional, Tuple
+
+import api_logging as logging
+from django.conf import settings
+from scorer.local_cache import LocalTTLCache
+
+log = logging.getLogger(__name__)
+
+RATE_RE = re.compile(r"(\d+)/(\d*)([smhd])?")
+
+PERIODS = {
+    "s": 1,
+    "m": 60,
+    "h": 60 * 60,
+    "d": 24 * 60 * 60,
+}
+
+# KEYS: the counter of the current window, the counter of the previous window
+# ARGV: the number of requests to add, the expiration of the counter in seconds
+SYNC_SCRIPT = """
+local current = redis.call("INCRBY", KEYS[1], ARGV[1])
+if current == tonumber(ARGV[1]) then
+    redis.call("EXPIRE", KEYS[1], ARGV[2])
+end
+local previous = tonumber(redis.call("GET", KEYS[2]) or "0")
+return {current, previous}
+"""
+
+
+def parse_rate(rate: str) -> Tuple[int, int]:
+    """
+    Parse a rate like "125/15m" or "3/30seconds" (the format of django_ratelimit)
+    into the tuple (limit, period in seconds)
+    """
+    match = RATE_RE.match(rate)
+    if not match:
+        raise ValueError(f"Invalid rate '{rate}'")
+
+    count, multi, period = match.groups()
+    seconds = PERIODS[(period or "s").lower()]
+    if multi:
+        seconds = seconds * int(multi)
+    return int(count), seconds
+
+
+class RateLimitBucket:
+    """
+    The local state of the rate limit of one key in this process
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.window = None
+        # The counts of the current and previous windows, as last returned by Redis
+        self.count = 0
+        self.previous_count = 0
+        # The requests of this process that have not been synced to Redis yet
+        self.pending = 0
+        self.last_sync = 0.0
+
+
+class RateLimiter:
+    def __init__(self, redis_client=None):
+        self._redis = redis_client
+        self._sync_script = None
+        self._buckets = LocalTTLCache(maxsize=settings.RATELIMIT_LOCAL_BUCKETS)
+        self._buckets_lock = threading.Lock()
+
+    @property
+    def redis(self):
+        if self._redis is None:
+            import redis
+
+            self._redis = redis.Redis.from_url(
+                settings.RATELIMIT_REDIS_URL,
+                socket_timeout=settings.RATELIMIT_REDIS_TIMEOUT,
+                socket_connect_timeout=settings.RATELIMIT_REDIS_TIMEOUT,
+            )
+        return self._redis
+
+    def _sync(self, key: str, period: int, window: int, pending: int):
+        if self._sync_script is None:
+            self._sync_script = self.redis.register_script(SYNC_SCRIPT)
+
+        count, previous_count = self._sync_script(
+            keys=[f"{key}:{period}:{window}", f"{key}:{period}:{window - 1}"],
+            args=[pending, 2 * period],
+        )
+        return int(count), int(previous_count)
+
+    def _get_bucket(self, key: str, period: int) -> RateLimitBucket:
+        # The TTL is refreshed on every request, so that a bucket with pending requests
+        # does not expire while the key is in use
+        bucket = self._buckets.get(key, ttl=2 * period)
+        if bucket is None:
+            with self._buckets_lock:
+                bucket = self._buckets.get(key, ttl=2 * period)
+                if bucket is None:
+                    bucket = RateLimitBucket()
+                    self._buckets.set(key, bucket, 2 * period)
+        return bucket
+
+    def is_ratelimited(self, key: str, rate: str, now: Optional[float] = None) -> bool:
+        """
+        Count one request for the key, and check if it exceeds the rate
+        """
+        limit, period = parse_rate(rate)
+        key = f"ratelimit:{key}"
+        now = time.time() if now is None else now
+        window = int(now // period)
+        previous_weight = 1 - (now - window * period) / period
+
+        bucket = self._get_bucket(f"{key}:{period}", period)
+        with bucket.lock:
+            if bucket.window != window:
+                # The counts of the window that has just ended are used for the sliding window,
+                # the first request of the new window always syncs
+                bucket.previous_count = 0
+                if bucket.window == window - 1:
+                    bucket.previous_count = bucket.count + bucket.pending
+                    if bucket.pending:
+                        # The requests that are still pending are added to the window in which
+                        # they were made, which the other processes read as the previous window
+                        try:
+                            bucket.previous_count, _ = self._sync(
+                                key, period, bucket.window, bucket.pending
+                            )
+                        except Exception:
+                            log.warning("Failed to sync the rate limit", exc_info=True)
+                bucket.window = window
+                bucket.count = 0
+                bucket.pending = 0
+                bucket.last_sync = 0.0
+
+            bucket.pending += 1
+            estimate = (
+                bucket.previous_count * previous_weight + bucket.count + bucket.pending
+            )
+
+            if (
+                bucket.pending >= settings.RATELIMIT_SYNC_EVERY
+                or (now - bucket.last_sync) * 1000
+                >= settings.RATELIMIT_SYNC_INTERVAL_MS
+                or estimate + settings.RATELIMIT_SYNC_EVERY > limit
+            ):
+                try:
+                    bucket.count, bucket.previous_count = self._sync(
+                        key, period, window, bucket.pending
+                    )
+                    bucket.pending = 0
+                    bucket.last_sync = now
+                except Exception:
+                    log.warning("Failed to sync the rate limit", exc_info=True)
+                    # The pending requests are kept and synced with a later request
+                    bucket.last_sync = now
+                    if not settings.RATELIMIT_FAIL_OPEN:
+                        return True
+
+                estimate = (
+                    bucket.previous_count * previous_weight
+                    + bucket.count
+                    + bucket.pending
+                )
+
+            return estimate > limit
+
+
+rate_limiter = RateLimiter()
+
+
+def is_ratelimited(key: str, rate: str) -> bool:
+    """
+    Count one request for the key, and check if it exceeds the rate. Always False if
+    rate limiting is disabled (RATELIMIT_ENABLE) or the rate is empty (unlimited)
+    """
+    if not settings.RATELIMIT_ENABLE or not rate:
+        return False
+
+    return rate_limiter.is_ratelimited(key, rate)
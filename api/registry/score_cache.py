@@ -0,0 +1,124 @@
+"""
+Read-through cache of the scores returned by the GET score endpoints, keyed by (community, address).
+
+The scoring paths write the score to the cache once it is saved (see `set_cached_score`), and the
+rescoring paths invalidate it (see `invalidate_cached_scores`), so that polling for a score while it
+is being processed does not query the DB for every request.
+"""
+
+from decimal import Decimal
+from typing import Iterable, Optional
+
+import api_logging as logging
+from django.conf import settings
+from django.core.cache import cache
+from registry.api.schema import DetailedScoreResponse
+from registry.models import Score
+
+log = logging.getLogger(__name__)
+
+# Cached for addresses that have no score in the community
+SCORE_NOT_FOUND = "NOT_FOUND"
+
+# The scores are cached in the format in which they are read from the DB, so that the
+# response does not depend on whether it is served from the cache
+SCORE_QUANTUM = Decimal(10) ** -Score._meta.get_field("score").decimal_places
+
+
+def get_score_cache_key(community_id: int, address: str) -> str:
+    return f"score:{community_id}:{address.lower()}"
+
+
+def get_score_cache_value(response: DetailedScoreResponse) -> dict:
+    value = response.dict()
+    if value["score"] is not None:
+        value["score"] = str(Decimal(value["score"]).quantize(SCORE_QUANTUM))
+    return value
+
+
+def get_cached_score(community_id: int, address: str) -> Optional[dict | str]:
+    """
+    Returns the cached `DetailedScoreResponse` (as dict), SCORE_NOT_FOUND for an address
+    that is known to have no score, or None
+    """
+    try:
+        return cache.get(get_score_cache_key(community_id, address))
+    except Exception:
+        log.warning("Failed to read score cache", exc_info=True)
+        return None
+
+
+def add_cached_score(community_id: int, address: str, response: DetailedScoreResponse):
+    """
+    Cache the score read from the DB. This does not overwrite an existing entry, so that a score
+    that has just been written by the scoring path is not replaced by an older read
+    """
+    try:
+        cache.add(
+            get_score_cache_key(community_id, address),
+            get_score_cache_value(response),
+            settings.SCORE_CACHE_TTL,
+        )
+    except Exception:
+        log.warning("Failed to write score cache", exc_info=True)
+
+
+def add_cached_score_not_found(community_id: int, address: str):
+    if settings.SCORE_NOT_FOUND_CACHE_TTL > 0:
+        try:
+            cache.add(
+                get_score_cache_key(community_id, address),
+                SCORE_NOT_FOUND,
+                settings.SCORE_NOT_FOUND_CACHE_TTL,
+            )
+        except Exception:
+            log.warning("Failed to write score cache", exc_info=True)
+
+
+def set_cached_score(community_id: int, address: str, response: DetailedScoreResponse):
+    """
+    Cache the score after it has been saved by the scoring path
+    """
+    try:
+        cache.set(
+            get_score_cache_key(community_id, address),
+            get_score_cache_value(response),
+            settings.SCORE_CACHE_TTL,
+        )
+    except Exception:
+        log.warning("Failed to write score cache", exc_info=True)
+
+
+async def aset_cached_score(
+    community_id: int, address: str, response: DetailedScoreResponse
+):
+    try:
+        await cache.aset(
+            get_score_cache_key(community_id, address),
+            get_score_cache_value(response),
+            settings.SCORE_CACHE_TTL,
+        )
+    except Exception:
+        log.warning("Failed to write score cache", exc_info=True)
+
+
+def invalidate_cached_scores(community_id: int, addresses: Iterable[str]):
+    """
+    Remove the cached scores, this must be called whenever scores are written without
+    `set_cached_score`, for example when they are rescored in bulk
+    """
+    keys = [get_score_cache_key(community_id, address) for address in addresses]
+    if keys:
+        try:
+            cache.delete_many(keys)
+        except Exception:
+            log.warning("Failed to invalidate score cache", exc_info=True)
+
+
+async def ainvalidate_cached_scores(community_id: int, addresses: Iterable[str]):
+    keys = [get_score_cache_key(community_id, address) for address in addresses]
+    if keys:
+        try:
+            await cache.adelete_many(keys)
+        except Exception:
+            log.warning("Failed to invalidate score cache", exc_info=True)
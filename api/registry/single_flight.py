@@ -0,0 +1,136 @@
+"""
+Single-flight coalescing of concurrent calls: while a call for a key is in flight, further calls
+for the same key wait for it and share its result (or exception) instead of running again.
+
+Calls are coalesced within the process, also across event loops (for example the loops created by
+`async_to_sync`). With SINGLE_FLIGHT_SHARED the calls are also coalesced across processes: the
+process that runs the call holds a lock in the Django cache and stores the result there, and the
+other processes wait for that result. If the call fails in the other process, or no result
+arrives within SINGLE_FLIGHT_TIMEOUT, the waiting process runs the call itself.
+"""
+
+import asyncio
+import concurrent.futures
+import threading
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+import api_logging as logging
+from django.conf import settings
+from django.core.cache import cache
+
+log = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._in_flight: Dict[Hashable, concurrent.futures.Future] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._in_flight)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run `fn` for the key, unless a call for the key is already in flight, and return its result
+        """
+        while True:
+            with self._lock:
+                future = self._in_flight.get(key)
+                is_leader = future is None
+                if is_leader:
+                    future = concurrent.futures.Future()
+                    self._in_flight[key] = future
+
+            if is_leader:
+                return await self._lead(key, future, fn)
+
+            try:
+                return await asyncio.shield(asyncio.wrap_future(future))
+            except asyncio.CancelledError:
+                if future.cancelled():
+                    # The call in flight was cancelled, not this one, try again
+                    continue
+                raise
+
+    async def _lead(
+        self,
+        key: Hashable,
+        future: concurrent.futures.Future,
+        fn: Callable[[], Awaitable[Any]],
+    ) -> Any:
+        try:
+            if settings.SINGLE_FLIGHT_SHARED:
+                result = await self._run_shared(key, fn)
+            else:
+                result = await fn()
+        except BaseException as e:
+            self._forget(key)
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+            raise
+
+        self._forget(key)
+        future.set_result(result)
+        return result
+
+    def _forget(self, key: Hashable):
+        with self._lock:
+            self._in_flight.pop(key, None)
+
+    def _get_lock_key(self, key: Hashable) -> str:
+        if isinstance(key, tuple):
+            key = ":".join(str(k) for k in key)
+        return f"single_flight:{self.name}:{key}"
+
+    async def _run_shared(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        lock_key = self._get_lock_key(key)
+        token = uuid.uuid4().hex
+        timeout = settings.SINGLE_FLIGHT_TIMEOUT
+
+        try:
+            acquired = await cache.aadd(lock_key, token, timeout)
+            leader_token = None if acquired else await cache.aget(lock_key)
+        except Exception:
+            log.warning("Failed to acquire single flight lock", exc_info=True)
+            return await fn()
+
+        if acquired:
+            try:
+                result = await fn()
+                try:
+                    await cache.aset(f"{lock_key}:{token}", result, timeout)
+                except Exception:
+                    log.warning("Failed to share single flight result", exc_info=True)
+                return result
+            finally:
+                try:
+                    if await cache.aget(lock_key) == token:
+                        await cache.adelete(lock_key)
+                except Exception:
+                    log.warning("Failed to release single flight lock", exc_info=True)
+
+        # Another process is running the call, wait for its result
+        if leader_token is not None:
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + timeout
+            poll_interval = settings.SINGLE_FLIGHT_POLL_INTERVAL_MS / 1000
+            try:
+                while loop.time() < deadline:
+                    await asyncio.sleep(poll_interval)
+                    result = await cache.aget(f"{lock_key}:{leader_token}")
+                    if result is not None:
+                        return result
+                    if await cache.aget(lock_key) != leader_token:
+                        # The call has finished without result, or the lock has expired
+                        result = await cache.aget(f"{lock_key}:{leader_token}")
+                        if result is not None:
+                            return result
+                        break
+            except Exception:
+                log.warning("Failed to wait for single flight result", exc_info=True)
+
+        return await fn()
@@ -1,11 +1,13 @@
 import api_logging as logging
-from account.models import AccountAPIKeyAnalytics
 from asgiref.sync import async_to_sync
 from celery import shared_task
 from django.conf import settings
-from registry.models import Passport, Score
+from registry.api.schema import DetailedScoreResponse
+from registry.models import Passport, Score, record_score_event
+from registry.score_cache import set_cached_score
 
-from .atasks import ascore_passport, sensitive_headers_data
+from .api_analytics import api_analytics_queue, build_api_key_analytics
+from .atasks import ascore_passport
 
 log = logging.getLogger(__name__)
 
@@ -22,23 +24,23 @@ def save_api_key_analytics(
     response_skipped,
     error,
 ):
+    """
+    Queue the analytics record, it is written to the DB in batches (see `ApiAnalyticsQueue`)
+    """
     try:
         if settings.FF_API_ANALYTICS == "on":
-            cleaned_headers = dict(headers)
-            for sensitive_field in sensitive_headers_data:
-                if sensitive_field in cleaned_headers:
-                    cleaned_headers[sensitive_field] = "***"
-
-            AccountAPIKeyAnalytics.objects.create(
-                api_key_id=api_key_id,
-                path=path,
-                path_segments=path_segments,
-                query_params=query_params,
-                payload=payload,
-                headers=cleaned_headers,
-                response=response,
-                response_skipped=response_skipped,
-                error=error,
+            api_analytics_queue.enqueue(
+                build_api_key_analytics(
+                    api_key_id=api_key_id,
+                    path=path,
+                    path_segments=path_segments,
+                    query_params=query_params,
+                    headers=headers,
+                    payload=payload,
+                    response=response,
+                    response_skipped=response_skipped,
+                    error=error,
+                )
             )
 
     except Exception as e:
@@ -80,6 +82,11 @@ def score_passport(community_id: int, address: str):
     async_to_sync(ascore_passport)(passport.community, passport, address, score)
 
     score.save()
+    record_score_event(score, passport.address, community_id)
+
+    set_cached_score(
+        community_id, passport.address, DetailedScoreResponse.from_orm(score)
+    )
 
 
 def load_passport_record(community_id: int, address: str) -> Passport | None:
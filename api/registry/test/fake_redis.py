@@ -0,0 +1,30 @@
+"""
+In-memory stand-in for the Redis client used by `registry.ratelimit`
+"""
+
+import redis
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+        self.expirations = {}
+        self.num_script_calls = 0
+        self.fail = False
+
+    def register_script(self, script):
+        def run_sync_script(keys, args):
+            # Same as registry.ratelimit.SYNC_SCRIPT
+            self.num_script_calls += 1
+            if self.fail:
+                raise redis.ConnectionError("Redis is down")
+
+            current_key, previous_key = keys
+            increment, expiration = int(args[0]), int(args[1])
+            current = self.data.get(current_key, 0) + increment
+            self.data[current_key] = current
+            if current == increment:
+                self.expirations[current_key] = expiration
+            return [current, self.data.get(previous_key, 0)]
+
+        return run_sync_script
@@ -0,0 +1,113 @@
+import threading
+from unittest.mock import patch
+
+import pytest
+from account.models import AccountAPIKey, AccountAPIKeyAnalytics
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from registry.api_analytics import ApiAnalyticsQueue, build_api_key_analytics
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def api_key(scorer_account):
+    (model, _) = AccountAPIKey.objects.create_key(
+        account=scorer_account, name="Token for user 1"
+    )
+    return model
+
+
+def build_record(api_key, path="/registry/score/1", response=None):
+    return build_api_key_analytics(
+        api_key_id=api_key.pk,
+        path=path,
+        path_segments=path.split("/")[1:],
+        query_params={},
+        headers={"X-Api-Key": "secret", "Accept": "application/json"},
+        payload=None,
+        response=response,
+        response_skipped=response is None,
+        error=None,
+    )
+
+
+def test_records_are_written_in_batches(api_key, settings):
+    settings.API_ANALYTICS_FLUSH_SIZE = 3
+    queue = ApiAnalyticsQueue()
+
+    queue.enqueue(build_record(api_key))
+    queue.enqueue(build_record(api_key, response='{"score": "1"}'))
+    assert AccountAPIKeyAnalytics.objects.count() == 0
+    assert len(queue) == 2
+
+    with CaptureQueriesContext(connection) as queries:
+        queue.enqueue(build_record(api_key))
+    inserts = [q for q in queries.captured_queries if q["sql"].startswith("INSERT")]
+    assert len(inserts) == 1
+
+    assert AccountAPIKeyAnalytics.objects.count() == 3
+    assert queue.stats() == {"queued": 0, "written": 3, "dropped": 0, "failed": 0}
+
+    record = AccountAPIKeyAnalytics.objects.get(response__isnull=False)
+    # The sensitive headers are masked
+    assert record.response == '{"score": "1"}'
+    assert record.headers == {"X-Api-Key": "***", "Accept": "application/json"}
+
+
+def test_records_are_dropped_when_the_queue_is_full(api_key, settings):
+    settings.API_ANALYTICS_FLUSH_SIZE = 100
+    settings.API_ANALYTICS_QUEUE_SIZE = 2
+    queue = ApiAnalyticsQueue()
+
+    for _ in range(5):
+        queue.enqueue(build_record(api_key))
+
+    assert queue.stats() == {"queued": 2, "written": 0, "dropped": 3, "failed": 0}
+    assert queue.flush() == 2
+    assert AccountAPIKeyAnalytics.objects.count() == 2
+
+
+def test_failed_records_are_counted(api_key, settings):
+    settings.API_ANALYTICS_FLUSH_SIZE = 100
+    queue = ApiAnalyticsQueue()
+    queue.enqueue(build_record(api_key))
+
+    with patch(
+        "registry.api_analytics.AccountAPIKeyAnalytics.objects.bulk_create",
+        side_effect=Exception("DB is down"),
+    ):
+        queue.flush()
+
+    assert queue.stats() == {"queued": 0, "written": 0, "dropped": 0, "failed": 1}
+
+
+def test_only_the_records_that_cannot_be_written_are_lost(api_key, settings):
+    settings.API_ANALYTICS_FLUSH_SIZE = 100
+    queue = ApiAnalyticsQueue()
+    queue.enqueue(build_record(api_key, path="/registry/score/1"))
+    # Not JSON serializable
+    queue.enqueue(build_record(api_key, response=object()))
+    queue.enqueue(build_record(api_key, path="/registry/score/2"))
+
+    assert queue.flush() == 3
+
+    assert queue.stats() == {"queued": 0, "written": 2, "dropped": 0, "failed": 1}
+    assert sorted(AccountAPIKeyAnalytics.objects.values_list("path", flat=True)) == [
+        "/registry/score/1",
+        "/registry/score/2",
+    ]
+
+
+def test_background_writer_flushes_the_queue(api_key, settings):
+    settings.API_ANALYTICS_BACKGROUND_FLUSH = True
+    settings.API_ANALYTICS_FLUSH_INTERVAL_MS = 10
+    queue = ApiAnalyticsQueue()
+    flushed = threading.Event()
+
+    with patch.object(queue, "flush", side_effect=flushed.set) as mock_flush:
+        queue.enqueue(build_record(api_key))
+        # The request itself does not write
+        assert len(queue) == 1
+        assert flushed.wait(5)
+        assert mock_flush.called
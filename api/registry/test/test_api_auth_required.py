@@ -1,8 +1,13 @@
 # content of conftest.py
 import pytest
+from account.api_key_cache import build_cached_api_key, get_cached_api_key
 from account.models import Account, AccountAPIKey
 from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Model
 from django.test import Client
+from django.test.utils import CaptureQueriesContext
 from web3 import Web3
 
 pytestmark = pytest.mark.django_db
@@ -121,3 +126,174 @@ def test_authentication_works_with_api_key(api_path_that_requires_auth, scorer_u
     # We should not get back any unauuthorized or forbidden errors
     assert response.status_code != 401
     assert response.status_code != 403
+
+
+@pytest.fixture
+def local_memory_cache(settings):
+    settings.CACHES = {
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+    }
+    cache.clear()
+    yield
+    cache.clear()
+
+
+@pytest.mark.parametrize(
+    "method,path",
+    [
+        # Authenticated by the sync `ApiKey`
+        ("get", "/registry/signing-message"),
+        # Authenticated by the async `aapi_key`
+        ("post", "/registry/submit-passport"),
+    ],
+)
+def test_authenticated_api_key_is_cached(
+    method, path, scorer_user, local_memory_cache, mocker
+):
+    """
+    Test that the slow key verification only runs once while the key is cached,
+    and that a revoked key is rejected immediately
+    """
+    client = Client()
+    method_fn = client.post if method == "post" else client.get
+
+    web3_account = web3.eth.account.from_mnemonic(
+        my_mnemonic, account_path="m/44'/60'/0'/0/0"
+    )
+    account = Account.objects.create(user=scorer_user, address=web3_account.address)
+    (api_key, secret) = AccountAPIKey.objects.create_key(
+        account=account, name="Token for user 1"
+    )
+
+    is_valid = mocker.spy(AccountAPIKey, "is_valid")
+    for _ in range(3):
+        response = method_fn(path, HTTP_X_API_KEY=secret)
+        assert response.status_code not in [401, 403]
+    assert is_valid.call_count == 1
+
+    # Revoking the key invalidates the cache
+    api_key.revoked = True
+    api_key.save()
+
+    response = method_fn(path, HTTP_X_API_KEY=secret)
+    assert response.status_code == 401
+
+    # A bad key is never authenticated from the cache
+    response = method_fn(path, HTTP_X_API_KEY=secret + "x")
+    assert response.status_code == 401
+
+
+@pytest.mark.parametrize(
+    "revoke",
+    [
+        # For example the bulk revocation of keys
+        lambda api_keys: api_keys.update(revoked=True),
+        # For example the bulk delete in the admin
+        lambda api_keys: api_keys.delete(),
+    ],
+)
+def test_cached_api_key_is_invalidated_by_queryset_changes(
+    revoke, scorer_user, local_memory_cache
+):
+    client = Client()
+    web3_account = web3.eth.account.from_mnemonic(
+        my_mnemonic, account_path="m/44'/60'/0'/0/0"
+    )
+    account = Account.objects.create(user=scorer_user, address=web3_account.address)
+    (_, secret) = AccountAPIKey.objects.create_key(
+        account=account, name="Token for user 1"
+    )
+
+    response = client.get("/registry/signing-message", HTTP_X_API_KEY=secret)
+    assert response.status_code == 200
+
+    revoke(AccountAPIKey.objects.filter(account=account))
+
+    response = client.get("/registry/signing-message", HTTP_X_API_KEY=secret)
+    assert response.status_code == 401
+
+
+def test_cached_api_key_authenticates_without_queries(scorer_user, local_memory_cache):
+    """
+    Test that the user is set on the request from the cache, without loading it
+    """
+    client = Client()
+    web3_account = web3.eth.account.from_mnemonic(
+        my_mnemonic, account_path="m/44'/60'/0'/0/0"
+    )
+    account = Account.objects.create(user=scorer_user, address=web3_account.address)
+    (_, secret) = AccountAPIKey.objects.create_key(
+        account=account, name="Token for user 1"
+    )
+    client.get("/registry/signing-message", HTTP_X_API_KEY=secret)
+
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get("/registry/signing-message", HTTP_X_API_KEY=secret)
+        user = response.wsgi_request.user
+        assert user.pk == scorer_user.pk
+        assert user.username == scorer_user.username
+        assert user.is_active and not user.is_superuser
+
+    assert response.status_code == 200
+    assert not [q for q in queries.captured_queries if "auth_user" in q["sql"]]
+
+
+def test_cached_api_key_stores_only_plain_fields(scorer_user, local_memory_cache):
+    """
+    Test that the cache holds plain values, and never the hashed key
+    """
+    web3_account = web3.eth.account.from_mnemonic(
+        my_mnemonic, account_path="m/44'/60'/0'/0/0"
+    )
+    account = Account.objects.create(user=scorer_user, address=web3_account.address)
+    (api_key, secret) = AccountAPIKey.objects.create_key(
+        account=account, name="Token for user 1"
+    )
+    Client().get("/registry/signing-message", HTTP_X_API_KEY=secret)
+
+    cached = get_cached_api_key(secret)
+    assert cached["api_key"]["id"] == api_key.id
+    assert "hashed_key" not in cached["api_key"]
+    assert cached["account"] == {
+        "id": account.id,
+        "address": account.address,
+        "user_id": scorer_user.id,
+    }
+    assert cached["user"]["id"] == scorer_user.id
+    for entry in cached.values():
+        assert all(not isinstance(value, Model) for value in entry.values())
+
+    cached_api_key, cached_account, cached_user = build_cached_api_key(cached)
+    assert cached_api_key.pk == api_key.pk
+    assert cached_api_key.read_scores == api_key.read_scores
+    assert cached_account.pk == account.pk
+    assert cached_user.pk == scorer_user.pk
+
+
+def test_cached_api_key_is_invalidated_by_user_and_account_changes(
+    scorer_user, local_memory_cache
+):
+    client = Client()
+    web3_account = web3.eth.account.from_mnemonic(
+        my_mnemonic, account_path="m/44'/60'/0'/0/0"
+    )
+    account = Account.objects.create(user=scorer_user, address=web3_account.address)
+    (_, secret) = AccountAPIKey.objects.create_key(
+        account=account, name="Token for user 1"
+    )
+    client.get("/registry/signing-message", HTTP_X_API_KEY=secret)
+    assert get_cached_api_key(secret) is not None
+
+    # Saving fields that are not cached, like on login, keeps the cached key
+    scorer_user.save(update_fields=["last_login"])
+    assert get_cached_api_key(secret) is not None
+
+    scorer_user.is_active = False
+    scorer_user.save()
+    assert get_cached_api_key(secret) is None
+
+    client.get("/registry/signing-message", HTTP_X_API_KEY=secret)
+    assert get_cached_api_key(secret)["user"]["is_active"] is False
+
+    account.save()
+    assert get_cached_api_key(secret) is None
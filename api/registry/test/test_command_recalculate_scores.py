@@ -1,16 +1,70 @@
 import json
+import pickle
+import sys
+from unittest import mock
 
 import pytest
 from account.models import Community
 from django.conf import settings
-from django.core.management import call_command
+from django.core.management import CommandError, call_command
+from django.db import connection
 from django.test import override_settings
-from registry.models import Passport, Score, Stamp
+from django.test.utils import CaptureQueriesContext
+from registry.management.commands.recalculate_scores import (
+    get_changed_providers,
+    get_changed_providers_by_community,
+    get_passport_id_ranges,
+    recalculate_scores,
+)
+from registry.models import Event, HashScorerLink, Passport, Score, Stamp
+from scorer_weighted.models import RescoreRequest
 
 pytestmark = pytest.mark.django_db
 
 current_weights = settings.GITCOIN_PASSPORT_WEIGHTS
 
+# The weights of the scorer fixtures
+previous_weights = {"FirstEthTxnProvider": 1, "Google": 1, "Ens": 1}
+changed_ens_weights = {"FirstEthTxnProvider": 1, "Google": 1, "Ens": 10}
+
+
+class InProcessPool:
+    """
+    Stands in for `multiprocessing.Pool` in the tests: the in-memory test DB is not shared
+    with forked processes. The tasks and results are pickled like they are for a process
+    pool, and the results are returned in reverse order, like `imap_unordered` may
+    """
+
+    def __init__(self):
+        self.processes = None
+        self.num_initialized = 0
+        self.num_tasks = 0
+        self.closed = False
+        self.terminated = False
+        self.joined = False
+
+    def create(self, processes, initializer=None):
+        self.processes = processes
+        if initializer:
+            initializer()
+            self.num_initialized += 1
+        return self
+
+    def imap_unordered(self, func, iterable):
+        tasks = [pickle.loads(pickle.dumps(task)) for task in iterable]
+        self.num_tasks = len(tasks)
+        for task in reversed(tasks):
+            yield pickle.loads(pickle.dumps(func(task)))
+
+    def close(self):
+        self.closed = True
+
+    def terminate(self):
+        self.terminated = True
+
+    def join(self):
+        self.joined = True
+
 
 @pytest.fixture(name="binary_weighted_scorer_passports")
 def fixture_binaty_weighted_scorer_passports(
@@ -487,3 +541,426 @@ class TestRecalculatScores:
         print(captured.out)
         assert "Updated scorers: 2" in captured.out
         assert "Recalculating scores" not in captured.out
+
+    def test_passport_id_ranges(
+        self, weighted_scorer_passports, scorer_community_with_weighted_scorer
+    ):
+        """Test that the passport id space is split into ranges of batch_size passports"""
+        ids = [p.id for p in weighted_scorer_passports]
+
+        assert get_passport_id_ranges(scorer_community_with_weighted_scorer, 2) == [
+            (ids[0], ids[1]),
+            (ids[2], ids[2]),
+        ]
+        assert get_passport_id_ranges(scorer_community_with_weighted_scorer, 5) == [
+            (ids[0], ids[2])
+        ]
+
+    def test_rescoring_shards(
+        self,
+        weighted_scorer_passports,
+        binary_weighted_scorer_passports,
+        scorer_community_with_weighted_scorer,
+        scorer_community_with_binary_scorer,
+    ):
+        """Test that the shards split the passports between them, without overlap"""
+        all_passports = weighted_scorer_passports + binary_weighted_scorer_passports
+
+        rescored_passport_ids = []
+        for shard in range(3):
+            call_command("recalculate_scores", batch_size=1, shard=f"{shard}/3")
+
+            shard_passport_ids = set(
+                Score.objects.values_list("passport_id", flat=True)
+            ) - set(rescored_passport_ids)
+            # 6 passports in ranges of 1, split between 3 shards
+            assert len(shard_passport_ids) == 2
+            rescored_passport_ids.extend(shard_passport_ids)
+
+            rescore_request = RescoreRequest.objects.latest("id")
+            assert rescore_request.status == RescoreRequest.Status.SUCCESS
+            assert rescore_request.num_communities_requested == 2
+            assert rescore_request.num_communities_processed == 2
+            assert rescore_request.num_passports_processed == 2
+
+        assert sorted(rescored_passport_ids) == sorted(p.id for p in all_passports)
+
+    def test_rescoring_shards_do_not_depend_on_community_order(
+        self,
+        weighted_scorer_passports,
+        binary_weighted_scorer_passports,
+        scorer_community_with_weighted_scorer,
+        scorer_community_with_binary_scorer,
+    ):
+        """Test that the passports of a shard depend only on their id"""
+        all_passports = weighted_scorer_passports + binary_weighted_scorer_passports
+
+        rescored_passport_ids = []
+        for shard, order in enumerate(["id", "-id", "id"]):
+            recalculate_scores(
+                Community.objects.order_by(order),
+                1,
+                sys.stdout,
+                shard=shard,
+                num_shards=3,
+            )
+
+            shard_passport_ids = set(
+                Score.objects.values_list("passport_id", flat=True)
+            ) - set(rescored_passport_ids)
+            assert shard_passport_ids == {
+                p.id for p in all_passports if p.id % 3 == shard
+            }
+            rescored_passport_ids.extend(shard_passport_ids)
+
+        assert sorted(rescored_passport_ids) == sorted(p.id for p in all_passports)
+
+    def test_rescoring_with_workers(
+        self,
+        mocker,
+        weighted_scorer_passports,
+        binary_weighted_scorer_passports,
+        scorer_community_with_weighted_scorer,
+        scorer_community_with_binary_scorer,
+        capsys,
+    ):
+        """Test rescoring on a pool of workers, with the results arriving in any order"""
+        pool = InProcessPool()
+        mocker.patch(
+            "registry.management.commands.recalculate_scores.multiprocessing.Pool",
+            side_effect=pool.create,
+        )
+
+        call_command("recalculate_scores", batch_size=1, workers=2)
+
+        assert pool.processes == 2
+        assert pool.num_initialized == 1
+        assert pool.closed and pool.joined
+        # 6 passports in ranges of 1
+        assert pool.num_tasks == 6
+
+        assert Score.objects.filter(status=Score.Status.DONE).count() == 6
+        assert [
+            s.score
+            for s in Score.objects.filter(
+                passport__in=weighted_scorer_passports
+            ).order_by("passport_id")
+        ] == [1, 2, 3]
+
+        rescore_request = RescoreRequest.objects.latest("id")
+        assert rescore_request.status == RescoreRequest.Status.SUCCESS
+        assert rescore_request.num_communities_processed == 2
+        assert rescore_request.num_passports_processed == 6
+        assert "Changed: 3" in capsys.readouterr().out
+
+    def test_rescoring_with_workers_terminates_the_pool_on_error(
+        self,
+        mocker,
+        weighted_scorer_passports,
+        scorer_community_with_weighted_scorer,
+    ):
+        """Test that the remaining shards are not waited for when a worker fails"""
+        pool = InProcessPool()
+        mocker.patch(
+            "registry.management.commands.recalculate_scores.multiprocessing.Pool",
+            side_effect=pool.create,
+        )
+        mocker.patch(
+            "registry.management.commands.recalculate_scores._rescore_passport_range_task",
+            side_effect=Exception("worker failed"),
+        )
+
+        with pytest.raises(Exception, match="worker failed"):
+            call_command("recalculate_scores", batch_size=1, workers=2)
+
+        assert pool.terminated and pool.joined
+        assert not pool.closed
+        assert (
+            RescoreRequest.objects.latest("id").status == RescoreRequest.Status.FAILED
+        )
+
+    def test_invalid_shard(self):
+        with pytest.raises(CommandError):
+            call_command("recalculate_scores", shard="3/3")
+
+        with pytest.raises(CommandError):
+            call_command("recalculate_scores", shard="one")
+
+    def test_rescoring_skips_unchanged_scores(
+        self,
+        weighted_scorer_passports,
+        scorer_community_with_weighted_scorer,
+        capsys,
+    ):
+        """Test that only the scores that have changed are written again"""
+        call_command("recalculate_scores")
+        timestamps = dict(
+            Score.objects.values_list("passport_id", "last_score_timestamp")
+        )
+        num_events = Event.objects.filter(action=Event.Action.SCORE_UPDATE).count()
+        assert num_events == 3
+        capsys.readouterr()
+
+        # Nothing has changed
+        call_command("recalculate_scores")
+        captured = capsys.readouterr()
+        assert "Changed: 0" in captured.out
+        assert "Unchanged: 3" in captured.out
+        assert (
+            dict(Score.objects.values_list("passport_id", "last_score_timestamp"))
+            == timestamps
+        )
+        assert (
+            Event.objects.filter(action=Event.Action.SCORE_UPDATE).count() == num_events
+        )
+
+        # Only the passports with an Ens stamp are affected by the new weight
+        scorer = scorer_community_with_weighted_scorer.get_scorer()
+        scorer.weights["Ens"] = 10
+        scorer.save()
+        # The command would reset the weights to the defaults, the rescore is called directly
+        recalculate_scores(Community.objects.all(), 1000, sys.stdout)
+        captured = capsys.readouterr()
+        assert "Changed: 1" in captured.out
+        assert "Unchanged: 2" in captured.out
+        assert (
+            Event.objects.filter(action=Event.Action.SCORE_UPDATE).count()
+            == num_events + 1
+        )
+        s3 = Score.objects.get(passport=weighted_scorer_passports[2])
+        assert s3.score == 12
+        assert s3.last_score_timestamp > timestamps[weighted_scorer_passports[2].id]
+
+    def test_changed_providers(self):
+        assert get_changed_providers(
+            {"Google": "1", "Ens": 1, "Twitter": 2},
+            {"Google": "1.0", "Ens": "2", "Discord": "1"},
+        ) == {"Ens", "Twitter", "Discord"}
+        assert get_changed_providers({"Google": 1}, {"Google": "1"}) == set()
+
+    def test_rescoring_only_changed_providers(
+        self,
+        weighted_scorer_passports,
+        binary_weighted_scorer_passports,
+        scorer_community_with_weighted_scorer,
+        scorer_community_with_binary_scorer,
+        capsys,
+    ):
+        """Test that only the passports holding stamps from providers with changed weights are rescored"""
+        call_command("recalculate_scores")
+        capsys.readouterr()
+
+        with override_settings(GITCOIN_PASSPORT_WEIGHTS=changed_ens_weights):
+            assert get_changed_providers_by_community(
+                Community.objects.all(), previous_weights=previous_weights
+            ) == {
+                scorer_community_with_weighted_scorer.pk: {"Ens"},
+                scorer_community_with_binary_scorer.pk: {"Ens"},
+            }
+            call_command(
+                "recalculate_scores",
+                only_changed_providers=True,
+                previous_weights=json.dumps(previous_weights),
+            )
+            captured = capsys.readouterr()
+
+        assert "Changed providers: ['Ens']" in captured.out
+        # Only the passport with the Ens stamp is rescored, in each community
+        assert RescoreRequest.objects.latest("id").num_passports_processed == 2
+        assert Score.objects.get(passport=weighted_scorer_passports[2]).score == 12
+        assert Score.objects.get(passport=weighted_scorer_passports[1]).score == 2
+        assert (
+            Score.objects.get(passport=binary_weighted_scorer_passports[2]).evidence[
+                "rawScore"
+            ]
+            == "12"
+        )
+
+    def test_rescoring_only_changed_providers_rerun(
+        self,
+        weighted_scorer_passports,
+        binary_weighted_scorer_passports,
+        scorer_community_with_weighted_scorer,
+        scorer_community_with_binary_scorer,
+    ):
+        """
+        Test that a rerun (for example after a partial failure) and every shard rescore the changed
+        providers, although the weights of the scorers have already been updated
+        """
+        call_command("recalculate_scores")
+
+        with override_settings(GITCOIN_PASSPORT_WEIGHTS=changed_ens_weights):
+            # The first run fails after the weights have been updated
+            with mock.patch(
+                "registry.management.commands.recalculate_scores.rescore_passport_range",
+                side_effect=Exception("failed"),
+            ):
+                with pytest.raises(Exception):
+                    call_command(
+                        "recalculate_scores",
+                        only_changed_providers=True,
+                        previous_weights=json.dumps(previous_weights),
+                    )
+            assert RescoreRequest.objects.latest("id").status == (
+                RescoreRequest.Status.FAILED
+            )
+
+            num_passports_processed = 0
+            for shard in range(2):
+                call_command(
+                    "recalculate_scores",
+                    only_changed_providers=True,
+                    previous_weights=json.dumps(previous_weights),
+                    shard=f"{shard}/2",
+                )
+                num_passports_processed += RescoreRequest.objects.latest(
+                    "id"
+                ).num_passports_processed
+
+        # Only the passport with the Ens stamp is rescored, in each community
+        assert num_passports_processed == 2
+        assert Score.objects.get(passport=weighted_scorer_passports[2]).score == 12
+        assert (
+            Score.objects.get(passport=binary_weighted_scorer_passports[2]).evidence[
+                "rawScore"
+            ]
+            == "12"
+        )
+
+    def test_only_changed_providers_requires_previous_weights(self):
+        with pytest.raises(CommandError):
+            call_command("recalculate_scores", only_changed_providers=True)
+
+    def test_changed_threshold_rescores_all_passports(
+        self, binary_weighted_scorer_passports, scorer_community_with_binary_scorer
+    ):
+        with override_settings(GITCOIN_PASSPORT_THRESHOLD=2):
+            assert get_changed_providers_by_community(Community.objects.all()) == {
+                scorer_community_with_binary_scorer.pk: None
+            }
+            call_command(
+                "recalculate_scores",
+                only_changed_providers=True,
+                previous_weights=json.dumps(previous_weights),
+            )
+
+            assert RescoreRequest.objects.latest("id").num_passports_processed == 3
+
+            # Once the threshold has been updated, it is only known from the previous threshold
+            assert get_changed_providers_by_community(
+                Community.objects.all(),
+                previous_weights=previous_weights,
+                previous_threshold="75",
+            ) == {scorer_community_with_binary_scorer.pk: None}
+
+    def test_rescoring_from_stamp_scores(
+        self,
+        weighted_scorer_passports,
+        scorer_community_with_weighted_scorer,
+    ):
+        """Test that the scores are recalculated from the stored stamp_scores, without reading the stamps"""
+        call_command("recalculate_scores")
+
+        scorer = scorer_community_with_weighted_scorer.get_scorer()
+        scorer.weights["Ens"] = 10
+        scorer.save()
+
+        with CaptureQueriesContext(connection) as queries:
+            recalculate_scores(
+                Community.objects.all(), 1000, sys.stdout, from_stamp_scores=True
+            )
+
+        assert not [q for q in queries.captured_queries if "registry_stamp" in q["sql"]]
+        assert [
+            s.score
+            for s in Score.objects.filter(
+                passport__in=weighted_scorer_passports
+            ).order_by("passport_id")
+        ] == [1, 2, 12]
+
+    def test_rescoring_from_stamp_scores_falls_back_to_stamps(
+        self,
+        weighted_scorer_passports,
+        scorer_community_with_weighted_scorer,
+    ):
+        """Test that the stamps are loaded for passports without stamp_scores"""
+        call_command("recalculate_scores")
+        Score.objects.filter(passport=weighted_scorer_passports[2]).update(
+            stamp_scores=None
+        )
+        Score.objects.filter(passport=weighted_scorer_passports[1]).delete()
+
+        scorer = scorer_community_with_weighted_scorer.get_scorer()
+        scorer.weights["Ens"] = 10
+        scorer.save()
+
+        recalculate_scores(
+            Community.objects.all(), 1000, sys.stdout, from_stamp_scores=True
+        )
+
+        s2 = Score.objects.get(passport=weighted_scorer_passports[1])
+        assert s2.score == 2
+        assert set(s2.stamp_scores) == {"FirstEthTxnProvider", "Google"}
+        s3 = Score.objects.get(passport=weighted_scorer_passports[2])
+        assert s3.score == 12
+        assert set(s3.stamp_scores) == {"FirstEthTxnProvider", "Google", "Ens"}
+
+    def test_rescoring_with_deduplication(
+        self,
+        passport_holder_addresses,
+        scorer_community_with_weighted_scorer,
+    ):
+        """Test that the stamps of a batch are deduplicated together, in the order of the passports"""
+        community = scorer_community_with_weighted_scorer
+        credential = {"expirationDate": "2099-02-21T15:30:51.720Z"}
+        first_passport = Passport.objects.create(
+            address=passport_holder_addresses[0]["address"], community=community
+        )
+        Stamp.objects.create(
+            passport=first_passport,
+            provider="Google",
+            hash="0xshared",
+            credential=credential,
+        )
+        second_passport = Passport.objects.create(
+            address=passport_holder_addresses[1]["address"], community=community
+        )
+        Stamp.objects.create(
+            passport=second_passport,
+            provider="Google",
+            hash="0xshared",
+            credential=credential,
+        )
+        Stamp.objects.create(
+            passport=second_passport,
+            provider="Ens",
+            hash="0xown",
+            credential=credential,
+        )
+
+        call_command("recalculate_scores", deduplicate=True)
+
+        assert list(
+            Stamp.objects.filter(passport=second_passport).values_list(
+                "hash", flat=True
+            )
+        ) == ["0xown"]
+        assert Score.objects.get(passport=first_passport).score == 1
+        assert Score.objects.get(passport=second_passport).score == 1
+        assert set(
+            HashScorerLink.objects.filter(community=community).values_list(
+                "hash", "address"
+            )
+        ) == {
+            ("0xshared", first_passport.address),
+            ("0xown", second_passport.address),
+        }
+        assert list(
+            Event.objects.filter(action=Event.Action.LIFO_DEDUPLICATION).values_list(
+                "address", flat=True
+            )
+        ) == [second_passport.address]
+
+    def test_deduplicate_can_not_be_combined_with_stamp_scores(self):
+        with pytest.raises(CommandError):
+            call_command("recalculate_scores", deduplicate=True, from_stamp_scores=True)
@@ -1,13 +1,22 @@
 import datetime
+from unittest.mock import patch
 
 import pytest
 from account.models import Account, AccountAPIKey, Community
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Group
+from django.core.cache import cache
+from asgiref.sync import async_to_sync
 from django.test import Client
-from registry.api.v1 import get_scorer_by_id
+from registry.api.schema import SubmitPassportPayload
+from registry.api.v1 import ahandle_submit_passport, get_scorer_by_id
 from registry.models import Passport, Score
+from registry.score_cache import (
+    SCORE_NOT_FOUND,
+    get_cached_score,
+    invalidate_cached_scores,
+)
 from web3 import Web3
 
 User = get_user_model()
@@ -440,3 +449,180 @@ class TestPassportGetScore:
         )
         assert response.status_code == 200
         assert len(response.json()["items"]) == len(newer_scores)
+
+
+@pytest.fixture
+def local_memory_cache(settings):
+    settings.CACHES = {
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+    }
+    cache.clear()
+    yield
+    cache.clear()
+
+
+class TestPassportGetScoreCache:
+    base_url = "/registry"
+
+    def test_get_single_score_is_cached(
+        self,
+        scorer_api_key,
+        passport_holder_addresses,
+        scorer_community,
+        paginated_scores,
+        local_memory_cache,
+    ):
+        address = passport_holder_addresses[0]["address"].lower()
+        client = Client()
+
+        response = client.get(
+            f"{self.base_url}/score/{scorer_community.id}/{address}",
+            HTTP_AUTHORIZATION="Token " + scorer_api_key,
+        )
+        assert response.status_code == 200
+        assert response.json()["score"] == "1.000000000"
+
+        # Updates that bypass the scoring path are not seen until the cache is invalidated
+        Score.objects.filter(passport__address=address).update(score="2")
+        response = client.get(
+            f"{self.base_url}/score/{scorer_community.id}/{address}",
+            HTTP_AUTHORIZATION="Token " + scorer_api_key,
+        )
+        assert response.status_code == 200
+        assert response.json()["score"] == "1.000000000"
+
+        invalidate_cached_scores(scorer_community.id, [address])
+        response = client.get(
+            f"{self.base_url}/score/{scorer_community.id}/{address}",
+            HTTP_AUTHORIZATION="Token " + scorer_api_key,
+        )
+        assert response.status_code == 200
+        assert response.json()["score"] == "2.000000000"
+
+    def test_cached_score_is_invalidated_when_the_passport_is_submitted(
+        self,
+        scorer_api_key,
+        scorer_account,
+        passport_holder_addresses,
+        scorer_community,
+        paginated_scores,
+        local_memory_cache,
+    ):
+        address = passport_holder_addresses[0]["address"].lower()
+        client = Client()
+
+        response = client.get(
+            f"{self.base_url}/score/{scorer_community.id}/{address}",
+            HTTP_AUTHORIZATION="Token " + scorer_api_key,
+        )
+        assert response.json()["score"] == "1.000000000"
+
+        cached_scores_while_scoring = []
+
+        async def mock_ascore_passport(
+            community, passport, address, score, passport_data=None
+        ):
+            cached_scores_while_scoring.append(
+                get_cached_score(scorer_community.id, address)
+            )
+            score.score = 2
+            score.status = Score.Status.DONE
+
+        payload = SubmitPassportPayload(
+            address=address, community=str(scorer_community.id)
+        )
+        with patch("registry.api.v1.ascore_passport", side_effect=mock_ascore_passport):
+            async_to_sync(ahandle_submit_passport)(payload, scorer_account)
+
+        assert cached_scores_while_scoring == [None]
+
+        # The cached score has the same format as the score read from the DB
+        response = client.get(
+            f"{self.base_url}/score/{scorer_community.id}/{address}",
+            HTTP_AUTHORIZATION="Token " + scorer_api_key,
+        )
+        assert response.json()["score"] == "2.000000000"
+
+    def test_cached_community_is_invalidated_when_the_community_is_moved(
+        self,
+        scorer_api_key,
+        passport_holder_addresses,
+        scorer_community,
+        paginated_scores,
+        local_memory_cache,
+    ):
+        address = passport_holder_addresses[0]["address"].lower()
+        client = Client()
+
+        response = client.get(
+            f"{self.base_url}/score/{scorer_community.id}/{address}",
+            HTTP_AUTHORIZATION="Token " + scorer_api_key,
+        )
+        assert response.status_code == 200
+
+        user = User.objects.create_user(username="anoter-test-user", password="12345")
+        web3_account = web3.eth.account.from_mnemonic(
+            my_mnemonic, account_path="m/44'/60'/0'/0/0"
+        )
+        other_account = Account.objects.create(user=user, address=web3_account.address)
+
+        community = Community.objects.get(pk=scorer_community.id)
+        community.account = other_account
+        community.save()
+
+        response = client.get(
+            f"{self.base_url}/score/{scorer_community.id}/{address}",
+            HTTP_AUTHORIZATION="Token " + scorer_api_key,
+        )
+        assert response.status_code == 404
+
+    def test_get_single_score_not_found_is_cached(
+        self,
+        scorer_api_key,
+        passport_holder_addresses,
+        scorer_community,
+        local_memory_cache,
+    ):
+        address = passport_holder_addresses[0]["address"].lower()
+        client = Client()
+
+        response = client.get(
+            f"{self.base_url}/score/{scorer_community.id}/{address}",
+            HTTP_AUTHORIZATION="Token " + scorer_api_key,
+        )
+        assert response.status_code == 400
+        assert get_cached_score(scorer_community.id, address) == SCORE_NOT_FOUND
+
+        passport = Passport.objects.create(address=address, community=scorer_community)
+        Score.objects.create(passport=passport, status="DONE", score="1")
+
+        response = client.get(
+            f"{self.base_url}/score/{scorer_community.id}/{address}",
+            HTTP_AUTHORIZATION="Token " + scorer_api_key,
+        )
+        assert response.status_code == 400
+
+        invalidate_cached_scores(scorer_community.id, [address])
+        response = client.get(
+            f"{self.base_url}/score/{scorer_community.id}/{address}",
+            HTTP_AUTHORIZATION="Token " + scorer_api_key,
+        )
+        assert response.status_code == 200
+
+    def test_get_single_score_not_found_is_not_cached_if_disabled(
+        self,
+        settings,
+        scorer_api_key,
+        passport_holder_addresses,
+        scorer_community,
+        local_memory_cache,
+    ):
+        settings.SCORE_NOT_FOUND_CACHE_TTL = 0
+        address = passport_holder_addresses[0]["address"].lower()
+
+        response = Client().get(
+            f"{self.base_url}/score/{scorer_community.id}/{address}",
+            HTTP_AUTHORIZATION="Token " + scorer_api_key,
+        )
+        assert response.status_code == 400
+        assert get_cached_score(scorer_community.id, address) is None
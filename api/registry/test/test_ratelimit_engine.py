@@ -0,0 +1,208 @@
+from unittest.mock import patch
+
+import pytest
+from registry.ratelimit import RateLimiter, is_ratelimited, parse_rate
+from registry.test.fake_redis import FakeRedis
+
+
+@pytest.fixture
+def ratelimit_settings(settings):
+    settings.RATELIMIT_ENABLE = True
+    settings.RATELIMIT_FAIL_OPEN = True
+    settings.RATELIMIT_SYNC_EVERY = 50
+    settings.RATELIMIT_SYNC_INTERVAL_MS = 1000
+    return settings
+
+
+@pytest.mark.parametrize(
+    "rate,expected",
+    [
+        ("125/15m", (125, 900)),
+        ("3/30seconds", (3, 30)),
+        ("10/s", (10, 1)),
+        ("2000/h", (2000, 3600)),
+        ("5/2d", (5, 2 * 86400)),
+    ],
+)
+def test_parse_rate(rate, expected):
+    assert parse_rate(rate) == expected
+
+
+def test_parse_invalid_rate():
+    with pytest.raises(ValueError):
+        parse_rate("many")
+
+
+def test_requests_far_from_limit_are_synced_in_batches(ratelimit_settings):
+    fake_redis = FakeRedis()
+    limiter = RateLimiter(fake_redis)
+    now = 1000 * 900.0
+
+    for i in range(200):
+        assert not limiter.is_ratelimited("key", "2000/15m", now=now + i * 0.001)
+
+    # The first request and then every 50 requests, the last 49 requests are still pending
+    assert fake_redis.num_script_calls == 4
+    assert fake_redis.data["ratelimit:key:900:1000"] == 151
+
+
+def test_requests_are_synced_after_the_interval(ratelimit_settings):
+    fake_redis = FakeRedis()
+    limiter = RateLimiter(fake_redis)
+    now = 1000 * 900.0
+
+    limiter.is_ratelimited("key", "2000/15m", now=now)
+    limiter.is_ratelimited("key", "2000/15m", now=now + 0.5)
+    assert fake_redis.num_script_calls == 1
+
+    limiter.is_ratelimited("key", "2000/15m", now=now + 1.5)
+    assert fake_redis.num_script_calls == 2
+    assert fake_redis.data["ratelimit:key:900:1000"] == 3
+
+
+def test_limit_is_exact_near_the_limit(ratelimit_settings):
+    fake_redis = FakeRedis()
+    limiter = RateLimiter(fake_redis)
+    now = 1000 * 900.0
+
+    results = [
+        limiter.is_ratelimited("key", "125/15m", now=now + i * 0.001)
+        for i in range(130)
+    ]
+
+    assert results == [False] * 125 + [True] * 5
+
+
+def test_limit_is_shared_between_processes(ratelimit_settings):
+    fake_redis = FakeRedis()
+    limiters = [RateLimiter(fake_redis), RateLimiter(fake_redis)]
+    now = 1000 * 30.0
+
+    for i in range(3):
+        assert not limiters[i % 2].is_ratelimited("key", "3/30s", now=now + i)
+
+    assert limiters[1].is_ratelimited("key", "3/30s", now=now + 3)
+    assert limiters[0].is_ratelimited("key", "3/30s", now=now + 4)
+
+
+def test_limit_slides_with_the_window(ratelimit_settings):
+    fake_redis = FakeRedis()
+    limiter = RateLimiter(fake_redis)
+    window_start = 1000 * 30.0
+
+    for i in range(3):
+        assert not limiter.is_ratelimited("key", "3/30s", now=window_start + 20 + i)
+    assert limiter.is_ratelimited("key", "3/30s", now=window_start + 25)
+
+    # At the start of the next window, the previous window still counts almost fully
+    assert limiter.is_ratelimited("key", "3/30s", now=window_start + 31)
+
+    # Two windows later, the requests have expired
+    assert not limiter.is_ratelimited("key", "3/30s", now=window_start + 61)
+
+
+def test_pending_requests_are_synced_to_their_window_when_it_ends(
+    ratelimit_settings,
+):
+    fake_redis = FakeRedis()
+    limiters = [RateLimiter(fake_redis), RateLimiter(fake_redis)]
+    window_start = 1000 * 900.0
+
+    for i in range(10):
+        limiters[0].is_ratelimited("key", "2000/15m", now=window_start + 899 + i * 0.01)
+    assert fake_redis.data["ratelimit:key:900:1000"] == 1
+
+    # The first request of the next window syncs the pending requests to the window that ended
+    limiters[0].is_ratelimited("key", "2000/15m", now=window_start + 900)
+    assert fake_redis.data["ratelimit:key:900:1000"] == 10
+    assert fake_redis.data["ratelimit:key:900:1001"] == 1
+
+    # And they are counted by the other processes
+    limit = "20/15m"
+    for i in range(9):
+        assert not limiters[1].is_ratelimited("key", limit, now=window_start + 901 + i)
+    assert limiters[1].is_ratelimited("key", limit, now=window_start + 910)
+
+
+def test_keys_are_limited_separately(ratelimit_settings):
+    limiter = RateLimiter(FakeRedis())
+    now = 1000 * 30.0
+
+    for i in range(3):
+        limiter.is_ratelimited("key-1", "3/30s", now=now + i)
+
+    assert limiter.is_ratelimited("key-1", "3/30s", now=now + 3)
+    assert not limiter.is_ratelimited("key-2", "3/30s", now=now + 3)
+
+
+def test_local_limit_is_applied_when_redis_fails(ratelimit_settings):
+    fake_redis = FakeRedis()
+    fake_redis.fail = True
+    limiter = RateLimiter(fake_redis)
+    now = 1000 * 30.0
+
+    results = [limiter.is_ratelimited("key", "3/30s", now=now + i) for i in range(4)]
+
+    assert results == [False, False, False, True]
+
+
+def test_all_requests_are_limited_when_redis_fails_and_not_fail_open(
+    ratelimit_settings,
+):
+    ratelimit_settings.RATELIMIT_FAIL_OPEN = False
+    fake_redis = FakeRedis()
+    fake_redis.fail = True
+    limiter = RateLimiter(fake_redis)
+
+    assert limiter.is_ratelimited("key", "3/30s", now=1000 * 30.0)
+
+
+def test_pending_requests_are_synced_after_redis_recovers(ratelimit_settings):
+    fake_redis = FakeRedis()
+    fake_redis.fail = True
+    limiter = RateLimiter(fake_redis)
+    now = 1000 * 900.0
+
+    limiter.is_ratelimited("key", "2000/15m", now=now)
+    limiter.is_ratelimited("key", "2000/15m", now=now + 0.1)
+
+    fake_redis.fail = False
+    limiter.is_ratelimited("key", "2000/15m", now=now + 1.1)
+
+    assert fake_redis.data["ratelimit:key:900:1000"] == 3
+
+
+def test_buckets_in_use_do_not_expire(ratelimit_settings):
+    ratelimit_settings.RATELIMIT_SYNC_INTERVAL_MS = 3600 * 1000
+    fake_redis = FakeRedis()
+    limiter = RateLimiter(fake_redis)
+    now = 1000 * 900.0
+    monotonic = 5000.0
+
+    with patch("scorer.local_cache.time.monotonic", side_effect=lambda: monotonic):
+        limiter.is_ratelimited("key", "2000/15m", now=now)
+        assert fake_redis.num_script_calls == 1
+
+        # Every request is within the TTL of the bucket (2 periods) of the previous one,
+        # but the requests span more than the TTL
+        for i in range(1, 51):
+            monotonic += 900 * 1.5
+            limiter.is_ratelimited("key", "2000/15m", now=now + i * 0.001)
+
+    # No pending request has been lost
+    assert fake_redis.num_script_calls == 2
+    assert fake_redis.data["ratelimit:key:900:1000"] == 51
+
+
+def test_is_ratelimited_disabled(settings, fake_ratelimit_redis):
+    settings.RATELIMIT_ENABLE = False
+
+    for _ in range(5):
+        assert not is_ratelimited("key", "3/30s")
+    assert fake_ratelimit_redis.num_script_calls == 0
+
+
+def test_is_ratelimited_unlimited(ratelimit_settings, fake_ratelimit_redis):
+    for _ in range(5):
+        assert not is_ratelimited("key", "")
+    assert fake_ratelimit_redis.num_script_calls == 0
@@ -1,5 +1,7 @@
+import asyncio
 import json
 import re
+from datetime import datetime, timezone
 from decimal import Decimal
 from unittest.mock import call, patch
 
@@ -7,10 +9,23 @@ from account.deduplication import Rules
 from account.models import Account, AccountAPIKey, Community
 from asgiref.sync import async_to_sync
 from django.conf import settings
+from django.core.cache import cache
 from django.contrib.auth import get_user_model
-from django.test import Client, TransactionTestCase
+from django.db import connection
+from django.test import Client, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from registry.api.v1 import ascore_submitted_passport
 from registry.api.v2 import SubmitPassportPayload, a_submit_passport, get_score
-from registry.models import Event, HashScorerLink, Passport, Score, Stamp
+from registry.atasks import asave_stamps, ascore_passport, avalidate_credentials
+from registry.models import (
+    Event,
+    HashScorerLink,
+    Passport,
+    Score,
+    ScoreEventBuffer,
+    Stamp,
+)
+from registry.score_cache import get_cached_score
 from registry.tasks import score_passport_passport, score_registry_passport
 from web3 import Web3
 
@@ -203,6 +218,84 @@ class TestScorePassportTestCase(TransactionTestCase):
                 assert len(gitcoin_stamps) == 1
                 assert gitcoin_stamps[0].hash == "0x45678"
 
+    def test_score_computed_from_saved_stamps_without_reloading(self):
+        """
+        Test that the score is computed from the stamps that have just been saved, without reading them back from the DB
+        """
+        with patch("registry.atasks.aget_passport", return_value=mock_passport_data):
+            with patch(
+                "registry.atasks.validate_credential", side_effect=mock_validate
+            ):
+                with patch(
+                    "scorer_weighted.computation.aload_providers_by_passport"
+                ) as mock_load:
+                    score_passport_passport(self.community.pk, self.account.address)
+
+                    mock_load.assert_not_called()
+
+        score = Score.objects.get(
+            passport__address=self.account.address.lower(),
+            passport__community_id=self.community.pk,
+        )
+        assert score.status == Score.Status.DONE
+        assert score.score == Decimal("3")
+        assert score.stamp_scores == {"Ens": 2.0, "Google": 1.0, "Gitcoin": 0.0}
+
+    @override_settings(
+        CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+    )
+    def test_scored_passport_is_written_to_score_cache(self):
+        cache.clear()
+        with patch("registry.atasks.aget_passport", return_value=mock_passport_data):
+            with patch(
+                "registry.atasks.validate_credential", side_effect=mock_validate
+            ):
+                score_passport_passport(self.community.pk, self.account.address)
+
+        cached_score = get_cached_score(self.community.pk, self.account.address)
+        assert cached_score["status"] == Score.Status.DONE
+        assert Decimal(cached_score["score"]) == Decimal("3")
+        assert cached_score["address"] == self.account.address.lower()
+        cache.clear()
+
+    def test_save_stamps_upserts_and_removes_stale_stamps_in_bulk(self):
+        passport, _ = Passport.objects.update_or_create(
+            address=self.account.address,
+            community_id=self.community.pk,
+        )
+        Stamp.objects.create(
+            hash="0x1234",
+            passport=passport,
+            provider="Gitcoin",
+            credential={},
+        )
+        Stamp.objects.create(
+            hash="0x88888",
+            passport=passport,
+            provider="Outdated",
+            credential={},
+        )
+
+        with CaptureQueriesContext(connection) as ctx:
+            async_to_sync(asave_stamps)(passport, mock_passport_data)
+
+        # 1 DELETE for the stale stamps and 1 INSERT ... ON CONFLICT for all stamps
+        statements = [
+            q["sql"].split(" ")[0]
+            for q in ctx.captured_queries
+            if q["sql"] not in ("BEGIN", "COMMIT")
+        ]
+        assert statements == ["DELETE", "INSERT"]
+
+        stamps = {s.hash: s for s in Stamp.objects.filter(passport=passport)}
+        assert len(stamps) == 3
+        assert "0x1234" not in stamps
+        assert stamps["0x88888"].provider == "Google"
+        assert (
+            stamps["0x88888"].credential
+            == mock_passport_data["stamps"][1]["credential"]
+        )
+
     def test_deduplication_of_scoring_tasks(self):
         """
         Test that when multiple tasks are scheduled for the same Passport, only one of them will execute the scoring calculation, and it will also reset the requires_calculation to False
@@ -372,14 +465,124 @@ class TestScorePassportTestCase(TransactionTestCase):
     def test_score_events(self):
         count = Event.objects.filter(action=Event.Action.SCORE_UPDATE).count()
 
-        Score.objects.create(
-            passport=Passport.objects.create(
-                address=self.account.address, community_id=self.community.pk
-            ),
-            score=1,
-            status="DONE",
+        with patch("registry.atasks.aget_passport", return_value=mock_passport_data):
+            with patch(
+                "registry.atasks.validate_credential", side_effect=mock_validate
+            ):
+                score_passport_passport(self.community.pk, self.account.address)
+
+        assert (
+            Event.objects.filter(action=Event.Action.SCORE_UPDATE).count() == count + 1
         )
+        event = Event.objects.filter(action=Event.Action.SCORE_UPDATE).latest("id")
+        assert event.address == self.account.address.lower()
+        assert event.community_id == self.community.pk
+        assert event.data == {"score": 3.0, "evidence": None}
+
+    def test_score_event_is_written_by_the_submission(self):
+        count = Event.objects.filter(action=Event.Action.SCORE_UPDATE).count()
+        passport = Passport.objects.create(
+            address=self.account.address.lower(), community_id=self.community.pk
+        )
+        score = Score.objects.create(passport=passport, status=Score.Status.PROCESSING)
+
+        with patch("registry.atasks.aget_passport", return_value=mock_passport_data):
+            with patch(
+                "registry.atasks.validate_credential", side_effect=mock_validate
+            ):
+                async_to_sync(ascore_passport)(
+                    self.community, passport, passport.address, score
+                )
+
+        # Saving the score does not record its history, the scoring paths do
+        assert score.status == Score.Status.DONE
+        score.save()
+        assert Event.objects.filter(action=Event.Action.SCORE_UPDATE).count() == count
+
+        with patch("registry.atasks.aget_passport", return_value=mock_passport_data):
+            with patch(
+                "registry.atasks.validate_credential", side_effect=mock_validate
+            ):
+                async_to_sync(ascore_submitted_passport)(
+                    self.community, self.account.address
+                )
 
         assert (
             Event.objects.filter(action=Event.Action.SCORE_UPDATE).count() == count + 1
         )
+        event = Event.objects.filter(action=Event.Action.SCORE_UPDATE).latest("id")
+        assert event.address == self.account.address.lower()
+        assert event.community_id == self.community.pk
+        assert event.data == {"score": 3.0, "evidence": None}
+
+    def test_score_event_buffer(self):
+        count = Event.objects.filter(action=Event.Action.SCORE_UPDATE).count()
+        passport = Passport.objects.create(
+            address=self.account.address, community_id=self.community.pk
+        )
+
+        score_events = ScoreEventBuffer()
+        score_events.add(
+            Score(passport=passport, score=1, status=Score.Status.DONE),
+            passport.address,
+            self.community.pk,
+        )
+        score_events.add(
+            Score(passport=passport, score=None, status=Score.Status.ERROR),
+            passport.address,
+            self.community.pk,
+        )
+        score_events.add(
+            Score(passport=passport, score=2, status=Score.Status.DONE),
+            passport.address,
+            self.community.pk,
+        )
+
+        # Nothing is written before the buffer is flushed, and only DONE scores are recorded
+        assert Event.objects.filter(action=Event.Action.SCORE_UPDATE).count() == count
+        assert len(score_events.flush()) == 2
+        assert (
+            Event.objects.filter(action=Event.Action.SCORE_UPDATE).count() == count + 2
+        )
+        assert score_events.flush() == []
+
+
+def test_credentials_are_verified_concurrently_and_in_order(settings):
+    settings.CREDENTIAL_VERIFICATION_CONCURRENCY = 2
+
+    running = 0
+    max_running = 0
+
+    async def mock_slow_validate(did, credential):
+        nonlocal running, max_running
+        running += 1
+        max_running = max(max_running, running)
+        # Let the earlier stamps finish last
+        delays = {"Ens": 0.03, "Google": 0.02, "Gitcoin": 0.01}
+        await asyncio.sleep(delays[credential["credentialSubject"]["provider"]])
+        running -= 1
+        return (
+            ["Stamp validation failed"]
+            if credential["credentialSubject"]["provider"] == "Google"
+            else []
+        )
+
+    passport = Passport(address=web3.eth.account.create().address)
+    with patch(
+        "registry.atasks.validate_credential", side_effect=mock_slow_validate
+    ) as mock_validate_credential:
+        validated_passport = async_to_sync(avalidate_credentials)(
+            passport, mock_passport_data
+        )
+
+    assert mock_validate_credential.call_count == 3
+    assert max_running == 2
+    assert [s["provider"] for s in validated_passport["stamps"]] == ["Ens", "Gitcoin"]
+    # The credentials are referenced, not copied
+    assert (
+        validated_passport["stamps"][0]["credential"]
+        is mock_passport_data["stamps"][0]["credential"]
+    )
+    assert validated_passport["stamps"][0]["expiration_date"] == datetime(
+        2099, 2, 6, 23, 22, 58, 848000, tzinfo=timezone.utc
+    )
@@ -0,0 +1,280 @@
+import asyncio
+import threading
+from unittest.mock import patch
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from registry.api.schema import SubmitPassportPayload
+from registry.api.v1 import ahandle_submit_passport, get_passport_data_digest
+from registry.models import Passport, Score
+from registry.single_flight import SingleFlight
+
+
+@pytest.fixture
+def local_memory_cache(settings):
+    settings.CACHES = {
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+    }
+    cache.clear()
+    yield
+    cache.clear()
+
+
+@pytest.fixture
+def shared_single_flight(settings, local_memory_cache):
+    settings.SINGLE_FLIGHT_SHARED = True
+    settings.SINGLE_FLIGHT_TIMEOUT = 5
+    settings.SINGLE_FLIGHT_POLL_INTERVAL_MS = 10
+
+
+class CountingCall:
+    def __init__(self, result="result", error=None, delay=0.05):
+        self.num_calls = 0
+        self.result = result
+        self.error = error
+        self.delay = delay
+
+    async def __call__(self):
+        self.num_calls += 1
+        num_call = self.num_calls
+        await asyncio.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return f"{self.result}-{num_call}"
+
+
+def test_concurrent_calls_are_coalesced():
+    async def run():
+        flights = SingleFlight("test")
+        call = CountingCall()
+
+        results = await asyncio.gather(*[flights.do("key", call) for _ in range(5)])
+
+        assert call.num_calls == 1
+        assert results == ["result-1"] * 5
+        assert len(flights) == 0
+
+    async_to_sync(run)()
+
+
+def test_calls_for_different_keys_are_not_coalesced():
+    async def run():
+        flights = SingleFlight("test")
+        call = CountingCall()
+
+        results = await asyncio.gather(
+            flights.do("key-1", call), flights.do("key-2", call)
+        )
+
+        assert call.num_calls == 2
+        assert sorted(results) == ["result-1", "result-2"]
+
+    async_to_sync(run)()
+
+
+def test_sequential_calls_are_not_coalesced():
+    async def run():
+        flights = SingleFlight("test")
+        call = CountingCall()
+
+        assert await flights.do("key", call) == "result-1"
+        assert await flights.do("key", call) == "result-2"
+
+    async_to_sync(run)()
+
+
+def test_exception_is_shared():
+    async def run():
+        flights = SingleFlight("test")
+        call = CountingCall(error=ValueError("Scoring failed"))
+
+        results = await asyncio.gather(
+            *[flights.do("key", call) for _ in range(3)], return_exceptions=True
+        )
+
+        assert call.num_calls == 1
+        assert all(isinstance(result, ValueError) for result in results)
+        assert len(flights) == 0
+
+    async_to_sync(run)()
+
+
+def test_waiting_call_runs_again_if_call_in_flight_is_cancelled():
+    async def run():
+        flights = SingleFlight("test")
+        call = CountingCall(delay=0.2)
+
+        leader = asyncio.ensure_future(flights.do("key", call))
+        await asyncio.sleep(0.01)
+        follower = asyncio.ensure_future(flights.do("key", call))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+
+        assert await follower == "result-2"
+        assert leader.cancelled()
+
+    async_to_sync(run)()
+
+
+def test_calls_are_coalesced_across_event_loops():
+    flights = SingleFlight("test")
+    call = CountingCall(delay=0.2)
+    results = []
+
+    def run():
+        results.append(async_to_sync(flights.do)("key", call))
+
+    threads = [threading.Thread(target=run) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert call.num_calls == 1
+    assert results == ["result-1"] * 3
+
+
+def test_result_is_shared_across_processes(shared_single_flight):
+    async def run():
+        flights = SingleFlight("test")
+        call = CountingCall()
+        lock_key = flights._get_lock_key(("community", "address"))
+
+        # Another process is running the call
+        await cache.aset(lock_key, "other-process")
+
+        async def finish_other_process():
+            await asyncio.sleep(0.05)
+            await cache.aset(f"{lock_key}:other-process", "result-of-other-process")
+            await cache.adelete(lock_key)
+
+        result, _ = await asyncio.gather(
+            flights.do(("community", "address"), call), finish_other_process()
+        )
+
+        assert result == "result-of-other-process"
+        assert call.num_calls == 0
+
+    async_to_sync(run)()
+
+
+def test_call_runs_if_other_process_fails(shared_single_flight):
+    async def run():
+        flights = SingleFlight("test")
+        call = CountingCall()
+        lock_key = flights._get_lock_key("key")
+
+        await cache.aset(lock_key, "other-process")
+
+        async def fail_other_process():
+            await asyncio.sleep(0.05)
+            await cache.adelete(lock_key)
+
+        result, _ = await asyncio.gather(flights.do("key", call), fail_other_process())
+
+        assert result == "result-1"
+        assert call.num_calls == 1
+
+    async_to_sync(run)()
+
+
+def test_shared_lock_is_released(shared_single_flight):
+    async def run():
+        flights = SingleFlight("test")
+        call = CountingCall()
+
+        assert await flights.do("key", call) == "result-1"
+
+        assert await cache.aget(flights._get_lock_key("key")) is None
+        assert await flights.do("key", call) == "result-2"
+
+    async_to_sync(run)()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_submissions_are_scored_once(scorer_account, scorer_community):
+    num_scorings = 0
+
+    async def mock_ascore_passport(
+        community, passport, address, score, passport_data=None
+    ):
+        nonlocal num_scorings
+        num_scorings += 1
+        await asyncio.sleep(0.1)
+        score.score = 1
+        score.status = Score.Status.DONE
+
+    payload = SubmitPassportPayload(
+        address="0x8E9C4a2A6bd44D2a8f4F1D6b84EbAD7Cd0b3aAaA",
+        community=str(scorer_community.pk),
+    )
+
+    async def submit_concurrently():
+        return await asyncio.gather(
+            *[ahandle_submit_passport(payload, scorer_account) for _ in range(3)]
+        )
+
+    with patch("registry.api.v1.ascore_passport", side_effect=mock_ascore_passport):
+        responses = async_to_sync(submit_concurrently)()
+
+    assert num_scorings == 1
+    assert [response.status for response in responses] == [Score.Status.DONE] * 3
+    assert Score.objects.filter(passport__community=scorer_community).count() == 1
+
+
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_submissions_with_the_same_stamps_are_scored_once(
+    scorer_account, scorer_community
+):
+    scored_passport_data = []
+
+    async def mock_ascore_passport(
+        community, passport, address, score, passport_data=None
+    ):
+        scored_passport_data.append(passport_data)
+        await asyncio.sleep(0.1)
+        score.score = 1
+        score.status = Score.Status.DONE
+
+    payload = SubmitPassportPayload(
+        address="0x8E9C4a2A6bd44D2a8f4F1D6b84EbAD7Cd0b3aAaA",
+        community=str(scorer_community.pk),
+    )
+    # The submissions that are not coalesced find the same passport and score
+    passport = Passport.objects.create(
+        address=payload.address.lower(), community=scorer_community
+    )
+    Score.objects.create(passport=passport, status=Score.Status.PROCESSING)
+    google = {"provider": "Google", "credential": {"credentialSubject": {"hash": "1"}}}
+    ens = {"provider": "Ens", "credential": {"credentialSubject": {"hash": "2"}}}
+
+    async def submit_concurrently():
+        return await asyncio.gather(
+            # The same stamps, in any order, share one scoring
+            ahandle_submit_passport(payload, scorer_account, {"stamps": [google, ens]}),
+            ahandle_submit_passport(payload, scorer_account, {"stamps": [ens, google]}),
+            # Other stamps are scored separately
+            ahandle_submit_passport(payload, scorer_account, {"stamps": [google]}),
+        )
+
+    with patch("registry.api.v1.ascore_passport", side_effect=mock_ascore_passport):
+        responses = async_to_sync(submit_concurrently)()
+
+    assert len(scored_passport_data) == 2
+    assert {"stamps": [google]} in scored_passport_data
+    assert [response.status for response in responses] == [Score.Status.DONE] * 3
+
+
+def test_passport_data_digest_does_not_depend_on_the_order_of_the_stamps():
+    google = {"provider": "Google", "credential": {"a": 1, "b": 2}}
+    ens = {"provider": "Ens", "credential": {"a": 3}}
+
+    assert get_passport_data_digest(
+        {"stamps": [google, ens]}
+    ) == get_passport_data_digest(
+        {"stamps": [ens, {"provider": "Google", "credential": {"b": 2, "a": 1}}]}
+    )
+    assert get_passport_data_digest({"stamps": [google]}) != get_passport_data_digest(
+        {"stamps": [google, ens]}
+    )
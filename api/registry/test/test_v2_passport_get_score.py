@@ -7,7 +7,7 @@ from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.test import Client
 from django.utils import timezone
-from registry.models import Event, Passport, Score
+from registry.models import Event, Passport, Score, ScoreEventBuffer
 from registry.test.test_passport_get_score import TestPassportGetScore
 from web3 import Web3
 
@@ -26,7 +26,7 @@ def paginated_scores(scorer_passport, passport_holder_addresses, scorer_communit
     last_score_timestamp - will be incresaing from first to last, with a time delta of 1 day
     """
     scores = []
-    events = []
+    events = ScoreEventBuffer()
     i = 0
     for holder in passport_holder_addresses:
         passport = Passport.objects.create(
@@ -40,9 +40,11 @@ def paginated_scores(scorer_passport, passport_holder_addresses, scorer_communit
             score="1",
             last_score_timestamp=timezone.now() + datetime.timedelta(days=i + 1),
         )
+        events.add(score, passport.address, scorer_community.pk)
 
         scores.append(score)
         i += 1
+    events.flush()
     return scores
 
 
@@ -0,0 +1,124 @@
+import json
+from datetime import datetime, timedelta, timezone
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from registry.utils import (
+    credential_verification_local_cache,
+    get_credential_verification_ttl,
+    get_utc_time,
+    parse_expiration_date,
+    validate_credential,
+)
+
+did = "did:pkh:eip155:1:0xd5fb0d93e4b1a4c67ae8b3e62d5b30edd2fb4ab9"
+
+
+def get_credential(expiration_date="2099-02-06T23:22:58.848Z"):
+    return {
+        "type": ["VerifiableCredential"],
+        "credentialSubject": {
+            "id": did,
+            "hash": "v0.0.0:1Vzw/OyM9CBUkVi/3mb+BiwFnHzsSRZhVH1gaQIyHvM=",
+            "provider": "Ens",
+        },
+        "expirationDate": expiration_date,
+        "proof": {"jws": "some-signature"},
+    }
+
+
+@pytest.fixture(autouse=True)
+def local_memory_cache(settings):
+    settings.CACHES = {
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+    }
+    cache.clear()
+    credential_verification_local_cache.clear()
+    yield
+    credential_verification_local_cache.clear()
+
+
+def mock_verify_credential(errors):
+    return AsyncMock(return_value=json.dumps({"errors": errors}))
+
+
+class TestValidateCredentialCache:
+    def test_verification_result_is_cached(self):
+        credential = get_credential()
+
+        with patch(
+            "registry.utils.didkit.verify_credential", mock_verify_credential([])
+        ) as verify_credential:
+            assert async_to_sync(validate_credential)(did, credential) == []
+            assert async_to_sync(validate_credential)(did, credential) == []
+
+        assert verify_credential.call_count == 1
+
+    def test_shared_cache_is_used_when_local_cache_misses(self):
+        credential = get_credential()
+
+        with patch(
+            "registry.utils.didkit.verify_credential",
+            mock_verify_credential(["invalid proof"]),
+        ) as verify_credential:
+            errors = async_to_sync(validate_credential)(did, credential)
+            credential_verification_local_cache.clear()
+            assert async_to_sync(validate_credential)(did, credential) == errors
+
+        assert errors == ["Stamp validation failed: ['invalid proof']"]
+        assert verify_credential.call_count == 1
+
+    def test_cache_is_keyed_by_did_and_credential(self):
+        credential = get_credential()
+        other_credential = get_credential()
+        other_credential["proof"]["jws"] = "another-signature"
+
+        with patch(
+            "registry.utils.didkit.verify_credential", mock_verify_credential([])
+        ) as verify_credential:
+            async_to_sync(validate_credential)(did, credential)
+            async_to_sync(validate_credential)(did, other_credential)
+            errors = async_to_sync(validate_credential)("did:other", credential)
+
+        assert verify_credential.call_count == 3
+        assert errors == ["Did mismatch"]
+
+    def test_expired_credential_is_not_cached(self):
+        credential = get_credential("2020-02-06T23:22:58Z")
+
+        with patch(
+            "registry.utils.didkit.verify_credential", mock_verify_credential([])
+        ) as verify_credential:
+            async_to_sync(validate_credential)(did, credential)
+            async_to_sync(validate_credential)(did, credential)
+
+        assert verify_credential.call_count == 2
+
+    def test_ttl_is_capped_at_expiration_date(self, settings):
+        settings.CREDENTIAL_VERIFICATION_CACHE_TTL = 3600
+        expiration_date = (get_utc_time() + timedelta(seconds=60)).isoformat()
+
+        assert (
+            0 < get_credential_verification_ttl(get_credential(expiration_date)) <= 60
+        )
+        assert get_credential_verification_ttl(get_credential()) == 3600
+        assert get_credential_verification_ttl({}) == 0
+
+
+class TestParseExpirationDate:
+    def test_parse_with_and_without_fractional_seconds(self):
+        assert parse_expiration_date("2023-02-06T23:22:58.848Z") == datetime(
+            2023, 2, 6, 23, 22, 58, 848000, tzinfo=timezone.utc
+        )
+        assert parse_expiration_date("2023-02-06T23:22:58Z") == datetime(
+            2023, 2, 6, 23, 22, 58, tzinfo=timezone.utc
+        )
+
+    def test_parse_without_offset_is_utc(self):
+        assert parse_expiration_date("2023-02-06T23:22:58").tzinfo == timezone.utc
+
+    def test_invalid_date_raises(self):
+        with pytest.raises(ValueError):
+            parse_expiration_date("not a date")
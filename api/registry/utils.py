@@ -1,4 +1,5 @@
 import base64
+import hashlib
 import json
 from datetime import datetime, timezone
 from functools import wraps
@@ -7,6 +8,7 @@ from urllib.parse import urlencode
 import api_logging as logging
 import didkit
 from django.conf import settings
+from django.core.cache import cache
 from django.db.models import Q
 from django.forms.models import model_to_dict
 from django.shortcuts import render
@@ -14,6 +16,7 @@ from django.urls import reverse_lazy
 from eth_account.messages import encode_defunct
 from registry.exceptions import NoRequiredPermissionsException
 from registry.models import Stamp
+from scorer.local_cache import LocalTTLCache
 from web3 import Web3
 
 log = logging.getLogger(__name__)
@@ -26,7 +29,71 @@ def index(request):
     return render(request, "registry/index.html", context)
 
 
+credential_verification_local_cache = LocalTTLCache(
+    maxsize=settings.CREDENTIAL_VERIFICATION_LOCAL_CACHE_SIZE
+)
+
+
+def get_credential_verification_cache_key(did, credential) -> str:
+    digest = hashlib.sha256(
+        f"{did}:{json.dumps(credential, sort_keys=True)}".encode("utf-8")
+    ).hexdigest()
+    return f"credential_verification:{digest}"
+
+
+def get_credential_verification_ttl(credential) -> int:
+    """
+    Returns for how many seconds the verification result for the credential may be cached:
+    CREDENTIAL_VERIFICATION_CACHE_TTL, but never beyond the expiration date of the credential
+    """
+    try:
+        expiration_date = parse_expiration_date(credential["expirationDate"])
+    except (KeyError, TypeError, ValueError):
+        return 0
+
+    seconds_to_expiration = (expiration_date - get_utc_time()).total_seconds()
+    return int(
+        max(0, min(settings.CREDENTIAL_VERIFICATION_CACHE_TTL, seconds_to_expiration))
+    )
+
+
 async def validate_credential(did, credential):
+    """
+    Validate the credential and return the list of errors.
+    The result is cached for the (did, credential) pair in a local LRU cache, backed by the django cache,
+    so that the expensive didkit verification only runs once for the same credential.
+    """
+    cache_key = get_credential_verification_cache_key(did, credential)
+
+    stamp_return_errors = credential_verification_local_cache.get(cache_key)
+    if stamp_return_errors is not None:
+        return list(stamp_return_errors)
+
+    try:
+        stamp_return_errors = await cache.aget(cache_key)
+    except Exception:
+        log.warning("Failed to read credential verification cache", exc_info=True)
+
+    ttl = get_credential_verification_ttl(credential)
+
+    if stamp_return_errors is None:
+        stamp_return_errors = await averify_credential(did, credential)
+        if ttl > 0:
+            try:
+                await cache.aset(cache_key, stamp_return_errors, ttl)
+            except Exception:
+                log.warning(
+                    "Failed to write credential verification cache", exc_info=True
+                )
+
+    credential_verification_local_cache.set(cache_key, tuple(stamp_return_errors), ttl)
+    return list(stamp_return_errors)
+
+
+async def averify_credential(did, credential):
+    """
+    Run all the checks and the didkit verification for the credential, without caching
+    """
     # pylint: disable=fixme
     stamp_return_errors = []
     credential_subject = credential.get("credentialSubject")
@@ -97,14 +164,33 @@ def verify_issuer(stamp: dict) -> bool:
     )
 
 
+def parse_expiration_date(expiration_date: str) -> datetime:
+    """
+    Parse the ISO 8601 `expirationDate` of a credential (for example "2023-02-06T23:22:58.848Z"
+    or "2023-02-06T23:22:58Z") into a timezone aware datetime. Timestamps without an offset are
+    considered to be UTC.
+    """
+    ret = datetime.fromisoformat(expiration_date)
+    if ret.tzinfo is None:
+        ret = ret.replace(tzinfo=timezone.utc)
+    return ret
+
+
+def get_stamp_expiration_date(stamp: dict) -> datetime:
+    """
+    Returns the expiration date of the stamp, parsed only once when the stamp enters the scoring pipeline
+    (see `avalidate_credentials`)
+    """
+    if "expiration_date" in stamp:
+        return stamp["expiration_date"]
+    return parse_expiration_date(stamp["credential"]["expirationDate"])
+
+
 def verify_expiration(passport) -> bool:
-    format = "%Y-%m-%dT%H:%M:%S.%fZ"
+    now = get_utc_time()
     stamps = passport["stamps"]
     for index in stamps:
-        if (
-            datetime.strptime(index["credential"]["expirationDate"], format)
-            < datetime.now()
-        ):
+        if get_stamp_expiration_date(index) < now:
             return False
     return True
 
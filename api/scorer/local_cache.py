@@ -0,0 +1,64 @@
+"""
+In-process caches, used in front of the shared (Django) cache for lookups on the hot paths
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+
+class LocalTTLCache:
+    """
+    A thread-safe, in-process LRU cache where each entry expires after its own TTL (in seconds).
+    When the cache is full, the least recently used entry is evicted.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(
+        self, key: Hashable, default: Any = None, ttl: Optional[float] = None
+    ) -> Any:
+        """
+        Return the value of the key, or default if it is missing or expired.
+        If `ttl` is given, the entry is kept for another `ttl` seconds from now.
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+
+            now = time.monotonic()
+            expires_at, value = entry
+            if expires_at <= now:
+                del self._data[key]
+                return default
+
+            if ttl is not None:
+                self._data[key] = (now + ttl, value)
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: float) -> None:
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
@@ -409,6 +409,17 @@ CERAMIC_CACHE_CONVERT_STAMP_TO_V2_URL = env(
     "CERAMIC_CACHE_CONVERT_STAMP_TO_V2_URL",
     default="http://localhost:8003/api/v0.0.0/convert",
 )
+# When enabled, the stamp updates of the ceramic cache API return the last known score and the
+# passport is rescored by a celery task, once for all the updates within CERAMIC_CACHE_RESCORE_DEBOUNCE_MS
+CERAMIC_CACHE_DEBOUNCE_RESCORE = env.bool(
+    "CERAMIC_CACHE_DEBOUNCE_RESCORE", default=False
+)
+CERAMIC_CACHE_RESCORE_DEBOUNCE_MS = env.int(
+    "CERAMIC_CACHE_RESCORE_DEBOUNCE_MS", default=2000
+)
+# Number of seconds the passport (the latest stamp of each provider) of an address is cached
+# (see reader.passport_reader.aget_passport)
+PASSPORT_SNAPSHOT_CACHE_TTL = env.int("PASSPORT_SNAPSHOT_CACHE_TTL", default=600)
 
 PASSPORT_PUBLIC_URL = env("PASSPORT_PUBLIC_URL", default="http://localhost:80")
 
@@ -1,5 +1,20 @@
 """ Specify any feature flags here """
+
 from .env import env
 
 RATELIMIT_FAIL_OPEN = True
 RATELIMIT_ENABLE = env.bool("RATELIMIT_ENABLE", default=False)
+
+# Redis that holds the shared request counters of the API keys
+RATELIMIT_REDIS_URL = env(
+    "RATELIMIT_REDIS_URL",
+    default=env("CELERY_BROKER_URL", default="redis://localhost:6379/0"),
+)
+# Timeout in seconds for the connection and the commands to RATELIMIT_REDIS_URL
+RATELIMIT_REDIS_TIMEOUT = env.float("RATELIMIT_REDIS_TIMEOUT", default=0.5)
+# Each process syncs its request counts to Redis every RATELIMIT_SYNC_EVERY requests
+# or RATELIMIT_SYNC_INTERVAL_MS milliseconds per key, and on every request close to the limit
+RATELIMIT_SYNC_EVERY = env.int("RATELIMIT_SYNC_EVERY", default=50)
+RATELIMIT_SYNC_INTERVAL_MS = env.int("RATELIMIT_SYNC_INTERVAL_MS", default=1000)
+# Max number of keys for which each process keeps its local request counts
+RATELIMIT_LOCAL_BUCKETS = env.int("RATELIMIT_LOCAL_BUCKETS", default=10000)
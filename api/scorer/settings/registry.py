@@ -1,3 +1,55 @@
 from .env import env
 
 REGISTRY_API_READ_DB = env("REGISTRY_API_READ_DB", default="default")
+
+# Maximum number of credentials of a passport that are verified concurrently
+CREDENTIAL_VERIFICATION_CONCURRENCY = env.int(
+    "CREDENTIAL_VERIFICATION_CONCURRENCY", default=8
+)
+
+# Number of seconds a credential verification result is cached (never beyond the expiration of the credential)
+CREDENTIAL_VERIFICATION_CACHE_TTL = env.int(
+    "CREDENTIAL_VERIFICATION_CACHE_TTL", default=60 * 60
+)
+# Max. number of credential verification results kept in the in-process cache
+CREDENTIAL_VERIFICATION_LOCAL_CACHE_SIZE = env.int(
+    "CREDENTIAL_VERIFICATION_LOCAL_CACHE_SIZE", default=10000
+)
+
+# Number of seconds a scorer (with its compiled weights) is kept in the in-process scorer cache
+SCORER_CACHE_TTL = env.int("SCORER_CACHE_TTL", default=60)
+# Max. number of scorers kept in the in-process scorer cache
+SCORER_CACHE_SIZE = env.int("SCORER_CACHE_SIZE", default=1000)
+
+# Number of seconds a score returned by the GET score endpoints is cached (see registry.score_cache)
+SCORE_CACHE_TTL = env.int("SCORE_CACHE_TTL", default=300)
+# Number of seconds an address without score is cached, 0 to disable
+SCORE_NOT_FOUND_CACHE_TTL = env.int("SCORE_NOT_FOUND_CACHE_TTL", default=5)
+# Number of seconds the community of an account and scorer id is cached for the GET score
+# endpoints (see account.community_cache)
+COMMUNITY_ID_CACHE_TTL = env.int("COMMUNITY_ID_CACHE_TTL", default=60)
+
+# Number of seconds an authenticated API key is cached (never beyond the expiry date of the key)
+API_KEY_CACHE_TTL = env.int("API_KEY_CACHE_TTL", default=60)
+
+# The API analytics records are queued and written in batches (see registry.api_analytics)
+# Max. number of queued records, further records are dropped
+API_ANALYTICS_QUEUE_SIZE = env.int("API_ANALYTICS_QUEUE_SIZE", default=10000)
+# The queue is flushed every API_ANALYTICS_FLUSH_SIZE records or API_ANALYTICS_FLUSH_INTERVAL_MS milliseconds
+API_ANALYTICS_FLUSH_SIZE = env.int("API_ANALYTICS_FLUSH_SIZE", default=100)
+API_ANALYTICS_FLUSH_INTERVAL_MS = env.int(
+    "API_ANALYTICS_FLUSH_INTERVAL_MS", default=1000
+)
+# Flush the queue from a background thread, otherwise it is flushed inline every API_ANALYTICS_FLUSH_SIZE
+# records and the process has to flush it explicitly (for example at the end of a lambda invocation)
+API_ANALYTICS_BACKGROUND_FLUSH = env.bool(
+    "API_ANALYTICS_BACKGROUND_FLUSH", default=True
+)
+
+# Concurrent passport submissions for the same address and community are coalesced within the process
+# (see registry.single_flight). With SINGLE_FLIGHT_SHARED they are also coalesced across processes,
+# using a lock and the result in the Django cache
+SINGLE_FLIGHT_SHARED = env.bool("SINGLE_FLIGHT_SHARED", default=False)
+# Number of seconds the lock is held at most, and for which the other processes wait for the result
+SINGLE_FLIGHT_TIMEOUT = env.int("SINGLE_FLIGHT_TIMEOUT", default=60)
+SINGLE_FLIGHT_POLL_INTERVAL_MS = env.int("SINGLE_FLIGHT_POLL_INTERVAL_MS", default=100)
@@ -1,6 +1,6 @@
-from datetime import datetime
+from collections import defaultdict
 from decimal import Decimal
-from typing import Dict, List
+from typing import Callable, Dict, Iterable, List, Optional
 
 import api_logging as logging
 from registry.models import Stamp
@@ -8,121 +8,177 @@ from scorer_weighted.models import WeightedScorer
 
 log = logging.getLogger(__name__)
 
+# A compiled weights table: provider -> weight
+WeightTable = Dict[str, Decimal]
+
+ZERO = Decimal(0)
+
+
+def compile_weights(weights: Optional[dict]) -> WeightTable:
+    """
+    Compile the `weights` JSON of a scorer into a provider -> Decimal lookup table.
+
+    This is done once per scoring call instead of once per stamp.
+    """
+    return {provider: Decimal(weight) for provider, weight in (weights or {}).items()}
+
+
+def get_weight_table(scorer: WeightedScorer) -> WeightTable:
+    """
+    Returns the compiled weights table of the scorer, reusing the one compiled when the scorer
+    was loaded in the scorer cache (see `aget_cached_scorer`)
+    """
+    weight_table = getattr(scorer, "weight_table", None)
+    if weight_table is None:
+        weight_table = compile_weights(scorer.weights)
+    return weight_table
+
+
+def score_providers(
+    weight_table: WeightTable,
+    providers: Iterable[str],
+    point_type: Callable = str,
+) -> dict:
+    """
+    Score the providers of a single passport against a compiled weights table.
+
+    Each provider is only counted once, duplicate providers earn 0 points.
+    The earned points are converted with `point_type` (`str` or `float`).
+    """
+    sum_of_weights: Decimal = ZERO
+    scored_providers = set()
+    earned_points = {}
+    for provider in providers:
+        if provider not in scored_providers:
+            weight = weight_table.get(provider, ZERO)
+            sum_of_weights += weight
+            scored_providers.add(provider)
+            earned_points[provider] = point_type(weight)
+        else:
+            earned_points[provider] = point_type(ZERO)
+
+    return {
+        "sum_of_weights": sum_of_weights,
+        "earned_points": earned_points,
+    }
+
+
+def score_passports(
+    weight_table: WeightTable,
+    passport_ids: List[int],
+    providers_by_passport: Dict[int, Iterable[str]],
+    point_type: Callable = str,
+) -> List[dict]:
+    """
+    Score a batch of passports. The result is returned in the order of `passport_ids`.
+    """
+    return [
+        score_providers(
+            weight_table, providers_by_passport.get(passport_id, []), point_type
+        )
+        for passport_id in passport_ids
+    ]
+
+
+def load_providers_by_passport(passport_ids: List[int]) -> Dict[int, List[str]]:
+    """
+    Load the providers of all stamps for the given passports in a single query.
+    Only the `passport_id` and `provider` columns are read.
+    """
+    providers_by_passport = defaultdict(list)
+    for passport_id, provider in Stamp.objects.filter(
+        passport_id__in=passport_ids
+    ).values_list("passport_id", "provider"):
+        providers_by_passport[passport_id].append(provider)
+    return providers_by_passport
+
+
+async def aload_providers_by_passport(
+    passport_ids: List[int],
+) -> Dict[int, List[str]]:
+    """
+    Async version of `load_providers_by_passport`
+    """
+    providers_by_passport = defaultdict(list)
+    async for passport_id, provider in Stamp.objects.filter(
+        passport_id__in=passport_ids
+    ).values_list("passport_id", "provider"):
+        providers_by_passport[passport_id].append(provider)
+    return providers_by_passport
+
 
 def calculate_weighted_score(
-    scorer: WeightedScorer, passport_ids: List[int]
+    scorer: WeightedScorer,
+    passport_ids: List[int],
+    providers_by_passport: Optional[Dict[int, List[str]]] = None,
 ) -> List[dict]:
     """
     Calculate the weighted score for the given list of passport IDs and a single scorer.
 
-    This function retrieves the weights for the scorer, filters the stamps associated
-    with each passport ID, and calculates the weighted score based on the weights of
-    the stamps. The weight of each stamp is determined by the scorer's weights dict.
+    This function compiles the weights for the scorer, loads the providers of the
+    stamps for all passport IDs in a single query, and calculates the weighted score
+    based on the weights of the stamps. The weight of each stamp is determined by the
+    scorer's weights dict.
 
     Args:
         scorer (WeightedScorer): The scorer to use for calculating the weighted score.
         passport_ids (List[int]): A list of passport IDs to calculate the weighted score for.
+        providers_by_passport (Dict[int, List[str]]): Optional, the stamp providers of each
+            passport if they are already known. When set, no stamps are loaded from the DB.
 
     Returns:
         A list of Decimal values representing the weighted scores for the given passport IDs.
     """
-    from registry.models import Stamp
-
-    ret: List[dict] = []
     log.debug(
         "calculate_weighted_score for scorer %s and passports %s", scorer, passport_ids
     )
-    weights = scorer.weights
-    for passport_id in passport_ids:
-        sum_of_weights: Decimal = Decimal(0)
-        scored_providers = []
-        earned_points = {}
-        for stamp in Stamp.objects.filter(passport_id=passport_id):
-            if stamp.provider not in scored_providers:
-                weight = Decimal(weights.get(stamp.provider, 0))
-                sum_of_weights += weight
-                scored_providers.append(stamp.provider)
-                earned_points[stamp.provider] = str(weight)
-            else:
-                earned_points[stamp.provider] = str(Decimal(0))
-        ret.append(
-            {
-                "sum_of_weights": sum_of_weights,
-                "earned_points": earned_points,
-            }
-        )
-    return ret
+    weight_table = compile_weights(scorer.weights)
+    if providers_by_passport is None:
+        providers_by_passport = load_providers_by_passport(passport_ids)
+
+    return score_passports(weight_table, passport_ids, providers_by_passport)
 
 
 def recalculate_weighted_score(
     scorer: WeightedScorer, passport_ids: List[int], stamps: Dict[int, List[Stamp]]
 ) -> List[dict]:
-    ret: List[dict] = []
-    weights = scorer.weights
-    for passport_id in passport_ids:
-        stamp_list = stamps.get(passport_id, [])
-        sum_of_weights: Decimal = Decimal(0)
-        scored_providers = []
-        earned_points = {}
-        for stamp in stamp_list:
-            if stamp.provider not in scored_providers:
-                weight = Decimal(weights.get(stamp.provider, 0))
-                sum_of_weights += weight
-                scored_providers.append(stamp.provider)
-                earned_points[stamp.provider] = str(weight)
-            else:
-                earned_points[stamp.provider] = str(Decimal(0))
-        ret.append(
-            {
-                "sum_of_weights": sum_of_weights,
-                "earned_points": earned_points,
-            }
-        )
-    return ret
+    weight_table = compile_weights(scorer.weights)
+    providers_by_passport = {
+        passport_id: [stamp.provider for stamp in stamp_list]
+        for passport_id, stamp_list in stamps.items()
+    }
+    return score_passports(weight_table, passport_ids, providers_by_passport)
 
 
 async def acalculate_weighted_score(
-    scorer: WeightedScorer, passport_ids: List[int]
+    scorer: WeightedScorer,
+    passport_ids: List[int],
+    providers_by_passport: Optional[Dict[int, List[str]]] = None,
 ) -> List[dict]:
     """
     Calculate the weighted score for the given list of passport IDs and a single scorer.
 
-    This function retrieves the weights for the scorer, filters the stamps associated
-    with each passport ID, and calculates the weighted score based on the weights of
-    the stamps. The weight of each stamp is determined by the scorer's weights dict.
+    This function compiles the weights for the scorer, loads the providers of the
+    stamps for all passport IDs in a single query, and calculates the weighted score
+    based on the weights of the stamps. The weight of each stamp is determined by the
+    scorer's weights dict.
 
     Args:
         scorer (WeightedScorer): The scorer to use for calculating the weighted score.
         passport_ids (List[int]): A list of passport IDs to calculate the weighted score for.
+        providers_by_passport (Dict[int, List[str]]): Optional, the stamp providers of each
+            passport if they are already known. When set, no stamps are loaded from the DB.
 
     Returns:
         A list of Decimal values representing the weighted scores for the given passport IDs.
     """
-    from registry.models import Stamp
-
-    ret: List[dict] = []
     log.debug(
         "calculate_weighted_score for scorer %s and passports %s", scorer, passport_ids
     )
-    weights = scorer.weights
-
-    for passport_id in passport_ids:
-        sum_of_weights: Decimal = Decimal(0)
-        scored_providers = []
-        earned_points = {}
-        async for stamp in Stamp.objects.filter(passport_id=passport_id):
-            if stamp.provider not in scored_providers:
-                weight = Decimal(weights.get(stamp.provider, 0))
-                sum_of_weights += weight
-                scored_providers.append(stamp.provider)
-                earned_points[stamp.provider] = float(weight)
-            else:
-                earned_points[stamp.provider] = float(Decimal(0))
-
-        ret.append(
-            {
-                "sum_of_weights": sum_of_weights,
-                "earned_points": earned_points,
-            }
-        )
-    return ret
+    weight_table = get_weight_table(scorer)
+    if providers_by_passport is None:
+        providers_by_passport = await aload_providers_by_passport(passport_ids)
+
+    return score_passports(
+        weight_table, passport_ids, providers_by_passport, point_type=float
+    )
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.6 on 2026-10-18 19:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("scorer_weighted", "0004_rescorerequest"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="rescorerequest",
+            name="num_passports_processed",
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -7,6 +7,7 @@ from typing import List, Optional, Union
 import api_logging as logging
 from django.conf import settings
 from django.db import models
+from scorer.local_cache import LocalTTLCache
 
 log = logging.getLogger(__name__)
 
@@ -86,6 +87,16 @@ class Scorer(models.Model):
         """Compute the score. This shall be overridden in child classes"""
         raise NotImplemented()
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        invalidate_cached_scorer(self.pk)
+
+    def delete(self, *args, **kwargs):
+        scorer_id = self.pk
+        ret = super().delete(*args, **kwargs)
+        invalidate_cached_scorer(scorer_id)
+        return ret
+
     def __str__(self):
         return f"Scorer #{self.id}, type='{self.type}'"
 
@@ -93,20 +104,31 @@ class Scorer(models.Model):
 class WeightedScorer(Scorer):
     weights = models.JSONField(default=get_default_weights, blank=True, null=True)
 
-    def compute_score(self, passport_ids) -> List[ScoreData]:
+    def to_score_data(self, raw_scores: List[dict]) -> List[ScoreData]:
         """
-        Compute the weighted score for the passports identified by `ids`
-        Note: the `ids` are not validated. The caller shall ensure that these are indeed proper IDs, from the correct community
+        Convert the raw results of the weighted scoring kernel into `ScoreData`
         """
-        from .computation import calculate_weighted_score
-
         return [
             ScoreData(
                 score=s["sum_of_weights"], evidence=None, points=s["earned_points"]
             )
-            for s in calculate_weighted_score(self, passport_ids)
+            for s in raw_scores
         ]
 
+    def compute_score(
+        self, passport_ids, providers_by_passport=None
+    ) -> List[ScoreData]:
+        """
+        Compute the weighted score for the passports identified by `ids`
+        Note: the `ids` are not validated. The caller shall ensure that these are indeed proper IDs, from the correct community
+        If `providers_by_passport` is set, the score is computed from these in-memory stamp providers and no stamps are read from the DB
+        """
+        from .computation import calculate_weighted_score
+
+        return self.to_score_data(
+            calculate_weighted_score(self, passport_ids, providers_by_passport)
+        )
+
     def recompute_score(self, passport_ids, stamps) -> List[ScoreData]:
         """
         Compute the weighted score for the passports identified by `ids`
@@ -114,27 +136,23 @@ class WeightedScorer(Scorer):
         """
         from .computation import recalculate_weighted_score
 
-        return [
-            ScoreData(
-                score=s["sum_of_weights"], evidence=None, points=s["earned_points"]
-            )
-            for s in recalculate_weighted_score(self, passport_ids, stamps)
-        ]
+        return self.to_score_data(
+            recalculate_weighted_score(self, passport_ids, stamps)
+        )
 
-    async def acompute_score(self, passport_ids) -> List[ScoreData]:
+    async def acompute_score(
+        self, passport_ids, providers_by_passport=None
+    ) -> List[ScoreData]:
         """
         Compute the weighted score for the passports identified by `ids`
         Note: the `ids` are not validated. The caller shall ensure that these are indeed proper IDs, from the correct community
+        If `providers_by_passport` is set, the score is computed from these in-memory stamp providers and no stamps are read from the DB
         """
         from .computation import acalculate_weighted_score
 
-        scores = await acalculate_weighted_score(self, passport_ids)
-        return [
-            ScoreData(
-                score=s["sum_of_weights"], evidence=None, points=s["earned_points"]
-            )
-            for s in scores
-        ]
+        return self.to_score_data(
+            await acalculate_weighted_score(self, passport_ids, providers_by_passport)
+        )
 
     def __str__(self):
         return f"WeightedScorer #{self.id}"
@@ -148,35 +166,43 @@ class BinaryWeightedScorer(Scorer):
         default=get_default_threshold,
     )
 
-    def compute_score(self, passport_ids) -> List[ScoreData]:
+    def to_score_data(self, raw_scores: List[dict]) -> List[ScoreData]:
         """
-        Compute the weighted score for the passports identified by `ids`
-        Note: the `ids` are not validated. The caller shall ensure that these are indeed proper IDs, from the correct community
+        Convert the raw results of the weighted scoring kernel into binary `ScoreData`,
+        by comparing the sum of weights against the threshold
         """
-        from .computation import calculate_weighted_score
-
-        rawScores = calculate_weighted_score(self, passport_ids)
-        binaryScores = [
-            Decimal(1) if s["sum_of_weights"] >= self.threshold else Decimal(0)
-            for s in rawScores
-        ]
-
-        return list(
-            map(
-                lambda rawScore, binaryScore: ScoreData(
-                    score=binaryScore,
+        threshold = Decimal(str(self.threshold))
+        ret = []
+        for raw_score in raw_scores:
+            raw_sum = Decimal(raw_score["sum_of_weights"])
+            success = raw_score["sum_of_weights"] >= self.threshold
+            ret.append(
+                ScoreData(
+                    score=Decimal(1) if success else Decimal(0),
                     evidence=[
                         ThresholdScoreEvidence(
-                            threshold=Decimal(str(self.threshold)),
-                            rawScore=Decimal(rawScore["sum_of_weights"]),
-                            success=bool(binaryScore),
+                            threshold=threshold,
+                            rawScore=raw_sum,
+                            success=success,
                         )
                     ],
-                    points=rawScore["earned_points"],
-                ),
-                rawScores,
-                binaryScores,
+                    points=raw_score["earned_points"],
+                )
             )
+        return ret
+
+    def compute_score(
+        self, passport_ids, providers_by_passport=None
+    ) -> List[ScoreData]:
+        """
+        Compute the weighted score for the passports identified by `ids`
+        Note: the `ids` are not validated. The caller shall ensure that these are indeed proper IDs, from the correct community
+        If `providers_by_passport` is set, the score is computed from these in-memory stamp providers and no stamps are read from the DB
+        """
+        from .computation import calculate_weighted_score
+
+        return self.to_score_data(
+            calculate_weighted_score(self, passport_ids, providers_by_passport)
         )
 
     def recompute_score(self, passport_ids, stamps) -> List[ScoreData]:
@@ -186,65 +212,74 @@ class BinaryWeightedScorer(Scorer):
         """
         from .computation import recalculate_weighted_score
 
-        rawScores = recalculate_weighted_score(self, passport_ids, stamps)
-        binaryScores = [
-            Decimal(1) if s["sum_of_weights"] >= self.threshold else Decimal(0)
-            for s in rawScores
-        ]
-
-        return list(
-            map(
-                lambda rawScore, binaryScore: ScoreData(
-                    score=binaryScore,
-                    evidence=[
-                        ThresholdScoreEvidence(
-                            threshold=Decimal(str(self.threshold)),
-                            rawScore=Decimal(rawScore["sum_of_weights"]),
-                            success=bool(binaryScore),
-                        )
-                    ],
-                    points=rawScore["earned_points"],
-                ),
-                rawScores,
-                binaryScores,
-            )
+        return self.to_score_data(
+            recalculate_weighted_score(self, passport_ids, stamps)
         )
 
-    async def acompute_score(self, passport_ids) -> List[ScoreData]:
+    async def acompute_score(
+        self, passport_ids, providers_by_passport=None
+    ) -> List[ScoreData]:
         """
         Compute the weighted score for the passports identified by `ids`
         Note: the `ids` are not validated. The caller shall ensure that these are indeed proper IDs, from the correct community
+        If `providers_by_passport` is set, the score is computed from these in-memory stamp providers and no stamps are read from the DB
         """
         from .computation import acalculate_weighted_score
 
-        rawScores = await acalculate_weighted_score(self, passport_ids)
-        binaryScores = [
-            Decimal(1) if s["sum_of_weights"] >= self.threshold else Decimal(0)
-            for s in rawScores
-        ]
-
-        return list(
-            map(
-                lambda rawScore, binaryScore: ScoreData(
-                    score=binaryScore,
-                    evidence=[
-                        ThresholdScoreEvidence(
-                            threshold=Decimal(str(self.threshold)),
-                            rawScore=Decimal(rawScore["sum_of_weights"]),
-                            success=bool(binaryScore),
-                        )
-                    ],
-                    points=rawScore["earned_points"],
-                ),
-                rawScores,
-                binaryScores,
-            )
+        return self.to_score_data(
+            await acalculate_weighted_score(self, passport_ids, providers_by_passport)
         )
 
     def __str__(self):
         return f"BinaryWeightedScorer #{self.id}, threshold='{self.threshold}'"
 
 
+# Process-local cache of the concrete scorer instances, by scorer id
+scorer_cache = LocalTTLCache(maxsize=settings.SCORER_CACHE_SIZE)
+
+
+def invalidate_cached_scorer(scorer_id: Optional[int] = None):
+    """
+    Remove the scorer from the cache, or all scorers if no `scorer_id` is given.
+    This must be called whenever scorers are changed with a queryset `update`,
+    which bypasses `Scorer.save`.
+    """
+    if scorer_id is None:
+        scorer_cache.clear()
+    else:
+        scorer_cache.delete(scorer_id)
+
+
+async def aget_cached_scorer(
+    scorer_id: int,
+) -> Union[WeightedScorer, BinaryWeightedScorer]:
+    """
+    Returns the concrete scorer (`WeightedScorer` or `BinaryWeightedScorer`) for the scorer id.
+    Raises `Scorer.DoesNotExist` if there is no such scorer.
+
+    The instance is cached for SCORER_CACHE_TTL seconds, together with its compiled weight table,
+    and shared between requests: it must not be modified by the caller.
+    """
+    from .computation import compile_weights
+
+    scorer = scorer_cache.get(scorer_id)
+    if scorer is None:
+        base_scorer = await Scorer.objects.aget(pk=scorer_id)
+        if base_scorer.type == Scorer.Type.WEIGHTED:
+            scorer = await WeightedScorer.objects.aget(scorer_ptr_id=scorer_id)
+        elif base_scorer.type == Scorer.Type.WEIGHTED_BINARY:
+            scorer = await BinaryWeightedScorer.objects.aget(scorer_ptr_id=scorer_id)
+        else:
+            raise Scorer.DoesNotExist(
+                f"Scorer {scorer_id} has an unsupported type '{base_scorer.type}'"
+            )
+
+        scorer.weight_table = compile_weights(scorer.weights)
+        scorer_cache.set(scorer_id, scorer, settings.SCORER_CACHE_TTL)
+
+    return scorer
+
+
 class RescoreRequest(models.Model):
     class Status(models.TextChoices):
         RUNNING = "RUNNING", "Running"
@@ -262,6 +297,7 @@ class RescoreRequest(models.Model):
 
     num_communities_requested = models.IntegerField(default=0)
     num_communities_processed = models.IntegerField(default=0)
+    num_passports_processed = models.IntegerField(default=0)
 
     def __str__(self):
         return f"RescoreRequest #{self.pk}, status='{self.status}', created_at='{self.created_at}'"
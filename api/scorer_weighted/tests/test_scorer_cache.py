@@ -0,0 +1,74 @@
+from decimal import Decimal
+from unittest.mock import patch
+
+import pytest
+from account.models import Community
+from asgiref.sync import async_to_sync
+from registry.management.commands.recalculate_scores import Command
+from scorer_weighted.models import BinaryWeightedScorer, Scorer, aget_cached_scorer
+
+pytestmark = pytest.mark.django_db
+
+
+def test_scorer_is_cached(scorer_community_with_binary_scorer):
+    community = Community.objects.get(pk=scorer_community_with_binary_scorer.pk)
+
+    scorer = async_to_sync(community.aget_scorer)()
+    assert isinstance(scorer, BinaryWeightedScorer)
+    assert scorer.weight_table == {
+        "FirstEthTxnProvider": Decimal(1),
+        "Google": Decimal(1),
+        "Ens": Decimal(1),
+    }
+
+    with patch("scorer_weighted.models.Scorer.objects.aget") as mock_aget:
+        assert async_to_sync(community.aget_scorer)() is scorer
+        mock_aget.assert_not_called()
+
+
+def test_cached_weight_table_is_used_for_scoring(scorer_community_with_binary_scorer):
+    scorer = async_to_sync(aget_cached_scorer)(
+        scorer_community_with_binary_scorer.scorer_id
+    )
+
+    with patch("scorer_weighted.computation.compile_weights") as mock_compile:
+        scores = async_to_sync(scorer.acompute_score)(
+            [1], {1: ["FirstEthTxnProvider", "Google"]}
+        )
+        mock_compile.assert_not_called()
+
+    assert scores[0].evidence[0].rawScore == Decimal(2)
+
+
+def test_cached_scorer_is_invalidated_on_save(scorer_community_with_binary_scorer):
+    scorer_id = scorer_community_with_binary_scorer.scorer_id
+    cached_scorer = async_to_sync(aget_cached_scorer)(scorer_id)
+
+    scorer = BinaryWeightedScorer.objects.get(pk=scorer_id)
+    scorer.weights = {"Google": 5}
+    scorer.save()
+
+    new_cached_scorer = async_to_sync(aget_cached_scorer)(scorer_id)
+    assert new_cached_scorer is not cached_scorer
+    assert new_cached_scorer.weight_table == {"Google": Decimal(5)}
+
+
+def test_cached_scorer_is_invalidated_on_update_scorers(
+    scorer_community_with_binary_scorer, settings
+):
+    scorer_id = scorer_community_with_binary_scorer.scorer_id
+    async_to_sync(aget_cached_scorer)(scorer_id)
+
+    settings.GITCOIN_PASSPORT_WEIGHTS = {"Google": 3}
+    Command().update_scorers(Community.objects.all())
+
+    assert async_to_sync(aget_cached_scorer)(scorer_id).weight_table == {
+        "Google": Decimal(3)
+    }
+
+
+def test_unsupported_scorer_type_raises():
+    scorer = Scorer.objects.create(type="UNSUPPORTED")
+
+    with pytest.raises(Scorer.DoesNotExist):
+        async_to_sync(aget_cached_scorer)(scorer.pk)
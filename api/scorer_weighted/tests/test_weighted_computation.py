@@ -0,0 +1,112 @@
+from decimal import Decimal
+
+import pytest
+from asgiref.sync import async_to_sync
+from registry.models import Passport, Stamp
+from scorer_weighted.computation import (
+    acalculate_weighted_score,
+    calculate_weighted_score,
+    compile_weights,
+    recalculate_weighted_score,
+    score_providers,
+)
+from scorer_weighted.models import WeightedScorer
+
+pytestmark = pytest.mark.django_db
+
+weights = {"FirstEthTxnProvider": "1.5", "Google": 2, "Ens": 0.5}
+
+
+@pytest.fixture(name="passports")
+def fixture_passports(passport_holder_addresses, scorer_community_with_binary_scorer):
+    passports = []
+    for idx, providers in enumerate(
+        [["FirstEthTxnProvider"], ["FirstEthTxnProvider", "Google", "Unknown"], []]
+    ):
+        passport = Passport.objects.create(
+            address=passport_holder_addresses[idx]["address"],
+            community=scorer_community_with_binary_scorer,
+        )
+        for provider in providers:
+            Stamp.objects.create(
+                passport=passport,
+                provider=provider,
+                hash=f"0x{idx}{provider}",
+                credential={},
+            )
+        passports.append(passport)
+    return passports
+
+
+class TestWeightedComputation:
+    def test_compile_weights(self):
+        assert compile_weights(weights) == {
+            "FirstEthTxnProvider": Decimal("1.5"),
+            "Google": Decimal(2),
+            "Ens": Decimal(0.5),
+        }
+        assert compile_weights(None) == {}
+
+    def test_duplicate_provider_counted_once(self):
+        result = score_providers(
+            compile_weights(weights), ["Google", "Ens", "Google"], point_type=float
+        )
+        assert result["sum_of_weights"] == Decimal("2.5")
+        assert result["earned_points"] == {"Google": 0.0, "Ens": 0.5}
+
+    def test_batch_is_returned_in_input_order(self, passports):
+        scorer = WeightedScorer.objects.create(weights=weights)
+        passport_ids = [p.id for p in reversed(passports)]
+
+        scores = calculate_weighted_score(scorer, passport_ids)
+
+        assert [s["sum_of_weights"] for s in scores] == [
+            Decimal(0),
+            Decimal("3.5"),
+            Decimal("1.5"),
+        ]
+        assert scores[1]["earned_points"] == {
+            "FirstEthTxnProvider": "1.5",
+            "Google": "2",
+            "Unknown": "0",
+        }
+
+    def test_calculate_and_recalculate_agree(self, passports):
+        scorer = WeightedScorer.objects.create(weights=weights)
+        passport_ids = [p.id for p in passports]
+        stamps = {}
+        for stamp in Stamp.objects.filter(passport_id__in=passport_ids):
+            stamps.setdefault(stamp.passport_id, []).append(stamp)
+
+        sync_scores = calculate_weighted_score(scorer, passport_ids)
+        recalculated_scores = recalculate_weighted_score(scorer, passport_ids, stamps)
+
+        assert sync_scores == recalculated_scores
+
+    def test_async_scores(self, passports):
+        scorer = WeightedScorer.objects.create(weights=weights)
+        passport_ids = [p.id for p in passports]
+
+        scores = async_to_sync(acalculate_weighted_score)(scorer, passport_ids)
+
+        assert [s["sum_of_weights"] for s in scores] == [
+            Decimal("1.5"),
+            Decimal("3.5"),
+            Decimal(0),
+        ]
+        assert scores[1]["earned_points"] == {
+            "FirstEthTxnProvider": 1.5,
+            "Google": 2.0,
+            "Unknown": 0.0,
+        }
+
+    def test_async_scores_use_a_single_query(
+        self, passports, django_assert_num_queries
+    ):
+        scorer = WeightedScorer.objects.create(weights=weights)
+        passport_ids = [p.id for p in passports]
+
+        with django_assert_num_queries(1):
+            scores = async_to_sync(acalculate_weighted_score)(scorer, passport_ids)
+
+        assert len(scores) == len(passport_ids)